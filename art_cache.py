@@ -0,0 +1,163 @@
+import hashlib
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+import urllib.request
+
+from utils import hidden_startupinfo
+
+DEFAULT_ART_CACHE = os.path.expanduser("~/SpotifyDownloader/art")
+DEFAULT_ART_CACHE_BYTES = 200 * 1024 * 1024
+JPEG_MAGIC = b"\xff\xd8\xff"
+
+
+def to_jpeg(ffmpeg_path, data):
+    """Convert image bytes (WebP, PNG, ...) to JPEG with ffmpeg; returns (jpeg bytes or None, error output)."""
+    if not ffmpeg_path:
+        return None, "ffmpeg is needed to convert the image to JPEG"
+    result = subprocess.run([ffmpeg_path, "-v", "error", "-nostdin", "-i", "-", "-frames:v", "1",
+                             "-c:v", "mjpeg", "-f", "image2pipe", "-"],
+                            input=data, capture_output=True, startupinfo=hidden_startupinfo())
+    if result.returncode != 0 or not result.stdout:
+        return None, result.stderr.decode('utf-8', 'replace')[-500:] or "image conversion failed"
+    return result.stdout, ""
+
+
+class ArtCache:
+    """On-disk cache of cover images, stored as JPEG so they can be embedded as they are.
+
+    Shared by every track and playlist folder: a cover is fetched (and, if it
+    isn't JPEG already, converted) once per URL, and images that are the same
+    under different URLs are stored once, under the hash of their bytes. Once
+    the images take more than `max_bytes`, the least recently used are
+    evicted. Concurrent requests for the same URL wait for a single fetch.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_ART_CACHE, max_bytes=DEFAULT_ART_CACHE_BYTES, ffmpeg_path=None, timeout=30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ffmpeg_path = ffmpeg_path
+        self.timeout = timeout
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._fetching = {}  # URL -> threading.Event set once its fetch is done
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "art_cache.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS images (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_images_last_used ON images (last_used);
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_urls_digest ON urls (digest);
+        """)
+        self._conn.commit()
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM images").fetchone()
+        self._total_bytes = total
+        self.hits = 0
+        self.fetched = 0
+        self.converted = 0
+
+    def _path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}.jpg")
+
+    def _lookup(self, url):
+        """Path of the cached image for `url`, marking it as used; None if it isn't cached."""
+        row = self._conn.execute("SELECT digest FROM urls WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        path = self._path(row[0])
+        if not os.path.exists(path):
+            # Deleted behind our back; forget it and fetch again
+            self._forget(row[0])
+            return None
+        self._conn.execute("UPDATE images SET last_used = ? WHERE digest = ?", (time.time(), row[0]))
+        self._conn.commit()
+        return path
+
+    def get(self, url):
+        """Return (path of the cached JPEG, error): fetched, converted and cached on first use of `url`."""
+        while True:
+            with self._lock:
+                path = self._lookup(url)
+                if path is not None:
+                    self.hits += 1
+                    return path, ""
+                pending = self._fetching.get(url)
+                if pending is None:
+                    pending = self._fetching[url] = threading.Event()
+                    break
+            # Another track of the same album is fetching it; use its result (or try again if it failed)
+            pending.wait()
+        try:
+            return self._fetch(url)
+        finally:
+            with self._lock:
+                del self._fetching[url]
+            pending.set()
+
+    def _fetch(self, url):
+        try:
+            with urllib.request.urlopen(url, timeout=self.timeout) as response:
+                data = response.read()
+        except (OSError, ValueError) as e:
+            return None, f"Could not fetch {url}: {e}"
+        if not data.startswith(JPEG_MAGIC):
+            data, error = to_jpeg(self.ffmpeg_path, data)
+            if data is None:
+                return None, f"Could not convert {url} to JPEG: {error}"
+            self.converted += 1
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        with self._lock:
+            self.fetched += 1
+            if self._conn.execute("SELECT 1 FROM images WHERE digest = ?", (digest,)).fetchone() is None:
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                self._conn.execute("INSERT INTO images VALUES (?, ?, ?)", (digest, len(data), time.time()))
+                self._total_bytes += len(data)
+            else:
+                self._conn.execute("UPDATE images SET last_used = ? WHERE digest = ?", (time.time(), digest))
+            self._conn.execute("INSERT OR REPLACE INTO urls VALUES (?, ?)", (url, digest))
+            if self._total_bytes > self.max_bytes:
+                self._evict(keep=digest)
+            self._conn.commit()
+        return path, ""
+
+    def _forget(self, digest):
+        (size,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM images WHERE digest = ?", (digest,)).fetchone()
+        self._conn.execute("DELETE FROM images WHERE digest = ?", (digest,))
+        self._conn.execute("DELETE FROM urls WHERE digest = ?", (digest,))
+        self._total_bytes -= size
+        try:
+            os.remove(self._path(digest))
+        except OSError:
+            pass
+
+    def _evict(self, keep):
+        """Remove the least recently used images until the rest fit in `max_bytes` (never `keep`, just added).
+
+        A track that got an image earlier may still be waiting to embed it; if it
+        was evicted in between, the encode falls back to no cover art.
+        """
+        rows = self._conn.execute("SELECT digest, size FROM images ORDER BY last_used").fetchall()
+        for digest, size in rows:
+            if self._total_bytes <= self.max_bytes:
+                break
+            if digest != keep:
+                self._forget(digest)
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,386 @@
+"""Ways of running yt-dlp: in this process (preferred) or as one subprocess per track."""
+import collections
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+
+from fragments import FetchCancelled, RangesNotSupported, content_length, fetch_ranges
+from utils import hidden_startupinfo
+
+
+# Metadata printed per search result by SubprocessBackend.search, one JSON object per line
+CANDIDATE_TEMPLATE = "%(.{id,title,duration,channel,uploader})j"
+CANDIDATE_FIELDS = ('id', 'title', 'duration', 'channel', 'uploader')
+
+# yt-dlp prints one line per progress update in this format (--newline --progress-template)
+PROGRESS_PREFIX = "[spdl-progress]"
+PROGRESS_TEMPLATE = (f"download:{PROGRESS_PREFIX} %(progress.downloaded_bytes)s %(progress.total_bytes)s "
+                     "%(progress.total_bytes_estimate)s %(progress.speed)s %(progress.eta)s")
+
+
+def parse_progress_line(line):
+    """Parse a PROGRESS_TEMPLATE line into (downloaded, total, speed, eta); None if it isn't one."""
+    if not line.startswith(PROGRESS_PREFIX):
+        return None
+    fields = line[len(PROGRESS_PREFIX):].split()
+    if len(fields) != 5:
+        return None
+
+    def number(value):
+        try:
+            return float(value)
+        except ValueError:  # "NA" when yt-dlp doesn't know the value
+            return None
+
+    downloaded, total, estimate, speed, eta = (number(value) for value in fields)
+    return downloaded, total or estimate, speed, eta
+
+
+THUMBNAIL_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+_INCOMPLETE_EXTENSIONS = ('.part', '.ytdl', '.temp')
+
+
+def find_download_outputs(output_template):
+    """Return (audio file, thumbnail file or None) that yt-dlp wrote for `output_template`.
+
+    The template must end in ".%(ext)s"; yt-dlp picks the extension, so the
+    folder is scanned for files with the template's name.
+    """
+    directory, name = os.path.split(output_template)
+    prefix = name[:-len("%(ext)s")]
+    audio = thumbnail = None
+    with os.scandir(directory or '.') as entries:
+        for entry in entries:
+            if not entry.name.startswith(prefix) or entry.name.endswith(_INCOMPLETE_EXTENSIONS):
+                continue
+            extension = entry.name[len(prefix) - 1:]
+            if '.' in extension[1:]:
+                continue  # e.g. "name.f251.webm" from a merge, not ours
+            if extension.lower() in THUMBNAIL_EXTENSIONS:
+                thumbnail = entry.path
+            else:
+                audio = entry.path
+    return audio, thumbnail
+
+
+def yt_dlp_module_available():
+    """True if the yt_dlp package can be imported (never the case in the frozen build)."""
+    if getattr(sys, 'frozen', False):
+        return False
+    try:
+        import yt_dlp # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class SubprocessBackend:
+    """Runs the yt-dlp executable once per track.
+
+    Only fetches the source audio (and thumbnail); converting it is left to
+    the transcode stage, so no CPU-heavy work happens in the network pool.
+    """
+
+    name = "subprocess"
+    aborts_stalled = True  # Cancelling a transfer kills the process, also while it waits for data
+
+    def __init__(self, yt_dlp_cmd, write_thumbnail=False):
+        self.yt_dlp_cmd = list(yt_dlp_cmd)
+        self.write_thumbnail = write_thumbnail
+
+    def build_command(self, target, output_template, connections=1, thumbnail=True):
+        cmd = list(self.yt_dlp_cmd)
+        if self.write_thumbnail and thumbnail:
+            cmd += ["--write-thumbnail"]
+        if connections > 1:
+            cmd += ["--concurrent-fragments", str(connections)]  # Only speeds up fragmented (DASH/HLS) formats
+        cmd += ["--default-search", "ytsearch",  # Enable YouTube search
+                "--format", "bestaudio/best",  # Get best audio quality
+                "--no-playlist",  # Don't download playlists
+                "--newline", "--progress-template", PROGRESS_TEMPLATE,  # One parsable line per progress update
+                "-o", output_template,
+                target]  # The search query or video URL
+        return cmd
+
+    def resolve(self, query):
+        """Search without downloading; returns (video ID or None, error output)."""
+        cmd = self.yt_dlp_cmd + ["--flat-playlist",  # Don't extract the videos of the search result
+                                 "--print", "id",
+                                 "--default-search", "ytsearch",
+                                 query]
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   text=True, encoding='utf-8', errors='replace', startupinfo=hidden_startupinfo())
+        stdout, stderr = process.communicate()
+        video_ids = stdout.split()
+        if process.returncode != 0 or not video_ids:
+            return None, stderr or "No search results."
+        return video_ids[0], stderr
+
+    def search(self, query):
+        """Metadata of every result of `query` (e.g. "ytsearch5:..."), without downloading; returns (list, error output)."""
+        cmd = self.yt_dlp_cmd + ["--flat-playlist",
+                                 "--print", CANDIDATE_TEMPLATE,
+                                 "--default-search", "ytsearch",
+                                 query]
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   text=True, encoding='utf-8', errors='replace', startupinfo=hidden_startupinfo())
+        stdout, stderr = process.communicate()
+        candidates = []
+        for line in stdout.splitlines():
+            try:
+                candidate = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(candidate, dict) and candidate.get('id'):
+                candidates.append(candidate)
+        if process.returncode != 0 or not candidates:
+            return [], stderr or "No search results."
+        return candidates, stderr
+
+    def download(self, target, output_template, progress=None, connections=1, thumbnail=True):
+        """Download `target`, feeding `progress` (a TransferProgress) as yt-dlp reports it.
+
+        Returns (success, error output). Only the tail of stderr is kept, and
+        cancelling `progress` kills the process. `connections` > 1 is passed to
+        yt-dlp as --concurrent-fragments; `thumbnail=False` skips the thumbnail
+        (e.g. when the album cover is embedded instead).
+        """
+        process = subprocess.Popen(self.build_command(target, output_template, connections, thumbnail), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   text=True, encoding='utf-8', errors='replace', bufsize=1, startupinfo=hidden_startupinfo())
+        if progress is not None:
+            progress.set_cancel(process.kill)
+        stderr_tail = collections.deque(maxlen=200)
+        stderr_reader = threading.Thread(target=stderr_tail.extend, args=(process.stderr,), daemon=True)
+        stderr_reader.start()
+        for line in process.stdout:
+            parsed = parse_progress_line(line)
+            if parsed is not None and progress is not None:
+                progress.update(*parsed)
+        process.wait()
+        stderr_reader.join()
+        return process.returncode == 0, ''.join(stderr_tail)
+
+    def close(self):
+        pass
+
+
+class _ErrorCollector:
+    """yt-dlp logger that keeps error messages instead of printing them."""
+
+    def __init__(self):
+        self.errors = []
+
+    def debug(self, msg):
+        pass
+
+    def info(self, msg):
+        pass
+
+    def warning(self, msg):
+        pass
+
+    def error(self, msg):
+        self.errors.append(msg)
+
+
+class YoutubeDLBackend:
+    """Runs yt-dlp in-process with one long-lived YoutubeDL instance per worker thread.
+
+    Reusing the instance keeps the extractors loaded and the HTTP connection
+    pools open between tracks, instead of paying a fresh interpreter start,
+    extractor import and TLS handshakes for every track.
+
+    A download can only be cancelled from the progress hook, which yt-dlp
+    calls when data arrives, so a stalled transfer can't be aborted; instead,
+    reads give up after `socket_timeout` seconds without data.
+    """
+
+    name = "in-process"
+    aborts_stalled = False
+
+    def __init__(self, write_thumbnail=False, socket_timeout=None):
+        import yt_dlp
+        self._yt_dlp = yt_dlp
+        self.write_thumbnail = write_thumbnail
+        self.socket_timeout = socket_timeout
+        self._local = threading.local()
+        self._instances = []
+        self._instances_lock = threading.Lock()
+
+    def _params(self):
+        params = {
+            'format': 'bestaudio/best',  # Get best audio quality
+            'default_search': 'ytsearch',  # Enable YouTube search
+            'noplaylist': True,  # Don't download playlists
+            'quiet': True,
+            'no_warnings': True,
+            'noprogress': True,
+            'progress_hooks': [self._progress_hook],
+            'writethumbnail': self.write_thumbnail,
+        }
+        if self.socket_timeout:
+            params['socket_timeout'] = self.socket_timeout
+        return params
+
+    def _instance(self):
+        ydl = getattr(self._local, 'ydl', None)
+        if ydl is None:
+            self._local.logger = _ErrorCollector()
+            params = self._params()
+            params['logger'] = self._local.logger
+            ydl = self._yt_dlp.YoutubeDL(params)
+            self._local.ydl = ydl
+            with self._instances_lock:
+                self._instances.append(ydl)
+        return ydl
+
+    def _resolver_instance(self):
+        ydl = getattr(self._local, 'resolver', None)
+        if ydl is None:
+            self._local.resolver_logger = _ErrorCollector()
+            ydl = self._yt_dlp.YoutubeDL({
+                'extract_flat': 'in_playlist',  # Search results only, no per-video extraction
+                'default_search': 'ytsearch',
+                'skip_download': True,
+                'quiet': True,
+                'no_warnings': True,
+                'logger': self._local.resolver_logger,
+            })
+            self._local.resolver = ydl
+            with self._instances_lock:
+                self._instances.append(ydl)
+        return ydl
+
+    def resolve(self, query):
+        """Search without downloading; returns (video ID or None, error output)."""
+        ydl = self._resolver_instance()
+        logger = self._local.resolver_logger
+        logger.errors.clear()
+        try:
+            info = ydl.extract_info(query, download=False)
+        except self._yt_dlp.utils.DownloadError as e:
+            return None, '\n'.join(logger.errors) or str(e)
+        if info is None:
+            return None, '\n'.join(logger.errors) or "No search results."
+        entries = info.get('entries')
+        if entries is None:
+            return info.get('id'), ''
+        first = next(iter(entries), None)
+        if not first or not first.get('id'):
+            return None, "No search results."
+        return first['id'], ''
+
+    def search(self, query):
+        """Metadata of every result of `query` (e.g. "ytsearch5:..."), without downloading; returns (list, error output)."""
+        ydl = self._resolver_instance()
+        logger = self._local.resolver_logger
+        logger.errors.clear()
+        try:
+            info = ydl.extract_info(query, download=False)
+        except self._yt_dlp.utils.DownloadError as e:
+            return [], '\n'.join(logger.errors) or str(e)
+        entries = (info or {}).get('entries')
+        if entries is None:
+            entries = [info] if info and info.get('id') else []
+        candidates = [{field: entry.get(field) for field in CANDIDATE_FIELDS}
+                      for entry in entries if entry and entry.get('id')]
+        if not candidates:
+            return [], '\n'.join(logger.errors) or "No search results."
+        return candidates, ''
+
+    def _progress_hook(self, d):
+        progress = getattr(self._local, 'progress', None)
+        if progress is None:
+            return
+        if progress.cancelled:
+            # Raising from a progress hook is how yt-dlp lets callers abort a download
+            raise self._yt_dlp.utils.DownloadCancelled("Download cancelled")
+        if d.get('status') == 'downloading':
+            progress.update(d.get('downloaded_bytes'), d.get('total_bytes') or d.get('total_bytes_estimate'),
+                            d.get('speed'), d.get('eta'))
+
+    def download(self, target, output_template, progress=None, connections=1, thumbnail=True):
+        """Download `target`, feeding `progress` (a TransferProgress); returns (success, error output).
+
+        With `connections` > 1, a plain HTTP(S) audio stream is fetched as byte
+        ranges over that many connections (see fragments.py), and fragmented
+        formats get that many concurrent fragment downloads. `thumbnail=False`
+        skips the thumbnail.
+        """
+        ydl = self._instance()
+        logger = self._local.logger
+        logger.errors.clear()
+        ydl.params['outtmpl'] = {'default': output_template}
+        ydl.params['writethumbnail'] = self.write_thumbnail and thumbnail
+        ydl.params['concurrent_fragment_downloads'] = connections
+        self._local.progress = progress
+        try:
+            if connections <= 1:
+                retcode = ydl.download([target])
+            else:
+                info = ydl.extract_info(target, download=False)
+                if info is None:
+                    return False, '\n'.join(logger.errors) or "No video information."
+                if not self._fetch_ranges(ydl, info, progress, connections):
+                    # Let yt-dlp download the extracted formats itself, without extracting them again
+                    ydl.process_ie_result(info, download=True)
+                retcode = 0  # Errors were raised as DownloadError
+        except (self._yt_dlp.utils.DownloadError, self._yt_dlp.utils.DownloadCancelled) as e:
+            return False, '\n'.join(logger.errors) or str(e)
+        except FetchCancelled as e:
+            return False, str(e)
+        except (OSError, http.client.HTTPException) as e:
+            return False, f"Ranged download failed: {e}"
+        finally:
+            self._local.progress = None
+        return retcode == 0, '\n'.join(logger.errors)
+
+    def _fetch_ranges(self, ydl, info, progress, connections):
+        """Fetch the selected audio of `info` over several connections, then let yt-dlp write the thumbnail.
+
+        Returns False, before downloading anything, for formats yt-dlp has to
+        download itself: fragmented or merged ones, proxied setups and servers
+        that don't support Range requests.
+        """
+        url = info.get('url')
+        if (info.get('protocol') not in ('http', 'https') or not url or info.get('requested_formats')
+                or info.get('fragments') or ydl.params.get('proxy')):
+            return False
+        headers = info.get('http_headers') or {}
+        try:
+            timeout = self.socket_timeout or 30
+            total = info.get('filesize') or content_length(url, headers, timeout)
+            fetch_ranges(url, ydl.prepare_filename(info), total, connections, headers, progress, timeout)
+        except RangesNotSupported:
+            return False
+        if ydl.params.get('writethumbnail'):
+            ydl.params['skip_download'] = True
+            try:
+                ydl.process_ie_result(info, download=True)  # Thumbnail only
+            finally:
+                ydl.params['skip_download'] = False
+        return True
+
+    def close(self):
+        with self._instances_lock:
+            for ydl in self._instances:
+                ydl.close()
+            self._instances.clear()
+
+
+def create_backend(kind, yt_dlp_cmd=None, write_thumbnail=False, socket_timeout=None):
+    """Build the backend named `kind` ("auto", "in-process" or "subprocess").
+
+    "auto" uses the in-process backend when the yt_dlp module is importable and
+    no explicit executable was requested, and falls back to the subprocess one
+    otherwise (e.g. in the PyInstaller build, which bundles yt-dlp.exe).
+    `socket_timeout` only applies to the in-process backend.
+    """
+    if kind == "in-process" or (kind == "auto" and yt_dlp_cmd is None and yt_dlp_module_available()):
+        return YoutubeDLBackend(write_thumbnail=write_thumbnail, socket_timeout=socket_timeout)
+    if not yt_dlp_cmd:
+        raise ValueError("the subprocess backend needs a yt-dlp executable")
+    return SubprocessBackend(yt_dlp_cmd, write_thumbnail=write_thumbnail)
@@ -0,0 +1,81 @@
+"""Compare the in-process and subprocess yt-dlp backends against a local HTTP server.
+
+Usage: python benchmarks/bench_backends.py [--tracks 40] [--workers 5] [--size-kb 512]
+
+Needs the yt_dlp package (and/or a yt-dlp executable for the subprocess
+backend). No network access is required, and since the backends only fetch
+(transcoding is a separate stage) ffmpeg isn't needed either.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import SubprocessBackend, YoutubeDLBackend, yt_dlp_module_available  # noqa: E402
+from local_server import LocalMediaServer  # noqa: E402
+
+
+def run(backend, server, tracks, workers):
+    out_dir = tempfile.mkdtemp(prefix=f"bench-{backend.name}-")
+    server.reset_stats()
+    failures = []
+
+    def fetch(i):
+        ok, err = backend.download(server.url(f"{i}.m4a"), os.path.join(out_dir, f"{i}.%(ext)s"))
+        if not ok:
+            failures.append(err)
+
+    cpu_before = os.times()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(fetch, range(tracks)))
+    wall = time.perf_counter() - started
+    cpu_after = os.times()
+    backend.close()
+    shutil.rmtree(out_dir, ignore_errors=True)
+
+    # os.times() includes finished child processes, so subprocess CPU is counted too
+    cpu = sum(cpu_after[:4]) - sum(cpu_before[:4])
+    return {
+        'backend': backend.name,
+        'wall_s': wall,
+        'tracks_per_s': tracks / wall,
+        'cpu_s_per_track': cpu / tracks,
+        'connections': server.connections,
+        'failures': len(failures),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=5)
+    parser.add_argument("--size-kb", type=int, default=512)
+    args = parser.parse_args()
+
+    backends = []
+    if yt_dlp_module_available():
+        backends.append(YoutubeDLBackend())
+        backends.append(SubprocessBackend([shutil.which("yt-dlp") or sys.executable, *([] if shutil.which("yt-dlp") else ["-m", "yt_dlp"])]))
+    elif shutil.which("yt-dlp"):
+        print("yt_dlp package not installed; only the subprocess backend can be measured.")
+        backends.append(SubprocessBackend([shutil.which("yt-dlp")]))
+    else:
+        sys.exit("Neither the yt_dlp package nor a yt-dlp executable is available.")
+
+    with LocalMediaServer(file_size=args.size_kb * 1024) as server:
+        print(f"{args.tracks} tracks of {args.size_kb} KiB, {args.workers} workers")
+        print(f"{'backend':<12} {'wall s':>8} {'tracks/s':>9} {'CPU s/track':>12} {'connections':>12} {'failures':>9}")
+        for backend in backends:
+            r = run(backend, server, args.tracks, args.workers)
+            print(f"{r['backend']:<12} {r['wall_s']:>8.2f} {r['tracks_per_s']:>9.2f} {r['cpu_s_per_track']:>12.3f} "
+                  f"{r['connections']:>12} {r['failures']:>9}")
+
+
+if __name__ == "__main__":
+    main()
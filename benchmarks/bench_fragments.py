@@ -0,0 +1,119 @@
+"""Measure download throughput for fragments (connections per track) x workers against a throttled local server.
+
+Usage: python benchmarks/bench_fragments.py [--tracks 24] [--size-kb 3072] [--kb-per-second 512]
+           [--fragments 1 2 4 8] [--workers 1 2 4 8] [--budget N] [--json RESULTS]
+
+The local server throttles every connection to --kb-per-second, like a
+high-latency link or YouTube's per-connection throttling. Each run
+downloads --tracks files with a pool of --workers, every download asking a
+shared fragments.ConnectionBudget for --fragments connections, as the
+engine's fetch stage does. The budget defaults to fragments x workers, so
+the grid shows the scaling; --budget caps it (the engine's default is
+--workers, which only hands out extra connections while the pool has
+room).
+
+Uses the in-process yt-dlp backend when the yt_dlp package is installed
+(metadata extraction included) and fragments.fetch_ranges directly
+otherwise. No network access is needed.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import YoutubeDLBackend, yt_dlp_module_available  # noqa: E402
+from fragments import ConnectionBudget, content_length, fetch_ranges  # noqa: E402
+from local_server import LocalMediaServer  # noqa: E402
+
+
+def fetch_direct(url, output_template, progress=None, connections=1):
+    path = output_template.replace("%(ext)s", "m4a")
+    try:
+        fetch_ranges(url, path, content_length(url), connections, progress=progress)
+    except Exception as e:
+        return False, str(e)
+    return True, ""
+
+
+def run(download, server, tracks, workers, fragments, budget_total):
+    out_dir = tempfile.mkdtemp(prefix="bench-fragments-")
+    server.reset_stats()
+    budget = ConnectionBudget(budget_total)
+    failures = []
+    granted = []
+
+    def fetch(i):
+        connections = budget.acquire(fragments)
+        granted.append(connections)
+        try:
+            ok, err = download(server.url(f"{i}.m4a"), os.path.join(out_dir, f"{i}.%(ext)s"), None, connections)
+        finally:
+            budget.release(connections)
+        if not ok:
+            failures.append(err)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(fetch, range(tracks)))
+    wall = time.perf_counter() - started
+    shutil.rmtree(out_dir, ignore_errors=True)
+    return {
+        'fragments': fragments,
+        'workers': workers,
+        'budget': budget_total,
+        'wall_s': wall,
+        'mib_per_s': server.bytes_sent / wall / 2 ** 20,
+        'mean_connections': sum(granted) / len(granted),
+        'connections_opened': server.connections,
+        'requests': server.requests,
+        'failures': len(failures),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=24)
+    parser.add_argument("--size-kb", type=int, default=3072)
+    parser.add_argument("--kb-per-second", type=int, default=512, help="throttle per connection")
+    parser.add_argument("--fragments", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--budget", type=int, help="total connections (default: fragments x workers)")
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    args = parser.parse_args()
+
+    if yt_dlp_module_available():
+        backend = YoutubeDLBackend()
+        download, mode = backend.download, "in-process yt-dlp backend"
+    else:
+        backend = None
+        download, mode = fetch_direct, "fragments.fetch_ranges (yt_dlp not installed)"
+
+    results = []
+    with LocalMediaServer(file_size=args.size_kb * 1024,
+                          bytes_per_second_per_connection=args.kb_per_second * 1024) as server:
+        print(f"{args.tracks} tracks of {args.size_kb} KiB, {args.kb_per_second} KiB/s per connection, {mode}")
+        print(f"{'fragments':>9} {'workers':>8} {'budget':>7} {'wall s':>8} {'MiB/s':>8} {'conns/track':>12} "
+              f"{'opened':>7} {'requests':>9} {'failures':>9}")
+        for workers in args.workers:
+            for fragments in args.fragments:
+                r = run(download, server, args.tracks, workers, fragments, args.budget or fragments * workers)
+                results.append(r)
+                print(f"{r['fragments']:>9} {r['workers']:>8} {r['budget']:>7} {r['wall_s']:>8.2f} "
+                      f"{r['mib_per_s']:>8.2f} {r['mean_connections']:>12.2f} {r['connections_opened']:>7} "
+                      f"{r['requests']:>9} {r['failures']:>9}")
+    if backend is not None:
+        backend.close()
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({'settings': {k: v for k, v in vars(args).items() if k != "json_path"}, 'results': results},
+                      f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
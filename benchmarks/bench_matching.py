@@ -0,0 +1,156 @@
+"""Measure how often multi-candidate matching picks the right upload, and the bytes it saves.
+
+Usage: python benchmarks/bench_matching.py [--tracks 10000] [--candidates 5] [--missing-rate 0.1]
+           [--wrong-first-rate 0.4] [--no-duration] [--seed 1] [--json RESULTS]
+
+Builds a synthetic corpus of search results: per track a few correct
+uploads (official audio, music video, lyric video) mixed with the versions
+that ytsearch1 tends to pick instead (live recordings, covers, karaoke,
+sped-up edits, 10-hour loops, other songs of the artist). For
+--missing-rate of the tracks no correct upload is among the results, and
+for --wrong-first-rate a wrong one is the first result.
+
+Compares taking the first result (the old behaviour) with matching.py at
+several score thresholds: precision (correct / downloaded), recall
+(correct / tracks that had a correct result), tracks reported instead of
+downloaded, and the bytes downloaded for wrong files, counting every
+second of audio as 20 KB (160 kbit/s opus). --no-duration scores as for
+exports without `duration_ms`.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matching import MIN_MATCH_SCORE, best_candidate  # noqa: E402
+
+BYTES_PER_SECOND = 20000
+WORDS = ("love", "night", "fire", "heart", "dream", "city", "light", "rain", "gold", "summer", "blue", "wild",
+         "home", "river", "ghost", "silver", "echo", "storm", "paper", "velvet", "neon", "ocean", "shadow", "road")
+PLACES = ("Wembley", "Glastonbury", "Madison Square Garden", "Coachella", "the BBC", "Red Rocks")
+
+
+def words(rng, low, high):
+    return " ".join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(low, high)))
+
+
+def correct_uploads(rng, name, artist, duration):
+    official = [
+        {'title': f"{artist} - {name}", 'channel': f"{artist} - Topic", 'duration': duration + rng.uniform(-1, 1)},
+        {'title': f"{artist} - {name} (Official Video)", 'channel': f"{artist}VEVO",
+         'duration': duration + rng.uniform(0, 12)},  # Intros and outros
+        {'title': f"{name} - {artist} (Lyrics)", 'channel': words(rng, 1, 2), 'duration': duration + rng.uniform(-2, 3)},
+    ]
+    return rng.sample(official, rng.randint(1, 3))
+
+
+def wrong_uploads(rng, name, artist, duration):
+    return [
+        {'title': f"{artist} - {name} (Live at {rng.choice(PLACES)})", 'channel': artist,
+         'duration': duration + rng.uniform(20, 120)},
+        {'title': f"{name} - {artist} (cover by {words(rng, 1, 2)})", 'channel': words(rng, 1, 2),
+         'duration': duration + rng.uniform(-15, 15)},
+        {'title': f"{artist} - {name} (Karaoke Version)", 'channel': "Karaoke Hits",
+         'duration': duration + rng.uniform(-3, 3)},
+        {'title': f"{name} (sped up)", 'channel': words(rng, 1, 1), 'duration': duration * 0.8},
+        {'title': f"{artist} - {name} 10 hours", 'channel': "Loops", 'duration': 36000},
+        {'title': f"{artist} - {words(rng, 1, 3)}", 'channel': f"{artist} - Topic",
+         'duration': rng.uniform(120, 360)},
+    ]
+
+
+def make_corpus(tracks, candidates, missing_rate, wrong_first_rate, seed):
+    """List of (name, artist, duration, results), each result with a 'correct' flag."""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(tracks):
+        name, artist, duration = words(rng, 1, 3), words(rng, 1, 2), rng.uniform(120, 360)
+        wrong = [dict(result, correct=False) for result in wrong_uploads(rng, name, artist, duration)]
+        right = [] if rng.random() < missing_rate else [dict(result, correct=True)
+                                                        for result in correct_uploads(rng, name, artist, duration)]
+        rng.shuffle(wrong)
+        if right and rng.random() >= wrong_first_rate:
+            results = right[:1] + rng.sample(right[1:] + wrong, len(right) - 1 + len(wrong))
+        else:
+            results = wrong[:1] + rng.sample(right + wrong[1:], len(right) + len(wrong) - 1)
+        for n, result in enumerate(results[:candidates]):
+            result['id'] = f"{i:06d}{n}"
+        corpus.append((name, artist, duration, results[:candidates]))
+    return corpus
+
+
+def evaluate(corpus, pick):
+    """Run `pick(name, artist, duration, results)` -> (result or None) over the corpus."""
+    downloaded = correct = reported = wrong_bytes = total_bytes = 0
+    matchable = sum(1 for _, _, _, results in corpus if any(result['correct'] for result in results))
+    started = time.perf_counter()
+    for name, artist, duration, results in corpus:
+        result = pick(name, artist, duration, results)
+        if result is None:
+            reported += 1
+            continue
+        downloaded += 1
+        size = result['duration'] * BYTES_PER_SECOND
+        total_bytes += size
+        if result['correct']:
+            correct += 1
+        else:
+            wrong_bytes += size
+    return {
+        'downloaded': downloaded,
+        'correct': correct,
+        'reported': reported,
+        'precision': correct / downloaded if downloaded else None,
+        'recall': correct / matchable if matchable else None,
+        'wrong_gb': wrong_bytes / 1e9,
+        'total_gb': total_bytes / 1e9,
+        'us_per_track': 1e6 * (time.perf_counter() - started) / len(corpus),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=10000)
+    parser.add_argument("--candidates", type=int, default=5)
+    parser.add_argument("--missing-rate", type=float, default=0.1)
+    parser.add_argument("--wrong-first-rate", type=float, default=0.4)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.4, 0.5, MIN_MATCH_SCORE, 0.7, 0.8])
+    parser.add_argument("--no-duration", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.tracks, args.candidates, args.missing_rate, args.wrong_first_rate, args.seed)
+    runs = [("first result", None, evaluate(corpus, lambda name, artist, duration, results: results[0]))]
+    for threshold in args.thresholds:
+        def pick(name, artist, duration, results, threshold=threshold):
+            result, score = best_candidate(results, name, [artist], None if args.no_duration else duration)
+            return result if score >= threshold else None
+        runs.append((f"matching >= {threshold:g}", threshold, evaluate(corpus, pick)))
+
+    print(f"{args.tracks} tracks, {args.candidates} results each, {args.missing_rate:.0%} without a correct one, "
+          f"{args.wrong_first_rate:.0%} with a wrong first result{', no durations' if args.no_duration else ''}")
+    print(f"{'':<16} {'downloaded':>10} {'reported':>9} {'precision':>10} {'recall':>7} {'wrong GB':>9} "
+          f"{'total GB':>9} {'us/track':>9}")
+    for label, _, result in runs:
+        print(f"{label:<16} {result['downloaded']:>10} {result['reported']:>9} {result['precision']:>10.3f} "
+              f"{result['recall']:>7.3f} {result['wrong_gb']:>9.2f} {result['total_gb']:>9.2f} "
+              f"{result['us_per_track']:>9.1f}")
+    baseline = runs[0][2]
+    default = next((result for _, threshold, result in runs if threshold == MIN_MATCH_SCORE), None)
+    if default is not None:
+        print(f"At the default threshold, matching avoids {baseline['wrong_gb'] - default['wrong_gb']:.2f} GB of wrong "
+              f"downloads ({baseline['total_gb'] - default['total_gb']:.2f} GB less in total).")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({'settings': {k: v for k, v in vars(args).items() if k != "json_path"},
+                       'results': [dict(result, label=label, threshold=threshold) for label, threshold, result in runs]},
+                      f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Run the whole download pipeline offline, against stand-ins for yt-dlp, ffmpeg and ffprobe.
+
+Usage: python benchmarks/bench_pipeline.py [--tracks 100 1000 10000] [--tools in-process|subprocess]
+           [--latency 0.002] [--size 1000] [--bytes-per-second 0] [--fail-rate 0] [--miss-rate 0]
+           [--encode-seconds 0.002] [--log file|stdout|null] [--json RESULTS]
+
+Generates a synthetic tierlist export per size and downloads it with
+DownloadEngine into a temporary folder, each size in its own process so
+the peak RSS belongs to that run alone. Reports tracks/s, the p50/p99 time
+from a track entering the pipeline to being recorded, peak RSS, and the
+time spent in the log callback (which writes and flushes like the CLI,
+unless --log null).
+
+--tools in-process uses fake_backend.py and measures the pipeline itself;
+--tools subprocess runs fake_yt_dlp.py, fake_ffmpeg.py and fake_ffprobe.py
+as executables, so process spawning is included (too slow for 100k tracks).
+--json writes the results, to compare runs before and after a change.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import engine as engine_module  # noqa: E402
+from engine import DownloadEngine  # noqa: E402
+from fake_backend import FakeBackend, FakeMediaTools  # noqa: E402
+from make_tierlist import write_tierlist  # noqa: E402
+
+FAKE_TOOLS = {"yt-dlp": "fake_yt_dlp.py", "ffmpeg": "fake_ffmpeg.py", "ffprobe": "fake_ffprobe.py"}
+
+
+class TimedLog:
+    """Log callback that counts messages and the time spent writing them."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.messages = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, message):
+        started = time.perf_counter()
+        if self.stream is not None:
+            self.stream.write(message)
+            self.stream.flush()
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.seconds += elapsed
+            self.messages += 1
+
+
+def write_wrappers(bin_dir):
+    """Put yt-dlp, ffmpeg and ffprobe executables running the fake scripts into `bin_dir`."""
+    for name, script in FAKE_TOOLS.items():
+        script = os.path.join(BENCH_DIR, script)
+        if os.name == "nt":
+            with open(os.path.join(bin_dir, name + ".cmd"), "w") as f:
+                f.write(f'@"{sys.executable}" "{script}" %*\n')
+        else:
+            path = os.path.join(bin_dir, name)
+            with open(path, "w") as f:
+                f.write(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+            os.chmod(path, 0o755)
+    return os.path.join(bin_dir, "yt-dlp.cmd" if os.name == "nt" else "yt-dlp")
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, or None if it can't be measured."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset
+        except (ImportError, AttributeError):
+            return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux reports KiB
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def make_engine(args, log, bin_dir):
+    engine = DownloadEngine(log=log, max_workers=args.workers, resolve_workers=args.resolve_workers,
+                            transcode_workers=args.transcode_workers, probe_workers=args.probe_workers,
+                            prefetch=args.prefetch, adaptive=not args.no_adaptive, search_cache_path=None,
+                            art_cache_path=None, search_rate=args.search_rate, media_rate=args.download_rate,
+                            retry_base_delay=args.retry_base_delay, output_format=args.output_format,
+                            yt_dlp_path=write_wrappers(bin_dir) if args.tools == "subprocess" else None,
+                            backend="subprocess")
+    if args.tools == "subprocess":
+        os.environ.update({
+            "PATH": bin_dir + os.pathsep + os.environ.get("PATH", ""),
+            "FAKE_YTDLP_SEARCH_RATE": "0",  # The engine's own rate limiter is what --search-rate tests
+            "FAKE_YTDLP_MEDIA_RATE": "0",
+            "FAKE_YTDLP_LATENCY": str(args.latency),
+            "FAKE_YTDLP_SIZE": str(args.size),
+            "FAKE_YTDLP_BYTES_PER_SECOND": str(args.bytes_per_second),
+            "FAKE_YTDLP_FAIL_RATE": str(args.fail_rate),
+            "FAKE_YTDLP_MISS_RATE": str(args.miss_rate),
+            "FAKE_FFMPEG_CPU_SECONDS": str(args.encode_seconds),
+            "FAKE_FFPROBE_LATENCY": str(args.probe_seconds),
+        })
+        if not engine.locate_tools():
+            sys.exit("could not set up the fake tools")
+    else:
+        engine.backend = FakeBackend(args.latency, args.size, args.bytes_per_second, args.fail_rate, args.miss_rate)
+        engine.ffmpeg_exe_path = engine.ffprobe_exe_path = "fake"
+        FakeMediaTools(args.encode_seconds, args.probe_seconds).install(engine_module)
+    return engine
+
+
+def run_child(args):
+    """Download the export in args.export once and print the measurements as JSON."""
+    work_dir = tempfile.mkdtemp(prefix="bench-pipeline-")
+    log_file = None
+    try:
+        if args.log == "file":
+            log_file = open(os.path.join(work_dir, "run.log"), "w", encoding="utf-8")
+        log = TimedLog(log_file if args.log == "file" else sys.stderr if args.log == "stdout" else None)
+        bin_dir = os.path.join(work_dir, "bin")
+        os.mkdir(bin_dir)
+        engine = make_engine(args, log, bin_dir)
+        download_dir = os.path.join(work_dir, "out")
+        os.mkdir(download_dir)
+
+        started = time.perf_counter()
+        stats = engine.download(args.export, download_dir)
+        wall = time.perf_counter() - started
+        if stats.error:
+            sys.exit(f"run failed: {stats.error}")
+        rss = peak_rss()
+        result = {
+            'tracks': stats.total,
+            'tools': args.tools,
+            'downloaded': stats.downloaded,
+            'failed': stats.failed,
+            'retried': stats.retried,
+            'wall_s': wall,
+            'tracks_per_s': stats.downloaded / wall,
+            'p50_ms': 1000 * percentile(stats.track_seconds, 0.50) if stats.track_seconds else None,
+            'p99_ms': 1000 * percentile(stats.track_seconds, 0.99) if stats.track_seconds else None,
+            'peak_rss_mib': rss / 2**20 if rss is not None else None,
+            'log_messages': log.messages,
+            'log_ms': 1000 * log.seconds,
+            'log_pct': 100 * log.seconds / wall,
+        }
+        print(json.dumps(result))
+    finally:
+        if log_file is not None:
+            log_file.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def fmt(value, width):
+    return f"{value:>{width}.1f}" if value is not None else f"{'n/a':>{width}}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--tools", choices=("in-process", "subprocess"), default="in-process")
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds per search and per download request")
+    parser.add_argument("--size", type=int, default=1000, help="bytes per downloaded file")
+    parser.add_argument("--bytes-per-second", type=float, default=0, help="download speed, 0 for instant")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of downloads failing transiently")
+    parser.add_argument("--miss-rate", type=float, default=0.0, help="fraction of searches without results")
+    parser.add_argument("--encode-seconds", type=float, default=0.002, help="time per ffmpeg run")
+    parser.add_argument("--probe-seconds", type=float, default=0.001, help="time per ffprobe run")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--resolve-workers", type=int, default=4)
+    parser.add_argument("--transcode-workers", type=int, default=None)
+    parser.add_argument("--probe-workers", type=int, default=None)
+    parser.add_argument("--prefetch", type=int, default=32)
+    parser.add_argument("--no-adaptive", action="store_true")
+    parser.add_argument("--search-rate", type=float, default=0, help="engine rate limit, 0 for none")
+    parser.add_argument("--download-rate", type=float, default=0, help="engine rate limit, 0 for none")
+    parser.add_argument("--retry-base-delay", type=float, default=0.05)
+    parser.add_argument("--format", dest="output_format", choices=("mp3", "native"), default="mp3")
+    parser.add_argument("--log", choices=("file", "stdout", "null"), default="file",
+                        help="where the engine's log goes (stdout is written to stderr, to keep the table readable)")
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    parser.add_argument("--export", help=argparse.SUPPRESS)  # Set for the per-size child processes
+    args = parser.parse_args()
+    if args.export:
+        run_child(args)
+        return
+
+    results = []
+    print(f"{args.tools} tools, {args.latency * 1000:g} ms per request, {args.size} B files, "
+          f"{args.fail_rate:.0%} failing downloads, log: {args.log}")
+    print(f"{'tracks':>7} {'wall s':>8} {'tracks/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'peak RSS MiB':>13} "
+          f"{'log msgs':>9} {'log ms':>8} {'log %':>6} {'failed':>7}")
+    for tracks in args.tracks:
+        fd, export = tempfile.mkstemp(suffix=".json", prefix="bench-pipeline-")
+        os.close(fd)
+        try:
+            write_tierlist(export, tracks)
+            child = subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--export", export],
+                                   stdout=subprocess.PIPE, text=True)
+        finally:
+            os.remove(export)
+        if child.returncode != 0:
+            sys.exit(f"run with {tracks} tracks failed")
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{tracks:>7} {result['wall_s']:>8.2f} {result['tracks_per_s']:>9.1f} {fmt(result['p50_ms'], 8)} "
+              f"{fmt(result['p99_ms'], 8)} {fmt(result['peak_rss_mib'], 13)} {result['log_messages']:>9} "
+              f"{result['log_ms']:>8.1f} {result['log_pct']:>6.2f} {result['failed']:>7}", flush=True)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({'settings': {k: v for k, v in vars(args).items() if k not in ("export", "json_path")},
+                       'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Compare unpaced workers with the shared rate limiter against a fake yt-dlp that throttles.
+
+Usage: python benchmarks/bench_ratelimit.py [--tracks 60] [--workers 8] [--search-rate 2] [--media-rate 4]
+
+Every track is searched and then downloaded through the subprocess backend,
+with the same retry policy as the engine (transient errors are retried with
+exponential backoff). The fake yt-dlp (fake_yt_dlp.py) answers with HTTP 429
+once more than its budget of requests per second arrive, and keeps doing so
+for a penalty period. No network access or ffmpeg is needed.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import SubprocessBackend  # noqa: E402
+from ratelimit import RateLimiter  # noqa: E402
+from retry import TRANSIENT, backoff_delay, classify_failure  # noqa: E402
+
+FAKE_YT_DLP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_yt_dlp.py")
+
+
+def with_retries(limiter, kind, request, max_retries, base_delay):
+    """Run `request()` -> (result, error) like the engine does; returns (result, error)."""
+    attempt = 0
+    while True:
+        limiter.acquire(kind)
+        result, error = request()
+        limiter.report(kind, None if result else error)
+        if result or attempt >= max_retries or classify_failure(error) != TRANSIENT:
+            return result, error
+        attempt += 1
+        time.sleep(backoff_delay(attempt, base_delay))
+
+
+def count_lines(path):
+    try:
+        with open(path) as f:
+            return sum(1 for _ in f)
+    except OSError:
+        return 0
+
+
+def run(label, limiter, tracks, workers, max_retries, base_delay):
+    state_dir = tempfile.mkdtemp(prefix="bench-ratelimit-state-")
+    out_dir = tempfile.mkdtemp(prefix="bench-ratelimit-out-")
+    os.environ["FAKE_YTDLP_STATE"] = state_dir
+    backend = SubprocessBackend([sys.executable, FAKE_YT_DLP])
+    failures = []
+
+    def track(i):
+        video_id, error = with_retries(limiter, "search", lambda: backend.resolve(f"ytsearch1:artist {i} - song {i}"),
+                                       max_retries, base_delay)
+        if not video_id:
+            failures.append(error)
+            return
+        template = os.path.join(out_dir, f"{i}.source.%(ext)s")
+        ok, error = with_retries(limiter, "media", lambda: backend.download(video_id, template), max_retries, base_delay)
+        if not ok:
+            failures.append(error)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(track, range(tracks)))
+    wall = time.perf_counter() - started
+    result = {
+        'label': label,
+        'wall_s': wall,
+        'tracks_per_s': tracks / wall,
+        'requests': count_lines(os.path.join(state_dir, "search.requests")) + count_lines(os.path.join(state_dir, "media.requests")),
+        'throttled': count_lines(os.path.join(state_dir, "search.throttled")) + count_lines(os.path.join(state_dir, "media.throttled")),
+        'failures': len(failures),
+    }
+    shutil.rmtree(state_dir, ignore_errors=True)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--search-rate", type=float, default=2.0, help="limiter rate for searches")
+    parser.add_argument("--media-rate", type=float, default=4.0, help="limiter rate for downloads")
+    parser.add_argument("--max-retries", type=int, default=4)
+    parser.add_argument("--retry-base-delay", type=float, default=2.0)
+    args = parser.parse_args()
+
+    # The fake server allows a bit more than the limiter's rates, like a real server with some headroom
+    os.environ.setdefault("FAKE_YTDLP_SEARCH_RATE", str(args.search_rate * 1.5))
+    os.environ.setdefault("FAKE_YTDLP_MEDIA_RATE", str(args.media_rate * 1.5))
+
+    print(f"{args.tracks} tracks, {args.workers} workers, fake server budget "
+          f"{os.environ['FAKE_YTDLP_SEARCH_RATE']} searches/s and {os.environ['FAKE_YTDLP_MEDIA_RATE']} downloads/s")
+    print(f"{'limiter':<22} {'wall s':>8} {'tracks/s':>9} {'requests':>9} {'429s':>6} {'failures':>9}")
+    configs = [
+        ("none", RateLimiter(search_rate=None, media_rate=None)),
+        (f"{args.search_rate:g}/s + {args.media_rate:g}/s", RateLimiter(args.search_rate, args.media_rate)),
+    ]
+    for label, limiter in configs:
+        r = run(label, limiter, args.tracks, args.workers, args.max_retries, args.retry_base_delay)
+        print(f"{r['label']:<22} {r['wall_s']:>8.2f} {r['tracks_per_s']:>9.2f} {r['requests']:>9} "
+              f"{r['throttled']:>6} {r['failures']:>9}")
+
+
+if __name__ == "__main__":
+    main()
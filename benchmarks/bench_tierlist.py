@@ -0,0 +1,85 @@
+"""Compare json.load with the incremental tierlist reader on a large synthetic export.
+
+Usage: python benchmarks/bench_tierlist.py [--tracks 200000]
+
+Reports the time until the first track is available, the total time and
+the peak Python heap (tracemalloc) for building every pending TrackJob up
+front, the way download() used to, versus streaming them.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import TrackJob  # noqa: E402
+from make_tierlist import write_tierlist  # noqa: E402
+from tierlist import iter_tierlist_items, track_fields  # noqa: E402
+
+
+def load_all(path, download_dir):
+    import json
+    started = time.perf_counter()
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    jobs = []
+    first = None
+    for tier_items in data["state"].values():
+        for item in tier_items:
+            fields = track_fields(item)
+            if fields:
+                jobs.append(TrackJob(*fields, download_dir))
+                if first is None:
+                    first = time.perf_counter() - started
+    return first, len(jobs)
+
+
+def stream(path, download_dir):
+    started = time.perf_counter()
+    first = None
+    count = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for _, item in iter_tierlist_items(f):
+            fields = track_fields(item)
+            if fields:
+                TrackJob(*fields, download_dir)  # handed to the bounded resolve queue in the engine
+                count += 1
+                if first is None:
+                    first = time.perf_counter() - started
+    return first, count
+
+
+def measure(func, path):
+    tracemalloc.start()
+    started = time.perf_counter()
+    first, count = func(path, tempfile.gettempdir())
+    total = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first, total, peak, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=200000)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".json", prefix="bench-tierlist-")
+    os.close(fd)
+    try:
+        write_tierlist(path, args.tracks)
+        print(f"{args.tracks} tracks, {os.path.getsize(path) / 2**20:.0f} MiB export")
+        print(f"{'reader':<10} {'first track ms':>15} {'total s':>8} {'peak heap MiB':>14}")
+        for name, func in (("json.load", load_all), ("streaming", stream)):
+            first, total, peak, count = measure(func, path)
+            assert count == args.tracks
+            print(f"{name:<10} {first * 1000:>15.1f} {total:>8.2f} {peak / 2**20:>14.1f}")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Compare the CPU cost per track of the mp3 re-encode and the "native" remux output modes.
+
+Usage: python benchmarks/bench_transcode.py [--tracks 10] [--seconds 200] [--ffmpeg PATH]
+
+Needs a real ffmpeg (with libopus and libmp3lame). It generates YouTube-like
+sources (opus in WebM and AAC in M4A) plus a WebP thumbnail, then runs the
+transcode stage's ffmpeg commands on them. CPU time is measured from the
+finished ffmpeg processes (os.times), so it is the cost the transcode
+pool pays per track.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transcode import native_container, remux, transcode  # noqa: E402
+
+SOURCES = {
+    # name: (ffmpeg encoder arguments, file name, codec)
+    "opus/webm": (["-c:a", "libopus", "-b:a", "128k", "-f", "webm"], "source.webm", "opus"),
+    "aac/m4a": (["-c:a", "aac", "-b:a", "128k", "-f", "mp4"], "source.m4a", "aac"),
+}
+
+
+def make_inputs(ffmpeg, work_dir, seconds):
+    """Create one source per codec and a thumbnail; returns ({name: path}, thumbnail path)."""
+    # A mix of tones and noise, so the encoders have something to work on
+    audio = f"sine=frequency=440:duration={seconds},volume=0.5[a];anoisesrc=duration={seconds}:amplitude=0.05[b];[a][b]amix"
+    sources = {}
+    for name, (args, fname, _) in SOURCES.items():
+        path = os.path.join(work_dir, fname)
+        subprocess.run([ffmpeg, "-v", "error", "-y", "-filter_complex", audio, "-ac", "2", "-ar", "48000", *args, path],
+                       check=True)
+        sources[name] = path
+    thumbnail = os.path.join(work_dir, "thumb.webp")
+    subprocess.run([ffmpeg, "-v", "error", "-y", "-f", "lavfi", "-i", "testsrc=size=1280x720:duration=1",
+                    "-frames:v", "1", thumbnail], check=True)
+    return sources, thumbnail
+
+
+def child_cpu():
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def run(mode, ffmpeg, source, codec, thumbnail, work_dir, tracks):
+    metadata = {"title": "Benchmark Track", "artist": "Benchmark Artist", "comment": "https://www.youtube.com/watch?v=x"}
+    cpu_before = child_cpu()
+    started = time.perf_counter()
+    sizes = []
+    for i in range(tracks):
+        if mode == "mp3":
+            output = os.path.join(work_dir, f"{i}.mp3")
+            ok, err = transcode(ffmpeg, source, output, metadata, thumbnail)
+        else:
+            extension, muxer = native_container(codec)
+            output = os.path.join(work_dir, f"{i}{extension}")
+            ok, err = remux(ffmpeg, source, output, muxer, metadata, thumbnail)
+        if not ok:
+            sys.exit(f"{mode} failed: {err}")
+        sizes.append(os.path.getsize(output))
+        os.remove(output)
+    wall = time.perf_counter() - started
+    cpu = child_cpu() - cpu_before
+    return cpu / tracks, wall / tracks, sum(sizes) / len(sizes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=10)
+    parser.add_argument("--seconds", type=int, default=200, help="length of the generated tracks")
+    parser.add_argument("--ffmpeg", default=shutil.which("ffmpeg"))
+    args = parser.parse_args()
+    if not args.ffmpeg:
+        sys.exit("ffmpeg not found; pass --ffmpeg PATH")
+
+    work_dir = tempfile.mkdtemp(prefix="bench-transcode-")
+    try:
+        sources, thumbnail = make_inputs(args.ffmpeg, work_dir, args.seconds)
+        print(f"{args.tracks} tracks of {args.seconds}s per source, with cover art")
+        print(f"{'source':<10} {'mode':<7} {'CPU s/track':>12} {'wall s/track':>13} {'output KiB':>11}")
+        for name, path in sources.items():
+            codec = SOURCES[name][2]
+            for mode in ("mp3", "native"):
+                cpu, wall, size = run(mode, args.ffmpeg, path, codec, thumbnail, work_dir, args.tracks)
+                print(f"{name:<10} {mode:<7} {cpu:>12.3f} {wall:>13.3f} {size / 1024:>11.0f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""In-process stand-ins for yt-dlp, ffmpeg and ffprobe, used by the benchmarks.
+
+`FakeBackend` has the interface of the backends in backends.py, and
+`FakeMediaTools` replaces the engine's `transcode`, `remux` and `run_ffprobe`
+with functions that only sleep and write files. Without a process per
+request, runs of 100k tracks finish in minutes and what they measure is the
+pipeline's own overhead; fake_yt_dlp.py, fake_ffmpeg.py and fake_ffprobe.py
+are the stand-ins for runs that include the process spawning.
+"""
+import hashlib
+import os
+import random
+import threading
+import time
+
+from fake_ffprobe import probe_result
+
+
+class FakeBackend:
+    """Backend that answers searches and "downloads" zero-filled files after a configurable delay."""
+
+    name = "fake"
+    aborts_stalled = True  # Transfers check for cancellation while they wait
+
+    def __init__(self, latency=0.05, size=1000, bytes_per_second=0, fail_rate=0.0, miss_rate=0.0,
+                 write_thumbnail=True, seed=None):
+        self.latency = latency  # Seconds per request before any data
+        self.size = size  # Bytes per downloaded file
+        self.bytes_per_second = bytes_per_second  # 0 for instant transfers
+        self.fail_rate = fail_rate  # Fraction of downloads failing with a transient error
+        self.miss_rate = miss_rate  # Fraction of searches without results
+        self.write_thumbnail = write_thumbnail
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def _chance(self, rate):
+        with self._random_lock:
+            return self._random.random() < rate
+
+    def resolve(self, query):
+        time.sleep(self.latency)
+        if self._chance(self.miss_rate):
+            return None, "No search results."
+        return hashlib.md5(query.encode()).hexdigest()[:11], ""
+
+    def search(self, query):
+        """One candidate per search, titled like the query, so it always matches."""
+        video_id, error = self.resolve(query)
+        if video_id is None:
+            return [], error
+        return [{'id': video_id, 'title': query.split(':', 1)[-1], 'duration': None}], ""
+
+    def download(self, target, output_template, progress=None, connections=1, thumbnail=True):
+        bytes_per_second = self.bytes_per_second * connections  # Throttled per connection, like YouTube
+        time.sleep(self.latency)
+        if self._chance(self.fail_rate):
+            return False, "ERROR: unable to download video data: HTTP Error 503: Service Unavailable"
+        output = output_template.replace("%(ext)s", "webm")
+        started = time.monotonic()
+        chunk = max(1, self.size // 20)
+        with open(output + ".part", "wb") as f:
+            written = 0
+            while written < self.size:
+                if progress is not None and progress.cancelled:
+                    return False, "Download cancelled"
+                n = min(chunk, self.size - written)
+                f.write(b"\0" * n)
+                written += n
+                elapsed = time.monotonic() - started
+                if bytes_per_second:
+                    time.sleep(max(0.0, written / bytes_per_second - elapsed))
+                    elapsed = time.monotonic() - started
+                if progress is not None:
+                    speed = written / elapsed if elapsed > 0 else None
+                    progress.update(written, self.size, speed, (self.size - written) / speed if speed else None)
+        os.replace(output + ".part", output)
+        if self.write_thumbnail and thumbnail:
+            with open(output_template.replace("%(ext)s", "webp"), "wb") as f:
+                f.write(b"RIFF\0\0\0\0WEBP")
+        return True, ""
+
+    def close(self):
+        pass
+
+
+class FakeMediaTools:
+    """Replacements for transcode.transcode, transcode.remux and probe.run_ffprobe.
+
+    Encoding sleeps instead of using CPU: a real ffmpeg runs in its own
+    process, so burning CPU here would only serialise the workers on the GIL.
+    """
+
+    def __init__(self, encode_seconds=0.02, probe_seconds=0.005, size=-1):
+        self.encode_seconds = encode_seconds
+        self.probe_seconds = probe_seconds
+        self.size = size  # Bytes per output file, -1 to match the input
+
+    def _write(self, source, output):
+        time.sleep(self.encode_seconds)
+        size = os.path.getsize(source) if self.size < 0 else self.size
+        tmp_output = output + ".encoding"
+        with open(tmp_output, "wb") as f:
+            f.write(b"\0" * size)
+        os.replace(tmp_output, output)
+        return True, ""
+
+    def transcode(self, ffmpeg_path, source, output, metadata, thumbnail=None):
+        return self._write(source, output)
+
+    def remux(self, ffmpeg_path, source, output, muxer, metadata, thumbnail=None):
+        return self._write(source, output)
+
+    def run_ffprobe(self, ffprobe_path, path):
+        time.sleep(self.probe_seconds)
+        if not os.path.exists(path):
+            return None, f"{path}: No such file or directory"
+        return probe_result(str(path)), ""
+
+    def install(self, engine_module):
+        """Make `engine_module` (the engine module) use these tools instead of ffmpeg and ffprobe."""
+        engine_module.transcode = self.transcode
+        engine_module.remux = self.remux
+        engine_module.run_ffprobe = self.run_ffprobe
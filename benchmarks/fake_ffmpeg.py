@@ -0,0 +1,44 @@
+"""Stand-in for the ffmpeg executable, used by the benchmarks.
+
+Understands just enough of the transcode stage's commands: it spends some
+CPU time "encoding" and writes the output file (the last argument, or
+stdout for "-").
+
+Configured through the environment:
+  FAKE_FFMPEG_CPU_SECONDS  CPU time burnt per encode (default 0.02)
+  FAKE_FFMPEG_SIZE         bytes per output file, -1 to match the input (default -1)
+  FAKE_FFMPEG_FAIL_RATE    fraction of encodes failing (default 0)
+"""
+import os
+import random
+import sys
+import time
+
+
+def burn(seconds):
+    """Keep one core busy for `seconds` of CPU time, like an encoder would."""
+    deadline = time.process_time() + seconds
+    while time.process_time() < deadline:
+        pass
+
+
+def main(args):
+    burn(float(os.environ.get("FAKE_FFMPEG_CPU_SECONDS", 0.02)))
+    if random.random() < float(os.environ.get("FAKE_FFMPEG_FAIL_RATE", 0)):
+        sys.stderr.write("Error while decoding stream #0:0: Invalid data found when processing input\n")
+        return 1
+    size = int(os.environ.get("FAKE_FFMPEG_SIZE", -1))
+    if size < 0:
+        source = args[args.index("-i") + 1] if "-i" in args else None
+        size = os.path.getsize(source) if source and os.path.exists(source) else 1000
+    output = args[-1]
+    if output == "-":
+        sys.stdout.buffer.write(b"\0" * size)
+        return 0
+    with open(output, "wb") as f:
+        f.write(b"\0" * size)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,41 @@
+"""Stand-in for the ffprobe executable, used by the benchmarks.
+
+Answers `-print_format json -show_format -show_streams FILE` with a plausible
+result whose codec follows the file extension (.webm is opus, .m4a is AAC,
+anything else mp3).
+
+Configured through the environment:
+  FAKE_FFPROBE_LATENCY  seconds per probe (default 0.005)
+"""
+import json
+import os
+import sys
+import time
+
+CODECS = {".webm": ("opus", "matroska,webm"), ".opus": ("opus", "ogg"), ".ogg": ("vorbis", "ogg"),
+          ".m4a": ("aac", "mov,mp4,m4a,3gp,3g2,mj2")}
+
+
+def probe_result(path):
+    codec, format_name = CODECS.get(os.path.splitext(path)[1].lower(), ("mp3", "mp3"))
+    size = os.path.getsize(path)
+    return {
+        "streams": [{"index": 0, "codec_type": "audio", "codec_name": codec, "sample_rate": "48000",
+                     "channels": 2, "duration": "200.000000", "bit_rate": "128000"}],
+        "format": {"filename": path, "format_name": format_name, "duration": "200.000000",
+                   "size": str(size), "bit_rate": "128000"},
+    }
+
+
+def main(args):
+    time.sleep(float(os.environ.get("FAKE_FFPROBE_LATENCY", 0.005)))
+    path = args[-1]
+    if not os.path.exists(path):
+        sys.stderr.write(f"{path}: No such file or directory\n")
+        return 1
+    print(json.dumps(probe_result(path)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,122 @@
+"""Stand-in for the yt-dlp executable, used by the benchmarks.
+
+Handles searches (`--print id`, or `--print` of a JSON template for the
+metadata of the results) and downloads (`-o TEMPLATE`, with
+`--write-thumbnail`), reporting progress in the `--progress-template`
+format the subprocess backend parses.
+
+It can throttle like YouTube does: searches and downloads each get a
+budget of requests per second, shared by all running copies of the
+script through a state directory. Going over the budget answers with
+HTTP 429 and keeps answering 429 for a penalty period, which is what makes
+unpaced workers slow.
+
+Configured through the environment:
+  FAKE_YTDLP_STATE            state directory (needed for throttling and request counts)
+  FAKE_YTDLP_SEARCH_RATE      searches per second before throttling, 0 for no limit (default 3)
+  FAKE_YTDLP_MEDIA_RATE       downloads per second before throttling, 0 for no limit (default 5)
+  FAKE_YTDLP_PENALTY          seconds of 429s after going over the budget (default 3)
+  FAKE_YTDLP_LATENCY          seconds per request before any data (default 0.05)
+  FAKE_YTDLP_SIZE             bytes per downloaded file (default 1000)
+  FAKE_YTDLP_BYTES_PER_SECOND download speed, 0 for instant (default 0)
+  FAKE_YTDLP_FAIL_RATE        fraction of downloads failing with a transient HTTP 503 (default 0)
+  FAKE_YTDLP_MISS_RATE        fraction of searches without results (default 0)
+"""
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+
+PROGRESS_PREFIX = "[spdl-progress]"
+
+
+def over_budget(state_dir, kind, rate, penalty):
+    """Record this request and return True if it has to be answered with 429."""
+    now = time.time()
+    blocked_path = os.path.join(state_dir, f"{kind}.blocked")
+    try:
+        with open(blocked_path) as f:
+            if now < float(f.read() or 0):
+                return True
+    except (OSError, ValueError):
+        pass
+    log_path = os.path.join(state_dir, f"{kind}.log")
+    # Appends of one short line are atomic, so concurrent copies don't need a lock
+    with open(log_path, "a") as f:
+        f.write(f"{now}\n")
+    with open(log_path) as f:
+        recent = sum(1 for line in f if line.strip() and now - float(line) < 1.0)
+    if recent > rate:
+        with open(blocked_path, "w") as f:
+            f.write(str(now + penalty))
+        return True
+    return False
+
+
+def count(state_dir, name):
+    if state_dir:
+        with open(os.path.join(state_dir, name), "a") as f:
+            f.write("1\n")
+
+
+def download(template, write_thumbnail, size, bytes_per_second):
+    """Write the fake audio file (and thumbnail), reporting progress as yt-dlp would."""
+    output = template.replace("%(ext)s", "webm")
+    started = time.monotonic()
+    chunk = max(1, size // 20)
+    with open(output + ".part", "wb") as f:
+        written = 0
+        while written < size:
+            n = min(chunk, size - written)
+            f.write(b"\0" * n)
+            written += n
+            elapsed = time.monotonic() - started
+            if bytes_per_second:
+                # Sleep until this much data "arrived" at the configured speed
+                time.sleep(max(0.0, written / bytes_per_second - elapsed))
+                elapsed = time.monotonic() - started
+            speed = written / elapsed if elapsed > 0 else 0
+            eta = (size - written) / speed if speed else 0
+            print(PROGRESS_PREFIX, written, size, "NA", f"{speed:.1f}", int(eta), flush=True)
+    os.replace(output + ".part", output)
+    if write_thumbnail:
+        with open(template.replace("%(ext)s", "webp"), "wb") as f:
+            f.write(b"RIFF\0\0\0\0WEBP")
+
+
+def main(args):
+    state_dir = os.environ.get("FAKE_YTDLP_STATE")
+    latency = float(os.environ.get("FAKE_YTDLP_LATENCY", 0.05))
+    penalty = float(os.environ.get("FAKE_YTDLP_PENALTY", 3))
+    searching = "--print" in args
+    kind = "search" if searching else "media"
+    rate = float(os.environ.get(f"FAKE_YTDLP_{kind.upper()}_RATE", 3 if searching else 5))
+
+    count(state_dir, f"{kind}.requests")
+    time.sleep(latency)
+    if state_dir and rate and over_budget(state_dir, kind, rate, penalty):
+        count(state_dir, f"{kind}.throttled")
+        sys.stderr.write("ERROR: Unable to download webpage: HTTP Error 429: Too Many Requests\n")
+        return 1
+
+    if searching:
+        if random.random() < float(os.environ.get("FAKE_YTDLP_MISS_RATE", 0)):
+            return 0  # No search results: nothing printed
+        video_id = hashlib.md5(args[-1].encode()).hexdigest()[:11]
+        if args[args.index("--print") + 1] == "id":
+            print(video_id)
+        else:
+            print(json.dumps({"id": video_id, "title": args[-1].split(":", 1)[-1]}))
+        return 0
+    if random.random() < float(os.environ.get("FAKE_YTDLP_FAIL_RATE", 0)):
+        sys.stderr.write("ERROR: unable to download video data: HTTP Error 503: Service Unavailable\n")
+        return 1
+    download(args[args.index("-o") + 1], "--write-thumbnail" in args, int(os.environ.get("FAKE_YTDLP_SIZE", 1000)),
+             float(os.environ.get("FAKE_YTDLP_BYTES_PER_SECOND", 0)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
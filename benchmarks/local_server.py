@@ -0,0 +1,113 @@
+"""Local HTTP stand-in for the media servers, used by the benchmarks."""
+import http.server
+import os
+import threading
+import time
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is visible
+
+    def setup(self):
+        super().setup()
+        with self.server.stats_lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        if not self.path.startswith("/track/"):
+            self.send_error(404)
+            return
+        size = self.server.file_size
+        start, end = 0, size - 1
+        range_header = self.headers.get("Range")
+        if range_header and range_header.startswith("bytes="):
+            first, _, last = range_header[len("bytes="):].partition("-")
+            start = int(first) if first else 0
+            end = min(int(last), size - 1) if last else size - 1
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "audio/mp4")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if not send_body:
+            return
+        with self.server.stats_lock:
+            self.server.requests += 1
+        remaining = end - start + 1
+        chunk = self.server.chunk
+        rate = self.server.bytes_per_second_per_connection
+        while remaining > 0:
+            n = min(len(chunk), remaining)
+            began = time.monotonic()
+            try:
+                self.wfile.write(chunk[:n])
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            remaining -= n
+            with self.server.stats_lock:
+                self.server.bytes_sent += n
+            if rate:
+                # Throttle each connection, like a high-latency link would
+                delay = n / rate - (time.monotonic() - began)
+                if delay > 0:
+                    time.sleep(delay)
+
+
+class LocalMediaServer:
+    """Serves `/track/<anything>` as a `file_size` byte audio file, optionally throttled per connection.
+
+    Supports HTTP keep-alive and Range requests, and counts connections,
+    requests and bytes so benchmarks can show connection reuse.
+    """
+
+    def __init__(self, file_size=512 * 1024, bytes_per_second_per_connection=None):
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.file_size = file_size
+        self.httpd.bytes_per_second_per_connection = bytes_per_second_per_connection
+        self.httpd.chunk = os.urandom(16 * 1024)
+        self.httpd.stats_lock = threading.Lock()
+        self.reset_stats()
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def reset_stats(self):
+        with self.httpd.stats_lock:
+            self.httpd.connections = 0
+            self.httpd.requests = 0
+            self.httpd.bytes_sent = 0
+
+    @property
+    def connections(self):
+        return self.httpd.connections
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def bytes_sent(self):
+        return self.httpd.bytes_sent
+
+    def url(self, name):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/track/{name}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,57 @@
+"""Write a synthetic Spotify tierlist export, used by the benchmarks.
+
+Usage: python benchmarks/make_tierlist.py OUTPUT [--tracks 10000] [--tiers 6] [--art-urls 3]
+
+Items look like real exports, including the album art URLs that make up
+most of their size.
+"""
+import argparse
+import json
+
+
+def track_item(i, art_urls):
+    return {
+        "id": f"{i:022d}",
+        "content": {
+            "name": f"Benchmark Track {i}",
+            "artists": [{"name": f"Artist {i % 997}", "id": f"artist{i % 997}"}, {"name": f"Feature {i % 13}"}],
+            "album": {
+                "name": f"Album {i // 12}",
+                "images": [{"url": f"https://i.scdn.co/image/ab67616d0000b273{i:024x}{size}", "height": size, "width": size}
+                           for size in (640, 300, 64)[:art_urls]],
+            },
+            "duration_ms": 150000 + (i * 7919) % 120000,
+            "preview_url": f"https://p.scdn.co/mp3-preview/{i:040x}",
+        },
+    }
+
+
+def write_tierlist(path, tracks, tiers=6, art_urls=3):
+    """Write an export with `tracks` items spread over `tiers` tiers, one item at a time."""
+    names = ["S", "A", "B", "C", "D", "F"] + [f"T{n}" for n in range(6, tiers)]
+    per_tier = -(-tracks // tiers)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"version": 2, "title": "Benchmark", "state": {')
+        written = 0
+        for t in range(tiers):
+            f.write(("," if t else "") + json.dumps(names[t]) + ": [")
+            count = min(per_tier, tracks - written)
+            for n in range(count):
+                f.write(("," if n else "") + json.dumps(track_item(written + n, art_urls)))
+            written += max(count, 0)
+            f.write("]")
+        f.write('}, "settings": {"theme": "dark"}}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output")
+    parser.add_argument("--tracks", type=int, default=10000)
+    parser.add_argument("--tiers", type=int, default=6)
+    parser.add_argument("--art-urls", type=int, default=3)
+    args = parser.parse_args()
+    write_tierlist(args.output, args.tracks, args.tiers, args.art_urls)
+
+
+if __name__ == "__main__":
+    main()
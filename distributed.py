@@ -0,0 +1,631 @@
+"""Coordinator/worker mode: one process reads the export and keeps the state, workers on other machines download.
+
+The coordinator hands out tracks as leases over a TCP or Unix socket. A
+worker renews its leases while it works on them; a lease that isn't renewed
+in time (the worker died or lost its connection) goes back to the queue and
+is leased to another worker. Finished files are streamed back to the
+coordinator, or, when both sides use the same track store (e.g. on a shared
+volume), only the file's hash is sent and the coordinator links the stored
+file. The coordinator records everything in the playlist folder's journals
+and state database, exactly like a local run.
+
+The protocol is one JSON object per line, answered by one JSON line; an
+uploaded file follows its "result" line as `size` raw bytes. There is no
+authentication, so only listen on trusted networks (the default is
+localhost).
+"""
+import collections
+import hashlib
+import json
+import os
+import shutil
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+
+from engine import DownloadStats, TrackJob
+from track_store import file_sha256
+from transcode import AUDIO_EXTENSIONS
+
+DEFAULT_PORT = 7600
+LEASE_SECONDS = 120
+# A track whose lease expired this many times (its workers keep dying on it) is recorded as failed
+MAX_LEASE_EXPIRIES = 3
+CHUNK_SIZE = 1 << 20
+
+
+def parse_address(address):
+    """("unix", path) for "unix:/path", else ("tcp", (host, port)) for "host:port", ":port" or "port"."""
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return "tcp", (host.strip("[]") or "127.0.0.1", int(port or DEFAULT_PORT))
+
+
+def connect(address, timeout=30):
+    kind, target = parse_address(address)
+    if kind == "unix":
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(target)
+        return sock
+    return socket.create_connection(target, timeout=timeout)
+
+
+def _send(wfile, message):
+    wfile.write(json.dumps(message, separators=(',', ':')).encode('utf-8') + b"\n")
+    wfile.flush()
+
+
+def _receive(rfile):
+    line = rfile.readline()
+    if not line:
+        raise ConnectionError("connection closed")
+    return json.loads(line)
+
+
+class Lease:
+    __slots__ = ('token', 'job', 'worker', 'deadline')
+
+    def __init__(self, token, job, worker, deadline):
+        self.token = token
+        self.job = job
+        self.worker = worker
+        self.deadline = deadline
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        coordinator = self.server.coordinator
+        while True:
+            try:
+                message = _receive(self.rfile)
+            except (ConnectionError, OSError, ValueError):
+                return
+            try:
+                reply = coordinator.handle(message, self.rfile)
+            except (ConnectionError, OSError) as e:
+                coordinator.engine.log(f"Lost the connection to {message.get('worker', 'a worker')}: {e}\n")
+                return
+            except Exception as e:
+                # Also stops the run, e.g. if reading the export failed
+                coordinator.fail(e)
+                reply = {'op': "stop", 'error': str(e)}
+            try:
+                _send(self.wfile, reply)
+            except OSError:
+                return
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Coordinator:
+    """Serves the tracks of one export to workers and records what they send back, using `engine`'s run state."""
+
+    def __init__(self, engine, address, lease_seconds=LEASE_SECONDS):
+        self.engine = engine
+        self.address = address
+        self.lease_seconds = lease_seconds
+        self.download_dir = None
+        self._cond = threading.Condition()
+        self._source = None  # Generator of the export's new TrackJobs, read as workers ask for work
+        self._requeued = collections.deque()  # Jobs of expired or released leases, leased again first
+        self._leases = {}  # Token -> Lease
+        self._outstanding = {}  # Track ID -> token of the current lease, or None while requeued
+        self._expiries = collections.Counter()
+        self._workers = set()
+        self._next_token = 0
+        self._error = None
+        self._store_probe = None  # (file name, contents) of the file that tells workers they share our track store
+
+    def run(self, filepath, download_dir):
+        """Serve `filepath` until every new track is downloaded or failed (or the run is stopped). Returns DownloadStats."""
+        engine = self.engine
+        engine.stats = DownloadStats()
+        self.download_dir = download_dir
+        run = None
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                engine.open_shared()
+                run = engine.open_playlist(download_dir, engine.stats)
+                if engine.track_store_path:
+                    self._write_store_probe()
+                self._source = engine.new_tracks(f, run)
+                first_job = next(self._source, None)
+                if first_job is None:
+                    engine.log_track_counts()
+                    engine.log("No new tracks to download.\n")
+                    engine.notify("info", "All Done", "No new tracks to download.")
+                    return engine.stats
+                first_job.queued_at = time.monotonic()
+                with self._cond:
+                    self._requeue(first_job)
+                server = self._start_server()
+                engine.log(f"Waiting for workers on {self.address}...\n")
+                try:
+                    self._wait()
+                finally:
+                    server.shutdown()
+                    server.server_close()
+                    kind, target = parse_address(self.address)
+                    if kind == "unix" and os.path.exists(target):
+                        os.remove(target)
+            if self._error is not None:
+                raise self._error
+            engine.log_track_counts()
+            if engine.stop_event.is_set():
+                engine.log_stopped()
+                return engine.stats
+            engine.log(f"All tracks downloaded or failed; {len(self._workers)} workers took part.\n")
+            engine.finish_playlist(run)
+            engine.notify("info", "Done", "All tracks have been processed by the workers.")
+        except Exception as e:
+            engine.report_error(e)
+        finally:
+            self._remove_store_probe()
+            if run is not None:
+                engine.close_playlist(run)
+            engine.close_shared()
+        return engine.stats
+
+    def _write_store_probe(self):
+        """Put a file with random contents into the track store; a worker that can read it shares the store.
+
+        The same path on two machines may well be two different folders (e.g.
+        the default ~/SpotifyDownloader/store), so paths can't be compared.
+        """
+        name, token = f".probe-{os.urandom(8).hex()}", os.urandom(16).hex()
+        try:
+            with open(os.path.join(self.engine.track_store_path, name), 'w', encoding='utf-8') as f:
+                f.write(token)
+        except OSError as e:
+            self.engine.log(f"WARNING: could not write to the track store, workers will upload every track: {e}\n")
+            return
+        self._store_probe = (name, token)
+
+    def _remove_store_probe(self):
+        if self._store_probe is not None:
+            try:
+                os.remove(os.path.join(self.engine.track_store_path, self._store_probe[0]))
+            except OSError:
+                pass
+            self._store_probe = None
+
+    def _start_server(self):
+        kind, target = parse_address(self.address)
+        if kind == "unix":
+            if os.path.exists(target):
+                os.remove(target)  # Left behind by a coordinator that was killed
+            server = _UnixServer(target, _Handler)
+        else:
+            server = _TCPServer(target, _Handler)
+            host, port = server.server_address[:2]
+            self.address = f"{host}:{port}"  # With port 0, the one that was picked
+        server.coordinator = self
+        threading.Thread(target=server.serve_forever, name="coordinator", daemon=True).start()
+        return server
+
+    def _finished(self):
+        if self._error is not None:
+            return True
+        if self.engine.stop_event.is_set():
+            return not self._leases
+        return self._source is None and not self._outstanding
+
+    def _wait(self):
+        stop_deadline = None
+        with self._cond:
+            while not self._finished():
+                self._cond.wait(1.0)
+                self._expire_leases()
+                if self.engine.stop_event.is_set():
+                    # Give the workers one lease period to send the tracks they already downloaded
+                    if stop_deadline is None:
+                        stop_deadline = time.monotonic() + self.lease_seconds
+                    elif time.monotonic() > stop_deadline:
+                        break
+            if self.engine.stop_event.is_set():
+                self.engine.stats.add('cancelled', len(self._outstanding))
+
+    def _expire_leases(self):
+        """Put the jobs of leases that weren't renewed in time back in the queue. Called with the lock held."""
+        now = time.monotonic()
+        for lease in [lease for lease in self._leases.values() if lease.deadline < now]:
+            del self._leases[lease.token]
+            job = lease.job
+            self._expiries[job.track_id] += 1
+            if self._expiries[job.track_id] >= MAX_LEASE_EXPIRIES:
+                del self._outstanding[job.track_id]
+                self.engine.log(f"{job.track_name} was leased {MAX_LEASE_EXPIRIES} times without a result; "
+                                f"giving up on it.\n")
+                self.engine.record_failure(job, f"Lease expired {MAX_LEASE_EXPIRIES} times.")
+                continue
+            self.engine.log(f"Lease of {job.track_name} held by {lease.worker} expired; reassigning it.\n")
+            self._requeue(job)
+
+    def _requeue(self, job):
+        self._outstanding[job.track_id] = None
+        self._requeued.appendleft(job)
+        self._cond.notify_all()
+
+    def fail(self, error):
+        with self._cond:
+            self._error = error
+            self._cond.notify_all()
+
+    def handle(self, message, rfile):
+        """Answer one message from a worker."""
+        op = message.get('op')
+        worker = str(message.get('worker', "?"))
+        if op == "hello":
+            with self._cond:
+                self._workers.add(worker)
+            self.engine.log(f"Worker {worker} connected.\n")
+            probe = self._store_probe
+            return {'op': "ok", 'lease_seconds': self.lease_seconds,
+                    'store_probe': {'name': probe[0], 'token': probe[1]} if probe is not None else None}
+        if op == "lease":
+            return self._lease(worker)
+        if op == "renew":
+            return self._renew(message.get('leases', []))
+        if op == "release":
+            with self._cond:
+                for token in message.get('leases', []):
+                    lease = self._leases.pop(token, None)
+                    if lease is not None:
+                        self._requeue(lease.job)
+            return {'op': "ok"}
+        if op == "result":
+            return self._result(worker, message, rfile)
+        return {'op': "error", 'error': f"unknown op {op!r}"}
+
+    def _lease(self, worker):
+        with self._cond:
+            if self.engine.stop_event.is_set() or self._error is not None:
+                return {'op': "stop"}
+            if self._requeued:
+                job = self._requeued.popleft()
+            else:
+                job = next(self._source, None) if self._source is not None else None
+                if job is None:
+                    self._source = None
+                    self._cond.notify_all()
+                    # Leases still running may expire and need another worker
+                    return {'op': "wait", 'seconds': 1.0} if self._outstanding else {'op': "done"}
+                job.queued_at = time.monotonic()
+            self._next_token += 1
+            token = f"{self._next_token}"
+            self._leases[token] = Lease(token, job, worker, time.monotonic() + self.lease_seconds)
+            self._outstanding[job.track_id] = token
+        return {'op': "job", 'lease': token, 'track_id': job.track_id, 'track_name': job.track_name,
+                'artists': job.artist_names, 'duration': job.duration, 'cover_url': job.cover_url}
+
+    def _renew(self, tokens):
+        with self._cond:
+            deadline = time.monotonic() + self.lease_seconds
+            lost = []
+            for token in tokens:
+                lease = self._leases.get(token)
+                if lease is None:
+                    lost.append(token)
+                else:
+                    lease.deadline = deadline
+            stop = self.engine.stop_event.is_set() or self._error is not None
+        return {'op': "stop" if stop else "ok", 'lost': lost}
+
+    def _take(self, message):
+        """The job a result is for, removed from the outstanding ones; None if it was already finished.
+
+        A result is accepted from any worker that held the track, also after
+        its lease expired: the first one wins, later ones are dropped.
+        """
+        with self._cond:
+            track_id = message.get('track_id')
+            if track_id not in self._outstanding:
+                return None
+            token = self._outstanding.pop(track_id)
+            lease = self._leases.pop(token, None) if token is not None else None
+            if lease is not None:
+                job = lease.job
+            else:
+                job = next(job for job in self._requeued if job.track_id == track_id)
+                self._requeued.remove(job)
+            self._cond.notify_all()
+            return job
+
+    def _result(self, worker, message, rfile):
+        size = message.get('size') or 0
+        job = self._take(message)
+        if job is None:
+            _discard(rfile, size)
+            return {'op': "ok", 'duplicate': True}
+        try:
+            if not message.get('ok'):
+                self.engine.log(f"{worker} failed to download {job.track_name}.\n")
+                self.engine.record_failure(job, message.get('error') or "Failed on a worker.")
+                return {'op': "ok"}
+            extension = os.path.splitext(message.get('file_name', ""))[1]
+            if extension not in AUDIO_EXTENSIONS:
+                extension = ".mp3"
+            job.file_path = os.path.splitext(job.file_path)[0] + extension
+            job.video_id = message.get('video_id')
+            job.timings = message.get('timings')
+            if message.get('stored'):
+                self._link_stored(job, message['sha256'])
+            else:
+                self._receive_file(job, rfile, size, message.get('sha256'))
+        except (ValueError, FileNotFoundError) as e:
+            with self._cond:
+                self._requeue(job)
+            self.engine.log(f"Rejected the file {worker} sent for {job.track_name}: {e}\n")
+            # A stored file we can't find: the worker's store isn't ours after all, so ask for the file itself
+            return {'op': "error", 'error': str(e), 'upload': bool(message.get('stored'))}
+        except OSError:
+            # Includes a connection lost during the upload
+            with self._cond:
+                self._requeue(job)
+            raise
+        self.engine.log(f"Received {job.track_name} from {worker}.\n")
+        self.engine.record_download(job, stored=bool(message.get('stored')))
+        return {'op': "ok"}
+
+    def _receive_file(self, job, rfile, size, sha256):
+        part_path = job.file_path + ".part"
+        digest = hashlib.sha256()
+        try:
+            with open(part_path, 'wb') as f:
+                remaining = size
+                while remaining:
+                    chunk = rfile.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise ConnectionError("connection closed during the upload")
+                    digest.update(chunk)
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            if digest.hexdigest() != sha256:
+                raise ValueError("checksum mismatch")
+            os.replace(part_path, job.file_path)
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+
+    def _link_stored(self, job, sha256):
+        """Link a file the worker put into the shared track store."""
+        store = self.engine.track_store
+        linked = store.link_track(job.track_id, job.file_path) if store is not None else None
+        if linked is None:
+            raise FileNotFoundError(f"{job.track_id} is not in the track store")
+        job.file_path = linked[1]
+        if file_sha256(job.file_path) != sha256:
+            raise ValueError("the stored file doesn't match the worker's hash")
+
+
+def _discard(rfile, size):
+    while size:
+        chunk = rfile.read(min(CHUNK_SIZE, size))
+        if not chunk:
+            return
+        size -= len(chunk)
+
+
+class Worker:
+    """Leases tracks from a coordinator, downloads them with `engine`'s pipeline and sends the results back.
+
+    Tracks are downloaded into `work_dir` (a temporary folder by default) and
+    removed from it once the coordinator has them. At most `max_leases` tracks
+    are held at a time, so one worker can't take the whole export while others
+    sit idle.
+    """
+
+    def __init__(self, engine, address, name=None, work_dir=None, max_leases=None):
+        self.engine = engine
+        self.address = address
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.work_dir = work_dir
+        self.max_leases = max_leases or 2 * engine.max_workers
+        self.lease_seconds = LEASE_SECONDS
+        self.shared_store = False  # True if the coordinator uses the same track store
+        self._local = threading.local()  # One connection per thread, so uploads don't hold up leasing
+        self._connections = []
+        self._lock = threading.Lock()
+        self._leases = {}  # Track ID -> lease token
+        self._slots = threading.BoundedSemaphore(self.max_leases)
+        self._download_dir = None
+        self._run = None
+        self.sent = 0
+
+    def _call(self, message, upload_path=None):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            sock = connect(self.address)
+            sock.settimeout(None)
+            connection = self._local.connection = (sock, sock.makefile('rb'), sock.makefile('wb'))
+            with self._lock:
+                self._connections.append(connection)
+        sock, rfile, wfile = connection
+        try:
+            _send(wfile, dict(message, worker=self.name))
+            if upload_path is not None:
+                with open(upload_path, 'rb') as f:
+                    sock.sendfile(f)
+            return _receive(rfile)
+        except (OSError, ValueError):
+            self._local.connection = None
+            raise
+
+    def run(self):
+        """Work until the coordinator has no more tracks or the run is stopped. Returns DownloadStats."""
+        engine = self.engine
+        engine.stats = DownloadStats()
+        temporary = self.work_dir is None
+        work_dir = self._download_dir = self.work_dir or tempfile.mkdtemp(prefix="spotify-worker-")
+        os.makedirs(work_dir, exist_ok=True)
+        finished = threading.Event()
+        try:
+            reply = self._call({'op': "hello"})
+            self.lease_seconds = reply.get('lease_seconds', LEASE_SECONDS)
+            self.shared_store = self._shares_store(reply.get('store_probe'))
+            engine.log(f"Connected to {self.address} as {self.name}"
+                       f"{' (sharing its track store)' if self.shared_store else ''}.\n")
+            engine.open_shared()
+            self._run = engine.open_playlist(work_dir, engine.stats)
+            engine.on_track_done = self._report
+            threading.Thread(target=self._renew_leases, args=(finished,), name="renew", daemon=True).start()
+            engine.run_jobs(self._lease_jobs())
+            engine.log(f"Sent {self.sent} tracks to the coordinator.\n")
+        except OSError as e:
+            engine.log(f"Lost the connection to the coordinator at {self.address}: {e}\n")
+            engine.stats.error = str(e)
+        finally:
+            finished.set()
+            self._release_leases()
+            engine.on_track_done = None
+            if self._run is not None:
+                engine.close_playlist(self._run)
+                self._run = None
+            engine.close_shared()
+            for sock, rfile, wfile in self._connections:
+                for closeable in (rfile, wfile, sock):
+                    try:
+                        closeable.close()
+                    except OSError:
+                        pass
+            if temporary:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        return engine.stats
+
+    def _shares_store(self, probe):
+        """True if our track store has the probe file the coordinator put into its own."""
+        if not probe or not self.engine.track_store_path:
+            return False
+        try:
+            with open(os.path.join(self.engine.track_store_path, os.path.basename(probe['name'])),
+                      'r', encoding='utf-8') as f:
+                return f.read() == probe['token']
+        except OSError:
+            return False
+
+    def _lease_jobs(self):
+        """Yield the tracks leased from the coordinator, holding at most `max_leases` at once."""
+        stop_event = self.engine.stop_event
+        while not stop_event.is_set():
+            if not self._slots.acquire(timeout=1.0):
+                continue
+            try:
+                reply = self._call({'op': "lease"})
+            except (OSError, ValueError) as e:
+                self._slots.release()
+                self.engine.log(f"Lost the connection to the coordinator: {e}\n")
+                self.engine.stop()
+                return
+            if reply['op'] != "job":
+                self._slots.release()
+                if reply['op'] == "wait":
+                    stop_event.wait(reply.get('seconds', 1.0))
+                    continue
+                if reply['op'] == "stop":
+                    self.engine.log("The coordinator stopped the run.\n")
+                    self.engine.stop()
+                return
+            with self._lock:
+                self._leases[reply['track_id']] = reply['lease']
+            yield TrackJob(reply['track_id'], reply['track_name'], reply['artists'], self._download_dir,
+                           reply.get('duration'), self._run, cover_url=reply.get('cover_url'))
+
+    def _renew_leases(self, finished):
+        """Renew the held leases every third of the lease time until `finished` is set."""
+        while not finished.wait(self.lease_seconds / 3):
+            with self._lock:
+                tokens = list(self._leases.values())
+            try:
+                reply = self._call({'op': "renew", 'leases': tokens})
+            except (OSError, ValueError) as e:
+                self.engine.log(f"Could not renew the leases: {e}\n")
+                continue
+            if reply.get('lost'):
+                self._drop_leases(set(reply['lost']))
+            if reply['op'] == "stop" and not self.engine.stop_event.is_set():
+                self.engine.log("The coordinator stopped the run.\n")
+                self.engine.stop()
+
+    def _drop_leases(self, tokens):
+        """Forget leases the coordinator gave to another worker (ours expired), so their results aren't sent.
+
+        The tracks still finish here, but the slots are free for new leases
+        right away.
+        """
+        with self._lock:
+            lost = [track_id for track_id, token in self._leases.items() if token in tokens]
+            for track_id in lost:
+                del self._leases[track_id]
+        for _ in lost:
+            self._slots.release()
+        if lost:
+            self.engine.log(f"{len(lost)} leases expired before they were renewed; "
+                            f"the coordinator gave their tracks to other workers.\n")
+
+    def _release_leases(self):
+        """Hand the tracks that weren't finished (e.g. after a stop) back to the coordinator right away."""
+        with self._lock:
+            tokens = list(self._leases.values())
+            self._leases.clear()
+        if tokens:
+            try:
+                self._call({'op': "release", 'leases': tokens})
+            except (OSError, ValueError):
+                pass  # The leases expire on their own
+
+    def _report(self, job, error):
+        """Engine callback for a finished or failed track: send the result to the coordinator."""
+        with self._lock:
+            token = self._leases.pop(job.track_id, None)
+        if token is None:
+            if error is None:
+                try:
+                    os.remove(job.file_path)  # Its lease went to another worker
+                except OSError:
+                    pass
+            return
+        self._slots.release()
+        message = {'op': "result", 'lease': token, 'track_id': job.track_id, 'ok': error is None}
+        upload_path = None
+        try:
+            if error is not None:
+                message['error'] = error[-2000:]
+            else:
+                message.update(file_name=os.path.basename(job.file_path), video_id=job.video_id,
+                               timings=job.timings, sha256=file_sha256(job.file_path))
+                if self.shared_store and self.engine.track_store.has_track(job.track_id):
+                    message['stored'] = True
+                else:
+                    message['size'] = os.path.getsize(job.file_path)
+                    upload_path = job.file_path
+            reply = self._call(message, upload_path)
+            if reply['op'] == "error" and reply.get('upload'):
+                self.engine.log("The coordinator doesn't see our track store; uploading the tracks instead.\n")
+                self.shared_store = False
+                del message['stored']
+                message['size'] = os.path.getsize(job.file_path)
+                reply = self._call(message, job.file_path)
+        except (OSError, ValueError) as e:
+            self.engine.log(f"Could not send {job.track_name} to the coordinator: {e}\n")
+            return
+        if reply['op'] == "error":
+            self.engine.log(f"The coordinator rejected {job.track_name}: {reply.get('error')}\n")
+        else:
+            self.sent += 1
+        if error is None:
+            try:
+                os.remove(job.file_path)  # The coordinator has its own copy (or link) now
+            except OSError:
+                pass
@@ -0,0 +1,1476 @@
+"""Download pipeline for Spotify tierlist exports, independent of any GUI."""
+import json, threading, datetime
+import itertools
+import time
+import shutil
+import sqlite3
+import os
+import sys
+
+from journal import DownloadJournal, FailedTracksJournal
+from metrics import PipelineMetrics, write_metrics
+from state_store import StateStore, StoredProbeIndex
+from backends import create_backend, find_download_outputs, yt_dlp_module_available
+from pipeline import Stage, PendingJobs, AdaptiveConcurrency
+from fragments import ConnectionBudget
+from progress import ProgressTracker, format_bytes
+from search_cache import SearchCache, DEFAULT_SEARCH_CACHE
+from art_cache import ArtCache, DEFAULT_ART_CACHE, DEFAULT_ART_CACHE_BYTES
+from track_store import TrackStore, file_sha256
+from sync import SyncSnapshot, TierlistDiff, ARCHIVE_DIRNAME
+from matching import (DEFAULT_CANDIDATES, MIN_MATCH_SCORE, candidates_query, best_candidate, format_duration,
+                      match_settings_key)
+from probe import ProbeIndex, run_ffprobe, summarize_probe
+from transcode import transcode, remux, native_container, AUDIO_EXTENSIONS
+from retry import classify_failure, backoff_delay, TRANSIENT
+from ratelimit import RateLimiter
+from tierlist import iter_tierlist_items, track_fields, track_duration, album_cover_url, TierlistFormatError
+from utils import sanitize_filename
+
+MUSIC_DIR = os.path.expanduser("~/Music")
+FALLBACK_DIR = os.path.expanduser("~/SpotifyDownloader")
+
+
+def playlist_name_from_path(filepath):
+    """Folder name used for a tierlist export, based on its file name."""
+    json_filename_base = os.path.basename(filepath).rsplit('.', 1)[0]
+    return sanitize_filename(json_filename_base)
+
+
+def find_playlist_folders(download_dir):
+    """Return the names of existing folders for a playlist (`name`, `name_1`, ...)."""
+    parent_dir = os.path.dirname(download_dir)
+    base_name = os.path.basename(download_dir)
+    existing_folders = []
+    if os.path.exists(parent_dir):
+        for name in os.listdir(parent_dir):
+            full_path = os.path.join(parent_dir, name)
+            if os.path.isdir(full_path) and (name == base_name or name.startswith(base_name + "_")):
+                existing_folders.append(name)
+    return existing_folders
+
+
+def count_files(folder):
+    try:
+        return len([name for name in os.listdir(folder) if os.path.isfile(os.path.join(folder, name))])
+    except OSError:
+        return 0
+
+
+def new_folder_path(download_dir):
+    """First unused `download_dir_N` path, for the "Create New Folder" choice."""
+    i = 1
+    original_download_dir = download_dir
+    while os.path.exists(download_dir):
+        download_dir = f"{original_download_dir}_{i}"
+        i += 1
+    return download_dir
+
+
+# What partly written files in a playlist folder look like
+PARTIAL_SUFFIXES = ('.part', '.ytdl', '.encoding')
+
+
+def is_partial_file(fname):
+    """True for files left behind by an interrupted fetch or encode."""
+    return fname.endswith(PARTIAL_SUFFIXES) or '.source.' in fname
+
+
+def track_file_stem(track_name, artist_names):
+    """The name (without extension) a track's file gets in its playlist folder."""
+    return f"{sanitize_filename(track_name)} - {sanitize_filename(', '.join(artist_names))}"
+
+
+def file_stem_of(fname):
+    """The `TrackJob.file_stem` a (possibly partial) file in a playlist folder was written for."""
+    for suffix in PARTIAL_SUFFIXES:
+        if fname.endswith(suffix):
+            fname = fname[:-len(suffix)]
+    if '.source.' in fname:
+        return fname.split('.source.', 1)[0]
+    return os.path.splitext(fname)[0]
+
+
+class DownloadStats:
+    """Counters for one `DownloadEngine.download` or `retry_failed` run, or one playlist of a scheduled run.
+
+    With a `parent`, everything counted is also added to the parent (the
+    totals over all playlists).
+    """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.total = 0
+        self.skipped = 0
+        self.downloaded = 0
+        self.failed = 0
+        self.retried = 0
+        self.cancelled = 0
+        self.removed = 0  # Tracks no longer in the export, in sync mode
+        self.unmatched = 0  # Tracks whose best search result didn't look like them (also counted as failed)
+        self.linked = 0
+        self.probed = 0
+        self.probe_cached = 0
+        self.error = None
+        self.track_seconds = []  # Time from entering the pipeline to being recorded, per downloaded track
+        self._lock = threading.Lock()
+
+    def add(self, field, amount=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + amount)
+        if self.parent is not None:
+            self.parent.add(field, amount)
+
+    def add_track_time(self, seconds):
+        with self._lock:
+            self.track_seconds.append(seconds)
+        if self.parent is not None:
+            self.parent.add_track_time(seconds)
+
+
+class PlaylistRun:
+    """One playlist folder during a run: its journals, earlier probe results, counters and pending tracks.
+
+    Every TrackJob points to its PlaylistRun, so one pipeline can serve
+    several playlists at once (see scheduler.py). `on_progress(run)` is
+    called whenever one of its tracks reached a final state and
+    `on_complete(run)` once after the last one, if set.
+    """
+
+    def __init__(self, download_dir, stats):
+        self.download_dir = download_dir
+        self.stats = stats
+        self.journal = None
+        self.failed_journal = None
+        self.failed_ids = set()  # Tracks listed in the failed-tracks journal when the run started
+        self.downloaded_tracks = set()  # Track IDs in the journal (empty with the state database, which is asked instead)
+        self.probe_index = None
+        self.earlier_entries = None  # Downloads from before this run, checked by finish_playlist()
+        self.run_id = None  # Of this playlist's run in the state database
+        self.cancelled = False  # Set by cancel(); its queued tracks are dropped, its transfers killed
+        self.active = set()  # Running transfers
+        self.on_progress = None
+        self.on_complete = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._feeding = True  # More tracks may still be added
+        self._completed = False
+
+    def is_downloaded(self, track_id, state_store):
+        if state_store is not None:
+            return state_store.is_downloaded(track_id, self.download_dir)
+        return track_id in self.downloaded_tracks
+
+    def job_added(self):
+        with self._lock:
+            self._pending += 1
+
+    def job_done(self):
+        with self._lock:
+            self._pending -= 1
+        if self.on_progress is not None:
+            self.on_progress(self)
+        self._check_complete()
+
+    def feeding_done(self):
+        """No more tracks will be added."""
+        with self._lock:
+            self._feeding = False
+        self._check_complete()
+
+    def _check_complete(self):
+        with self._lock:
+            if self._feeding or self._pending > 0 or self._completed:
+                return
+            self._completed = True
+        if self.on_complete is not None:
+            self.on_complete(self)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            transfers = list(self.active)
+        for transfer in transfers:
+            transfer.cancel()
+
+    def add_transfer(self, transfer):
+        """Track a running transfer, so cancel() can kill it; kills it right away if the run is cancelled already."""
+        with self._lock:
+            self.active.add(transfer)
+            cancelled = self.cancelled
+        if cancelled:
+            transfer.cancel()
+
+    def remove_transfer(self, transfer):
+        with self._lock:
+            self.active.discard(transfer)
+
+
+class TrackJob:
+    """One track to fetch into a playlist folder, carried through the pipeline stages."""
+
+    # A job exists for every pending track of an export, so keep them small
+    __slots__ = ('track_id', 'track_name', 'artist_names', 'download_dir', 'search_query', 'file_stem', 'file_path',
+                 'video_id', 'from_cache', 'stalls', 'attempts', 'source_path', 'thumbnail_path', 'queued_at',
+                 'timings', 'duration', 'tier', 'run', 'cover_url', 'cover_path', 'done')
+
+    def __init__(self, track_id, track_name, artist_names, download_dir, duration=None, run=None, tier=None,
+                 cover_url=None):
+        self.track_id = track_id
+        self.track_name = track_name
+        self.artist_names = artist_names
+        self.duration = duration  # Seconds, from the export; used to pick the right search result
+        self.cover_url = cover_url  # Spotify album cover, embedded instead of the video thumbnail
+        self.run = run  # PlaylistRun the track belongs to
+        self.tier = tier  # Name of the tier it's listed in
+        self.download_dir = download_dir
+        # Create a search query from artist and track name
+        base_query = f"{' '.join(artist_names)} - {track_name}" if artist_names else track_name
+        self.search_query = f"ytsearch1:{base_query}"
+        self.file_stem = track_file_stem(track_name, artist_names)
+        self.file_path = os.path.join(download_dir, f"{self.file_stem}.mp3")  # The extension may change in "native" mode
+        self.video_id = None
+        self.from_cache = False
+        self.stalls = 0
+        self.attempts = 0  # Retries after transient failures
+        # What the fetch stage left for the transcode stage
+        self.source_path = None
+        self.thumbnail_path = None
+        self.cover_path = None  # In the art cache; shared with other tracks, so never deleted with the sources
+        self.queued_at = None  # time.monotonic() when the job entered the pipeline
+        self.timings = None  # Seconds spent per stage ({"search": ..., "download": ...}), kept in the journal
+        self.done = False  # Reached a final state; counted out of the pipeline exactly once
+
+    @property
+    def target(self):
+        """What to hand to yt-dlp: the resolved video, or the search itself if unresolved."""
+        if self.video_id:
+            return f"https://www.youtube.com/watch?v={self.video_id}"
+        return self.search_query
+
+
+class DownloadEngine:
+    """Resolves the external tools and downloads every track of a tierlist export.
+
+    `log` receives progress messages and `notify(kind, title, message)` receives
+    the messages a user should see ("info", "warning" or "error"); both may be
+    called from worker threads.
+    """
+
+    def __init__(self, log=None, notify=None, max_workers=8, state_db_path=None, yt_dlp_path=None, backend="auto",
+                 resolve_workers=2, prefetch=32, search_cache_path=DEFAULT_SEARCH_CACHE, probe_workers=None,
+                 stall_timeout=60, max_stall_retries=2, progress_interval=5, transcode_workers=None, adaptive=True,
+                 max_retries=4, retry_base_delay=2.0, search_rate=2.0, media_rate=4.0, track_store_path=None,
+                 output_format="mp3", keep_partial=True, metrics_path=None, on_track_done=None,
+                 match_candidates=DEFAULT_CANDIDATES, min_match_score=MIN_MATCH_SCORE, fragments=1, connections=None,
+                 art_cache_path=DEFAULT_ART_CACHE, art_cache_bytes=DEFAULT_ART_CACHE_BYTES):
+        self._log_sink = log or (lambda message: sys.stdout.write(message))
+        self.notify = notify or (lambda kind, title, message: None)
+        # Optional `on_track_done(job, error)`, called once a track is recorded (error None) or has failed;
+        # distributed.Worker uses it to send results to the coordinator
+        self.on_track_done = on_track_done
+        self.max_workers = max_workers  # Upper limit of concurrent downloads
+        self.adaptive = adaptive  # Size the download pool from observed throughput and errors, up to max_workers
+        # Connections one download may use at once (byte ranges or fragments fetched side by side), and the
+        # total for all downloads; the extra connections only go to tracks while the fetch pool leaves room
+        self.fragments = fragments
+        self.connections = connections or max_workers
+        self.connection_budget = None
+        self.transcode_workers = transcode_workers or os.cpu_count() or 2  # Number of concurrent ffmpeg encodes
+        # "mp3" re-encodes every track; "native" keeps YouTube's opus/AAC audio and only remuxes it (.opus/.m4a)
+        self.output_format = output_format
+        self.resolve_workers = resolve_workers  # Number of concurrent searches
+        # Search results scored per track (see matching.py); 1 takes the first result as it is
+        self.match_candidates = match_candidates
+        self.min_match_score = min_match_score  # Tracks whose best result scores lower are reported, not downloaded
+        self.prefetch = prefetch  # How many resolved tracks may wait for a download worker
+        self.search_cache_path = search_cache_path
+        self.search_cache = None
+        # Album covers, fetched and converted once for all tracks and playlists; None embeds the video thumbnails
+        self.art_cache_path = art_cache_path
+        self.art_cache_bytes = art_cache_bytes
+        self.art_cache = None
+        self.probe_workers = probe_workers or min(8, os.cpu_count() or 2)  # Number of concurrent ffprobe runs
+        self.probe_stage = None
+        self.resolve_stage = None
+        self.transcode_stage = None
+        self.download_stage = None
+        self.fetch_controller = None
+        self.pending = None
+        # Live transfer progress; a transfer without progress for stall_timeout seconds is killed and requeued
+        # (if the backend can abort it, see `aborts_stalled`)
+        self.progress = None
+        self.stall_timeout = stall_timeout
+        self.max_stall_retries = max_stall_retries
+        self.progress_interval = progress_interval
+        # Transient failures (throttling, server and network errors) are retried with exponential backoff
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        # Shared by every worker of every stage, so the pools together stay under YouTube's limits
+        self.rate_limiter = RateLimiter(search_rate, media_rate)
+        self.state_db_path = state_db_path
+        # Optional store shared by all playlist folders; tracks already in it are linked instead of downloaded
+        self.track_store_path = track_store_path
+        self.track_store = None
+        self.yt_dlp_cmd = [yt_dlp_path] if yt_dlp_path else None
+        self.backend_kind = backend  # "auto", "in-process" or "subprocess"
+        self.backend = None
+        self.ffprobe_exe_path = None
+        self.ffmpeg_exe_path = None # Used by the transcode stage
+        self.stop_event = threading.Event()
+        # Keep the .part files of downloads cancelled by stop(), so yt-dlp resumes them on the next run
+        self.keep_partial = keep_partial
+        self.run = None  # PlaylistRun of a single-playlist run
+        self.state_store = None
+        self.stats = None
+        # Stage timings and byte counters of the current run, and of all finished runs for the metrics file
+        self.run_metrics = None
+        self.metrics = PipelineMetrics()
+        self.metrics_path = metrics_path  # Written as .json and .prom during and after every run
+
+    def log(self, message):
+        started = time.perf_counter()
+        self._log_sink(message)
+        if self.run_metrics is not None:
+            self.run_metrics.time('log', time.perf_counter() - started)
+
+    def _record_time(self, job, stage, started):
+        """Count the time since `started` (time.perf_counter()) towards `stage`, for the run and for the track."""
+        seconds = time.perf_counter() - started
+        if self.run_metrics is not None:
+            self.run_metrics.time(stage, seconds)
+        if job is not None:
+            if job.timings is None:
+                job.timings = {}
+            # Retries add up
+            job.timings[stage] = round(job.timings.get(stage, 0) + seconds, 3)
+
+    def _count_bytes(self, counter, path):
+        if self.run_metrics is not None and path:
+            try:
+                self.run_metrics.count(counter, os.path.getsize(path))
+            except OSError:
+                pass
+
+    def reset_stop(self):
+        """Let runs start again after stop(), e.g. when the GUI starts another download."""
+        self.stop_event.clear()
+
+    def stop(self):
+        """Cancel the running download: drop queued tracks and kill running transfers.
+
+        Tracks that were already downloaded are still encoded and recorded, so
+        the next run doesn't fetch them again. May be called from any thread.
+        """
+        self.stop_event.set()
+        for stage in (self.resolve_stage, self.download_stage):
+            if stage is not None:
+                # Don't sit out the backoff of tracks waiting for a retry; they see the stop flag and drop out
+                stage.release_delayed()
+                for job in stage.clear():
+                    self._drop_cancelled(job)
+        progress = self.progress
+        if progress is not None:
+            for transfer in progress.active():
+                transfer.cancel()
+
+    def _cancel_download(self, job, output_template):
+        """Drop a download that stop() or a cancelled playlist interrupted, keeping its partial file for resuming
+        unless told not to."""
+        if not self.keep_partial:
+            prefix = os.path.basename(output_template).split('%(', 1)[0]
+            with os.scandir(job.download_dir) as entries:
+                leftovers = [entry.path for entry in entries if entry.name.startswith(prefix)]
+            for path in leftovers:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        self.log(f"Cancelled download of {job.track_name}.\n")
+        self._drop_cancelled(job)
+
+    def locate_tools(self):
+        """Find yt-dlp, ffmpeg and ffprobe. Returns False (after notifying) if one is missing."""
+        in_process = self.backend_kind == "in-process" or (
+            self.backend_kind == "auto" and self.yt_dlp_cmd is None and yt_dlp_module_available())
+        if in_process and not yt_dlp_module_available():
+            self.notify("error", "yt-dlp Missing", "The in-process backend needs the yt_dlp Python package. Please install it (pip install yt-dlp).")
+            return False
+        # --- Determine paths for bundled executables (yt-dlp, ffmpeg, ffprobe) ---
+        if getattr(sys, 'frozen', False): # Running as a PyInstaller bundle
+            # sys._MEIPASS points to the temp extraction folder
+            base_temp_path = sys._MEIPASS
+            self.ffprobe_exe_path = os.path.join(base_temp_path, "ffprobe.exe")
+            self.ffmpeg_exe_path = os.path.join(base_temp_path, "ffmpeg.exe")
+            if self.yt_dlp_cmd is None and not in_process:
+                yt_dlp_executable = "yt-dlp.exe" # Assume yt-dlp is also bundled
+                # If yt-dlp is not bundled, it needs to be in PATH or explicitly added via --add-binary
+                yt_dlp_path = os.path.join(base_temp_path, yt_dlp_executable)
+                if not os.path.exists(yt_dlp_path):
+                    # Fallback: if yt-dlp.exe isn't found in _MEIPASS, check system PATH
+                    yt_dlp_path = shutil.which("yt-dlp")
+                    if not yt_dlp_path:
+                        self.notify("error", "yt-dlp Missing", "yt-dlp.exe not found. Please ensure it's bundled or in your system PATH.")
+                        return False
+                self.yt_dlp_cmd = [yt_dlp_path]
+
+        else: # Not bundled (running directly from Python)
+            if self.yt_dlp_cmd is None and not in_process:
+                yt_dlp_path = shutil.which("yt-dlp")
+                if yt_dlp_path:
+                    self.yt_dlp_cmd = [yt_dlp_path]
+                else:
+                    try:
+                        import yt_dlp # noqa: F401 - only checking that the pip module exists
+                        self.yt_dlp_cmd = [sys.executable, "-m", "yt_dlp"] # For pip installed module
+                    except ImportError:
+                        self.notify("error", "yt-dlp Missing", "yt-dlp not found in system PATH. Please install it.")
+                        return False
+
+            self.ffprobe_exe_path = shutil.which("ffprobe")
+            self.ffmpeg_exe_path = shutil.which("ffmpeg")
+
+        if not self.ffprobe_exe_path:
+            self.notify("error", "FFprobe Missing", "ffprobe.exe not found. Please ensure FFmpeg is installed and its 'bin' directory is added to your system's PATH, or correctly bundled.")
+            return False
+        if not self.ffmpeg_exe_path:
+            self.notify("error", "FFmpeg Missing", "ffmpeg.exe not found. Please ensure FFmpeg is installed and its 'bin' directory is added to your system's PATH, or correctly bundled.")
+            return False
+
+        self.backend = create_backend("in-process" if in_process else "subprocess", self.yt_dlp_cmd, write_thumbnail=True,
+                                      socket_timeout=self.stall_timeout)
+        if in_process:
+            self.log("Using yt-dlp in-process (one YoutubeDL instance per worker)\n")
+            if self.stall_timeout:
+                # Stalled in-process transfers can't be killed; yt-dlp's reads time out instead
+                self.log(f"Downloads give up on a connection after {self.stall_timeout:g}s without data; "
+                         f"use --backend subprocess to kill and requeue stalled downloads.\n")
+        else:
+            self.log(f"Using yt-dlp from: {' '.join(self.yt_dlp_cmd)}\n")
+        self.log(f"Using ffprobe from: {self.ffprobe_exe_path}\n")
+        return True
+
+    def default_download_dir(self, filepath, out_dir=None):
+        """Folder a tierlist export downloads into: `<out_dir or ~/Music>/<playlist name>`."""
+        playlist_folder_name = playlist_name_from_path(filepath)
+        try:
+            download_dir = os.path.join(out_dir or MUSIC_DIR, playlist_folder_name)
+            os.makedirs(download_dir, exist_ok=True)
+        except OSError:
+            if out_dir:
+                raise
+            self.log("Could not create directory in Music folder. Falling back to SpotifyDownloader in user directory.\n")
+            download_dir = os.path.join(FALLBACK_DIR, playlist_folder_name)
+            self.notify("warning", "Directory Fallback", "Could not create directory in Music folder. Falling back to SpotifyDownloader in user directory.")
+            os.makedirs(download_dir, exist_ok=True)
+        return download_dir
+
+    def find_incomplete_downloads(self, download_dir):
+        """Return (partial files, audio files missing from the journal) in a playlist folder.
+
+        One directory scan; each audio file is checked against the file names
+        of the tracks in the journal, from their names and artists (entries
+        migrated from download_log.json have no `file_path`) and from their
+        recorded `file_path`.
+        """
+        logged_stems = set()
+        for entry in DownloadJournal(download_dir):
+            if isinstance(entry.get('track_name'), str):
+                logged_stems.add(track_file_stem(entry['track_name'], entry.get('artists') or []))
+            if entry.get('file_path'):
+                logged_stems.add(file_stem_of(os.path.basename(entry['file_path'])))
+        orphaned_files = []
+        orphaned_tracks = []
+        with os.scandir(download_dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                if is_partial_file(entry.name):
+                    orphaned_files.append(entry.name)
+                elif entry.name.lower().endswith(AUDIO_EXTENSIONS) and file_stem_of(entry.name) not in logged_stems:
+                    orphaned_tracks.append(entry.name)
+        return sorted(orphaned_files), sorted(orphaned_tracks)
+
+    def redownload_orphaned_tracks(self, filepath, download_dir, orphaned_files, orphaned_tracks):
+        """Download the tracks of partial and unlogged files again. Returns DownloadStats.
+
+        Partial files are removed first, except downloads yt-dlp can resume
+        (see `keep_partial`). Files are matched to tracks of the export by the
+        file name a track is saved under, and the downloads run through the
+        normal pipeline.
+        """
+        self.stats = DownloadStats()
+        # Remove orphaned partial files, except downloads yt-dlp can resume
+        for fname in orphaned_files:
+            if self.keep_partial and fname.endswith(('.part', '.ytdl')):
+                continue
+            try:
+                os.remove(os.path.join(download_dir, fname))
+            except OSError:
+                pass
+        try:
+            run = self._open_run(download_dir)
+            # Index from the file name each track is saved under to the track
+            expected = {}
+            with open(filepath, 'r', encoding='utf-8') as f:
+                for tier_name, item in iter_tierlist_items(f):
+                    fields = track_fields(item)
+                    if fields is None:
+                        continue
+                    track_id, track_name, artist_names = fields
+                    job = TrackJob(track_id, track_name, artist_names, download_dir, track_duration(item), run,
+                                   tier_name, album_cover_url(item))
+                    expected[job.file_stem] = job
+
+            jobs = {}
+            for fname in list(orphaned_tracks) + list(orphaned_files):
+                job = expected.get(file_stem_of(fname))
+                if job is None:
+                    if fname in orphaned_tracks:
+                        self.log(f"{fname} doesn't belong to any track of {os.path.basename(filepath)}; leaving it alone.\n")
+                    continue
+                if run.is_downloaded(job.track_id, self.state_store):
+                    continue
+                jobs[job.track_id] = job
+            self.stats.total = len(jobs)
+            if jobs:
+                self.log(f"Downloading {len(jobs)} incomplete tracks again...\n")
+                self.run_jobs(list(jobs.values()))
+            self._finish_run(run)
+        except Exception as e:
+            err_msg = str(e)
+            self.log(f"An unexpected error occurred: {err_msg}\n")
+            self.notify("error", "Error", err_msg)
+            self.stats.error = err_msg
+        finally:
+            self._close_run()
+        return self.stats
+
+    def record_failure(self, job, error):
+        run = job.run
+        if self.state_store is not None:
+            self.state_store.record_failure(job.track_id, job.download_dir, job.track_name, job.artist_names,
+                                            job.search_query, error[-2000:], run.run_id)
+        if run.failed_journal is not None and not self._cancelled(job):
+            run.failed_journal.append({
+                'track_id': job.track_id,
+                'track_name': job.track_name,
+                'artists': job.artist_names,
+                'search_query': job.search_query,
+                'video_id': job.video_id,
+                'duration': job.duration,
+                'cover_url': job.cover_url,
+                'error': error[-2000:],
+                'kind': classify_failure(error),
+                'attempts': job.attempts + 1,
+                'failed_at': datetime.datetime.now().isoformat(),
+            })
+        run.stats.add('failed')
+        if self.on_track_done is not None:
+            self.on_track_done(job, error)
+
+    def _retry_later(self, job, error, stage):
+        """Requeue `job` on `stage` after a backoff if `error` looks transient; returns True if it was requeued."""
+        if stage is None or self._cancelled(job) or job.attempts >= self.max_retries:
+            return False
+        if classify_failure(error) != TRANSIENT:
+            return False
+        job.attempts += 1
+        delay = backoff_delay(job.attempts, self.retry_base_delay)
+        self.log(f"Temporary error for {job.track_name}; retrying in {delay:.0f}s "
+                 f"(retry {job.attempts} of {self.max_retries}).\n")
+        job.run.stats.add('retried')
+        stage.put_later(job, delay)
+        return True
+
+    def _cancelled(self, job):
+        """True if the run was stopped or the job's playlist cancelled."""
+        return self.stop_event.is_set() or job.run.cancelled
+
+    def _drop_cancelled(self, job):
+        """Let go of a job because the run is being stopped (or its playlist cancelled)."""
+        job.run.stats.add('cancelled')
+        self._job_done(job)
+
+    def _job_done(self, job):
+        """Mark a job as finished (downloaded, failed or dropped) for the running pipeline."""
+        if job.done:
+            return
+        job.done = True
+        job.run.job_done()
+        if self.pending is not None:
+            self.pending.done()
+
+    def _match_key(self):
+        return match_settings_key(self.match_candidates, self.min_match_score)
+
+    def _report_request(self, kind, error):
+        """Tell the rate limiter how a request went, so it backs off when YouTube answers with 429."""
+        if self.rate_limiter.report(kind, error):
+            rate = self.rate_limiter.current_rate(kind)
+            self.log(f"YouTube is throttling {kind} requests"
+                     f"{f'; slowing down to {rate:.2f}/s' if rate else ''}.\n")
+
+    def _link_from_store(self, job):
+        """Fill in a track from the track store instead of downloading it; returns True if it was stored."""
+        try:
+            linked = self.track_store.link_track(job.track_id, job.file_path)
+        except (sqlite3.Error, OSError) as e:
+            # e.g. the store's database locked by another process; download the track as if it weren't stored
+            self.log(f"WARNING: could not link {job.track_name} from the track store: {e}\n")
+            return False
+        if linked is None:
+            return False
+        method, job.file_path = linked
+        self.log(f"Linked from track store ({method}): {job.track_name}\n")
+        job.run.stats.add('linked')
+        if self.probe_stage is not None:
+            self.probe_stage.put(job)
+        else:
+            self._finish_track(job)
+        return True
+
+    def _resolve_track(self, job):
+        """Resolve stage: map the track to a video ID (cached when possible), then queue the download."""
+        if self._cancelled(job):
+            self._drop_cancelled(job)
+            return
+        if self.track_store is not None and self._link_from_store(job):
+            return
+        video_id = None
+        if self.search_cache is not None:
+            try:
+                video_id = self.search_cache.get(job.track_id, self._match_key())
+            except sqlite3.Error as e:
+                self.log(f"WARNING: search cache lookup failed for {job.track_name}, searching instead: {e}\n")
+        if video_id:
+            job.from_cache = True
+        else:
+            if not self.rate_limiter.acquire("search", self.stop_event):
+                self._drop_cancelled(job)
+                return
+            self.log(f"Searching for: {job.search_query}\n")
+            started = time.perf_counter()
+            candidate = None
+            try:
+                if self.match_candidates > 1:
+                    # One request for the metadata of several results; only the best one gets downloaded
+                    candidates, error = self.backend.search(candidates_query(job.search_query, self.match_candidates))
+                    candidate, score = best_candidate(candidates, job.track_name, job.artist_names, job.duration)
+                    video_id = candidate['id'] if candidate is not None else None
+                else:
+                    video_id, error = self.backend.resolve(job.search_query)
+            except Exception as e:
+                video_id, error = None, str(e)
+            self._record_time(job, 'search', started)
+            if not video_id and self._cancelled(job):
+                self._drop_cancelled(job)
+                return
+            self._report_request("search", None if video_id else error)
+            if not video_id:
+                if self._retry_later(job, error, self.resolve_stage):
+                    return
+                self.log(f"No video found for {job.track_name}:\n{error}\n")
+                self.record_failure(job, error)
+                self._job_done(job)
+                return
+            if candidate is not None:
+                if score < self.min_match_score:
+                    self._report_unmatched(job, candidate, score)
+                    return
+                rank = candidates.index(candidate)
+                if rank:
+                    self.log(f"Picked search result {rank + 1} of {len(candidates)} for {job.track_name}: "
+                             f"{candidate.get('title')} ({format_duration(candidate.get('duration'))}, "
+                             f"score {score:.2f})\n")
+            if self.search_cache is not None:
+                try:
+                    self.search_cache.put(job.track_id, job.search_query, video_id, self._match_key())
+                except sqlite3.Error as e:
+                    self.log(f"WARNING: could not cache the search result for {job.track_name}: {e}\n")
+        job.video_id = video_id
+        # Blocks while the download queue is full, so the resolver stays a bounded distance ahead
+        self.download_stage.put(job)
+
+    def _report_unmatched(self, job, candidate, score):
+        """Record a track whose best search result is probably another version (live, cover, loop...)."""
+        message = (f"Low-confidence match (score {score:.2f} < {self.min_match_score:.2f}): best result "
+                   f"\"{candidate.get('title')}\" ({format_duration(candidate.get('duration'))}, track is "
+                   f"{format_duration(job.duration)}) https://www.youtube.com/watch?v={candidate['id']}")
+        self.log(f"Not downloading {job.track_name}. {message}\n")
+        job.run.stats.add('unmatched')
+        self.record_failure(job, message)
+        self._job_done(job)
+
+    def _download_track(self, job):
+        """Fetch stage: download the track's audio stream and thumbnail, then hand them to the transcode stage."""
+        if self._cancelled(job):
+            self._drop_cancelled(job)
+            return
+        output_template = os.path.join(job.download_dir, f"{job.file_stem}.source.%(ext)s")
+        if job.cover_url and job.cover_path is None and self.art_cache is not None:
+            started = time.perf_counter()
+            try:
+                job.cover_path, error = self.art_cache.get(job.cover_url)
+            except (sqlite3.Error, OSError) as e:
+                # e.g. the cache database locked by another process; the video thumbnail is embedded instead
+                job.cover_path, error = None, str(e)
+            self._record_time(job, 'cover', started)
+            if job.cover_path is None:
+                self.log(f"WARNING: no album cover for {job.track_name}, embedding the video thumbnail: {error}\n")
+        if not self.rate_limiter.acquire("media", self.stop_event):
+            self._drop_cancelled(job)
+            return
+        connections = 1
+        if self.connection_budget is not None:
+            connections = self.connection_budget.acquire(self.fragments, self.stop_event)
+            if not connections:
+                self._drop_cancelled(job)
+                return
+        transfer = self.progress.start(job.track_name) if self.progress is not None else None
+        if transfer is not None:
+            job.run.add_transfer(transfer)  # Also kills it if the run was cancelled since the check above
+
+        try:
+            started = time.perf_counter()
+            try:
+                success, stderr = self.backend.download(job.target, output_template, transfer, connections,
+                                                        thumbnail=job.cover_path is None)
+            finally:
+                if self.connection_budget is not None:
+                    self.connection_budget.release(connections)
+                if transfer is not None:
+                    self.progress.finish(transfer)
+                    job.run.remove_transfer(transfer)
+                self._record_time(job, 'download', started)
+            if not success and self._cancelled(job):
+                # Killed by stop() or cancel(); not a failure of the track
+                self._cancel_download(job, output_template)
+                return
+            self._report_request("media", None if success else stderr)
+
+            if transfer is not None and transfer.stalled and not self._cancelled(job):
+                job.stalls += 1
+                if self.fetch_controller is not None:
+                    self.fetch_controller.record(False)
+                if job.stalls <= self.max_stall_retries and self.download_stage is not None:
+                    self.log(f"Download of {job.track_name} stalled; requeueing it (retry {job.stalls} of {self.max_stall_retries}).\n")
+                    self.download_stage.put_later(job, 0)
+                    return
+                success, stderr = False, f"Transfer stalled for {self.stall_timeout}s.\n{stderr}"
+            elif self.fetch_controller is not None and not self.stop_event.is_set():
+                self.fetch_controller.record(success)
+
+            if success:
+                job.source_path, job.thumbnail_path = find_download_outputs(output_template)
+                if job.source_path is None:
+                    success, stderr = False, f"yt-dlp reported success but no file matching {output_template} was found.\n{stderr}"
+                self._count_bytes('bytes_downloaded', job.source_path)
+
+            if success:
+                self.log(f"Successfully downloaded: {job.track_name}\n")
+                # Even when stopping, finish the track: it's downloaded already, and recording it
+                # spares the next run the download
+                if self.transcode_stage is not None:
+                    self.transcode_stage.put(job)
+                else:
+                    self._transcode_track(job)
+
+            else:
+                if self._retry_later(job, stderr, self.download_stage):
+                    return
+                self.log(f"Error downloading {job.track_name}. yt-dlp stderr:\n{stderr}\n")
+                if job.from_cache and self.search_cache is not None:
+                    # The cached video may have been taken down; search again next time
+                    try:
+                        self.search_cache.invalidate(job.track_id)
+                    except sqlite3.Error as e:
+                        self.log(f"WARNING: could not drop the cached search result for {job.track_name}: {e}\n")
+                self.record_failure(job, stderr)
+                self._job_done(job)
+
+        except Exception as e:
+            self.log(f"Exception while downloading {job.track_name}: {e}\n")
+            self.record_failure(job, str(e))
+            self._job_done(job)
+
+    def _remove_sources(self, job):
+        for path in (job.source_path, job.thumbnail_path):
+            if path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        job.source_path = job.thumbnail_path = None
+
+    def _source_container(self, source_path):
+        """(extension, muxer) that keeps the fetched audio's codec, or None if it has to be encoded to mp3."""
+        info, error = run_ffprobe(self.ffprobe_exe_path, source_path)
+        if info is None:
+            self.log(f"WARNING: ffprobe failed for {os.path.basename(source_path)}, encoding it to mp3: {error}\n")
+            return None
+        codec = next((stream.get('codec_name') for stream in info.get('streams', [])
+                      if stream.get('codec_type') == 'audio'), None)
+        container = native_container(codec)
+        if container is None:
+            self.log(f"No container for {codec} audio in {os.path.basename(source_path)}, encoding it to mp3.\n")
+        return container
+
+    def _transcode_track(self, job):
+        """Transcode stage: encode (or in "native" mode remux) the fetched audio with tags and cover art,
+        then hand it to the probe stage."""
+        try:
+            metadata = {
+                'title': job.track_name,
+                'artist': ', '.join(job.artist_names),
+                'comment': f"https://www.youtube.com/watch?v={job.video_id}" if job.video_id else None,
+            }
+            container = None
+            if self.output_format == "native":
+                started = time.perf_counter()
+                container = self._source_container(job.source_path)
+                self._record_time(job, 'probe', started)
+            # Includes embedding the cover art, which happens in the same ffmpeg run
+            started = time.perf_counter()
+            if container is not None:
+                extension, muxer = container
+                job.file_path = os.path.join(job.download_dir, job.file_stem + extension)
+                success, stderr = remux(self.ffmpeg_exe_path, job.source_path, job.file_path, muxer, metadata,
+                                        job.cover_path or job.thumbnail_path)
+            else:
+                success, stderr = transcode(self.ffmpeg_exe_path, job.source_path, job.file_path, metadata,
+                                            job.cover_path or job.thumbnail_path)
+            self._record_time(job, 'encode', started)
+        except Exception as e:
+            success, stderr = False, str(e)
+        self._remove_sources(job)
+        if not success:
+            self.log(f"Error converting {job.track_name}. ffmpeg stderr:\n{stderr}\n")
+            self.record_failure(job, stderr)
+            self._job_done(job)
+            return
+        self.record_download(job)
+
+    def record_download(self, job, stored=False):
+        """Record a track whose file is in place (encoded here, or sent by a worker).
+
+        Adds it to the track store unless it was `stored` there already, then
+        probes it and writes it to the journal.
+        """
+        self._count_bytes('bytes_written', job.file_path)
+        if self.track_store is not None and not stored:
+            try:
+                self.track_store.add(job.track_id, job.file_path)
+            except (sqlite3.Error, OSError) as e:
+                self.log(f"WARNING: could not add {job.track_name} to the track store: {e}\n")
+        if self.probe_stage is not None:
+            self.probe_stage.put(job)
+        else:
+            self._finish_track(job)
+
+    def _probe(self, run, path):
+        """Return the probe summary for a file of `run`'s folder, from the journal when the file is unchanged."""
+        try:
+            stat_result = os.stat(path)
+        except OSError as e:
+            self.log(f"WARNING: cannot probe {os.path.basename(path)}: {e}\n")
+            return None
+        probe = run.probe_index.lookup(path, stat_result)
+        if probe is not None:
+            run.stats.add('probe_cached')
+            return probe
+        if not self.ffprobe_exe_path:
+            return None
+        info, error = run_ffprobe(self.ffprobe_exe_path, path)
+        if info is None:
+            self.log(f"WARNING: ffprobe failed for {os.path.basename(path)}: {error}\n")
+            return None
+        probe = summarize_probe(info, stat_result)
+        run.stats.add('probed')
+        if probe['duration']:
+            self.log(f"Probed {os.path.basename(path)}: duration={probe['duration']:.2f}s\n")
+        else:
+            self.log(f"Probed {os.path.basename(path)}: duration not found.\n")
+        return probe
+
+    def _finish_track(self, job):
+        """Probe stage: verify a downloaded file with ffprobe and record it in the journal."""
+        run = job.run
+        try:
+            started = time.perf_counter()
+            probe = self._probe(run, job.file_path)
+            self._record_time(job, 'probe', started)
+            # --- Log successful download ---
+            new_entry = {
+                'track_id': job.track_id,
+                'track_name': job.track_name,
+                'artists': job.artist_names,
+                'search_query': job.search_query,
+                'video_id': job.video_id,
+                'file_path': job.file_path,
+                'downloaded_at': datetime.datetime.now().isoformat(),
+                'probe': probe,
+                'timings': job.timings,
+            }
+
+            started = time.perf_counter()
+            run.journal.append(new_entry)
+            run.probe_index.add(new_entry)
+            if self.state_store is not None:
+                self.state_store.record_download(job.track_id, job.download_dir, job.track_name, job.artist_names,
+                                                 job.search_query, job.file_path, run.run_id, new_entry['probe'])
+            if job.track_id in run.failed_ids:
+                run.failed_journal.mark_resolved(job.track_id)
+            self._record_time(None, 'journal', started)
+            run.stats.add('downloaded')
+            if job.queued_at is not None:
+                seconds = time.monotonic() - job.queued_at
+                run.stats.add_track_time(seconds)
+                if self.run_metrics is not None:
+                    self.run_metrics.time('track', seconds)
+            if self.on_track_done is not None:
+                self.on_track_done(job, None)
+        except Exception as e:
+            self.log(f"Exception while recording {job.track_name}: {e}\n")
+            self.record_failure(job, str(e))
+        finally:
+            self._job_done(job)
+
+    def _reprobe_entry(self, run, entry):
+        """Probe a file from an earlier run whose stored probe result is missing or stale."""
+        probe = self._probe(run, entry['file_path'])
+        if probe is None:
+            return
+        updated = dict(entry, probe=probe)
+        run.journal.append(updated)
+        if self.state_store is not None and updated.get('track_id'):
+            self.state_store.record_probe(updated['track_id'], run.download_dir, probe)
+
+    def _on_stage_error(self, job, e):
+        """A stage handler raised: fail the track, so the pipeline doesn't wait for it forever."""
+        self.log(f"Error in {threading.current_thread().name} thread: {e}\n")
+        if not isinstance(job, TrackJob) or job.done:
+            return  # Reprobe entries aren't counted as pending
+        try:
+            self._remove_sources(job)
+            self.record_failure(job, f"Internal error: {e}")
+        except Exception as record_error:
+            self.log(f"Could not record the failure of {job.track_name}: {record_error}\n")
+            job.run.stats.add('failed')
+        finally:
+            self._job_done(job)
+
+    def _watch_transfers(self, finished):
+        """Report live progress, restart stalled transfers and size the fetch pool until `finished` is set."""
+        last_report = time.monotonic()
+        while not finished.wait(1.0):
+            if self.backend.aborts_stalled:
+                for transfer in self.progress.stalled(self.stall_timeout):
+                    self.log(f"No progress on {transfer.label} for {self.stall_timeout:g}s, killing the transfer.\n")
+                    transfer.cancel_stalled()
+            if self.fetch_controller is not None:
+                change = self.fetch_controller.adjust()
+                if change is not None and change[0] != change[1]:
+                    old, new, rate, error_rate = change
+                    self.log(f"Download pool: {old} -> {new} workers ({format_bytes(rate)}/s, "
+                             f"{100 * error_rate:.0f}% errors)\n")
+            now = time.monotonic()
+            if now - last_report >= self.progress_interval:
+                last_report = now
+                self._export_metrics()
+                active = self.progress.active()
+                if active:
+                    self.log(f"Throughput: {format_bytes(self.progress.current_speed())}/s now, "
+                             f"{format_bytes(self.progress.average_speed())}/s average, {len(active)} active downloads\n")
+                    for transfer in active:
+                        self.log(f"  {transfer.describe()}\n")
+
+    def run_jobs(self, jobs):
+        """Run jobs through the resolve, fetch, transcode and probe stages.
+
+        Each stage has its own worker pool; the queues between them are
+        bounded by `prefetch`, so searches run ahead of downloads without
+        resolving the whole playlist up front, and files are encoded and
+        verified as soon as they finish downloading. The network-bound fetch
+        pool is sized adaptively (up to `max_workers`) while the CPU-bound
+        transcode pool stays at `transcode_workers`. Stalled downloads and
+        transient failures are requeued, so the stages are only shut down once
+        every job reached a final state.
+        """
+        self.pending = PendingJobs()
+        self.progress = ProgressTracker()
+        finished = threading.Event()
+
+        self.probe_stage = Stage("probe", self._finish_track, self.probe_workers,
+                                 maxsize=self.prefetch, on_error=self._on_stage_error).start()
+        self.transcode_stage = Stage("transcode", self._transcode_track, self.transcode_workers,
+                                     maxsize=self.prefetch, on_error=self._on_stage_error).start()
+        fetch_workers = min(self.max_workers, max(2, self.max_workers // 2)) if self.adaptive else self.max_workers
+        self.download_stage = Stage("fetch", self._download_track, fetch_workers,
+                                    maxsize=self.prefetch, on_error=self._on_stage_error).start()
+        if self.adaptive and self.max_workers > 1:
+            self.fetch_controller = AdaptiveConcurrency(self.download_stage, 1, self.max_workers,
+                                                        self.progress.total_bytes)
+        if self.fragments > 1:
+            self.connection_budget = ConnectionBudget(self.connections)
+        self.log(f"Using {fetch_workers} download workers"
+                 f"{f' (adaptive, up to {self.max_workers})' if self.fetch_controller is not None else ''} "
+                 f"and {self.transcode_workers} encode workers.\n")
+        if self.connection_budget is not None:
+            self.log(f"Downloads use up to {self.fragments} connections each, {self.connections} in total.\n")
+        watcher = threading.Thread(target=self._watch_transfers, args=(finished,), name="progress", daemon=True)
+        watcher.start()
+        self.resolve_stage = Stage("resolve", self._resolve_track, self.resolve_workers,
+                                   maxsize=self.prefetch, on_error=self._on_stage_error).start()
+        try:
+            # `jobs` may be a generator reading the export; put() blocks while the resolve queue is full,
+            # so it is only read as fast as the pipeline takes the tracks
+            for job in jobs:
+                if self.stop_event.is_set():
+                    job.run.stats.add('cancelled')
+                    break
+                self.pending.add()
+                job.run.job_added()
+                job.queued_at = time.monotonic()
+                self.resolve_stage.put(job)
+        finally:
+            # Even if reading the jobs failed, let the ones already queued finish before shutting down
+            self.pending.wait()
+            finished.set()
+            watcher.join()
+            for stage in (self.resolve_stage, self.download_stage, self.transcode_stage, self.probe_stage):
+                stage.close()
+                stage.join()
+            self.log(f"Transferred {format_bytes(self.progress.total_bytes())} "
+                     f"({format_bytes(self.progress.average_speed())}/s average).\n")
+            self.resolve_stage = self.download_stage = self.transcode_stage = self.probe_stage = None
+            self.fetch_controller = None
+            self.connection_budget = None
+            self.pending = None
+            self.progress = None
+
+    def _adopt_into_store(self, download_dir, earlier_entries):
+        """Add files downloaded before the track store was used, so other playlists can link to them."""
+        adopted = 0
+        for entry in earlier_entries:
+            track_id = entry.get('track_id')
+            path = os.path.join(download_dir, os.path.basename(entry['file_path']))
+            if not track_id or os.path.islink(path) or not os.path.isfile(path):
+                continue
+            try:
+                if self.track_store.has_track(track_id):
+                    continue
+                self.track_store.add(track_id, path)
+                adopted += 1
+            except (sqlite3.Error, OSError) as e:
+                self.log(f"WARNING: could not add {os.path.basename(path)} to the track store: {e}\n")
+        if adopted:
+            self.log(f"Added {adopted} files from earlier runs to the track store.\n")
+
+    def _reprobe_stale_files(self, run, earlier_entries):
+        """Probe files from earlier runs that have no (or an outdated) probe result, in parallel."""
+        stale = []
+        for entry in earlier_entries:
+            path = os.path.join(run.download_dir, os.path.basename(entry['file_path']))
+            try:
+                stat_result = os.stat(path)
+            except OSError:
+                continue
+            if run.probe_index.lookup(path, stat_result) is None:
+                stale.append(dict(entry, file_path=path))
+            else:
+                run.stats.add('probe_cached')
+        if not stale or not self.ffprobe_exe_path:
+            return
+        self.log(f"Probing {len(stale)} files from earlier runs...\n")
+        stage = Stage("reprobe", lambda entry: self._reprobe_entry(run, entry), self.probe_workers,
+                      on_error=self._on_stage_error).start()
+        for entry in stale:
+            stage.put(entry)
+        stage.close()
+        stage.join()
+
+    def download(self, filepath, download_dir):
+        """Download every track of `filepath` that isn't in `download_dir` yet. Returns DownloadStats."""
+        self.stats = DownloadStats()
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                run = self._open_run(download_dir)
+                if run.downloaded_tracks:
+                    self.log(f"Loaded {len(run.downloaded_tracks)} entries from download log.\n")
+
+                # The export is read incrementally and its tracks are fed to the pipeline as they are
+                # found, so the first download starts right away and huge exports aren't held in memory
+                jobs = self.new_tracks(f, run)
+                first_job = next(jobs, None)
+                if first_job is None:
+                    self.log_track_counts()
+                    if self.track_store is not None:
+                        self._adopt_into_store(download_dir, run.earlier_entries)
+                    self.log("No new tracks to download.\n")
+                    self.notify("info", "All Done", "No new tracks to download.")
+                    return self.stats
+
+                self.log("Starting downloads...\n")
+                self.run_jobs(itertools.chain([first_job], jobs))
+            self.log_track_counts()
+            if self.stop_event.is_set():
+                self.log_stopped()
+                return self.stats
+
+            self.log("All downloads completed or failed.\n")
+            if self.search_cache is not None:
+                self.log(f"Search cache: {self.search_cache.hits} hits, {self.search_cache.misses} searches.\n")
+            if self.art_cache is not None and (self.art_cache.hits or self.art_cache.fetched):
+                self.log(f"Album art cache: {self.art_cache.hits} hits, {self.art_cache.fetched} covers fetched "
+                         f"({self.art_cache.converted} converted to JPEG).\n")
+
+            self.finish_playlist(run)
+            self.notify("info", "Done", "All tracks have been processed by yt-dlp.")
+
+        except Exception as e:
+            self.report_error(e)
+        finally:
+            self._close_run()
+        return self.stats
+
+    def report_error(self, e):
+        """Log, show and record (in `stats.error`) an error that ended the run."""
+        if isinstance(e, TierlistFormatError):
+            self.log("Error: 'state' key not found or is not a dictionary in the JSON file.\n")
+            self.notify("error", "Invalid JSON", str(e))
+            self.stats.error = str(e)
+        elif isinstance(e, json.JSONDecodeError):
+            err_msg = "Error: Invalid JSON file. Please ensure the file is correctly formatted."
+            self.log(f"{err_msg}\n")
+            self.notify("error", "JSON Error", err_msg)
+            self.stats.error = err_msg
+        else:
+            err_msg = str(e)
+            self.log(f"An unexpected error occurred: {err_msg}\n")
+            self.notify("error", "Error", err_msg)
+            self.stats.error = err_msg
+
+    def sync(self, filepath, download_dir, removed_action="keep"):
+        """Download only the tracks added to `filepath` since the last sync of `download_dir`. Returns DownloadStats.
+
+        The folder keeps a snapshot of the last synced export (sync.SyncSnapshot).
+        An unchanged export is recognised by its hash and skipped; otherwise the
+        export is diffed against the snapshot while it is streamed, and only
+        added tracks (plus those that failed before) go to the pipeline.
+        Tracks that were removed from the playlist are left alone ("keep"),
+        moved into a subfolder ("archive") or deleted ("prune"). The first
+        sync of a folder downloads everything that's missing, like download().
+        """
+        self.stats = DownloadStats()
+        try:
+            export_sha256 = file_sha256(filepath)
+            run = self._open_run(download_dir)
+            snapshot = SyncSnapshot.load(download_dir)
+            if snapshot.export_sha256 == export_sha256 and not run.failed_ids:
+                self.log(f"{os.path.basename(filepath)} hasn't changed since the last sync ({snapshot.synced_at}).\n")
+                self.notify("info", "All Done", "No changes since the last sync.")
+                return self.stats
+            if snapshot.tracks:
+                self.log(f"Comparing with the export synced at {snapshot.synced_at} ({len(snapshot.tracks)} tracks).\n")
+
+            diff = TierlistDiff(snapshot)
+            with open(filepath, 'r', encoding='utf-8') as f:
+                jobs = self.new_tracks(f, run, diff)
+                first_job = next(jobs, None)
+                if first_job is not None:
+                    self.log("Starting downloads...\n")
+                    self.run_jobs(itertools.chain([first_job], jobs))
+            if self.stop_event.is_set():
+                # The snapshot isn't updated, so the next sync sees the same changes again
+                self.log_stopped()
+                return self.stats
+
+            removed = diff.removed()
+            self.log(f"Changes since the last sync: {diff.added} added, {len(removed)} removed, "
+                     f"{diff.moved} moved to another tier.\n")
+            if removed:
+                self._handle_removed_tracks(run, removed, removed_action)
+            diff.new_snapshot(export_sha256).save(download_dir)
+            self._finish_run(run)
+            self.notify("info", "Done", f"Sync complete: {self.stats.downloaded} downloaded, {self.stats.failed} failed, "
+                                        f"{len(removed)} removed from the playlist.")
+        except Exception as e:
+            self.report_error(e)
+        finally:
+            self._close_run()
+        return self.stats
+
+    def _handle_removed_tracks(self, run, track_ids, action):
+        """Archive or delete the files of tracks that are no longer in the playlist, and forget them."""
+        download_dir = run.download_dir
+        run.stats.add('removed', len(track_ids))
+        removed = set(track_ids)
+        for track_id in removed & run.failed_ids:
+            run.failed_journal.mark_resolved(track_id)  # Nothing to retry any more
+        if action == "keep":
+            return
+        files = {entry['track_id']: entry['file_path'] for entry in run.journal
+                 if entry.get('track_id') in removed and entry.get('file_path')}
+        archive_dir = os.path.join(download_dir, ARCHIVE_DIRNAME)
+        handled = 0
+        kept = set()  # Files that couldn't be moved or deleted stay in the journal
+        for track_id, file_path in files.items():
+            # Journals may hold paths from before the folder was moved; the file is in this folder
+            path = os.path.join(download_dir, os.path.basename(file_path))
+            try:
+                if action == "archive":
+                    os.makedirs(archive_dir, exist_ok=True)
+                    os.replace(path, os.path.join(archive_dir, os.path.basename(path)))
+                else:
+                    os.remove(path)
+                handled += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self.log(f"WARNING: could not {action} {os.path.basename(path)}: {e}\n")
+                kept.add(track_id)
+                continue
+            if self.state_store is not None:
+                self.state_store.record_removal(track_id, download_dir, run.run_id)
+        # Forget them, so they are downloaded again if they come back to the playlist
+        run.journal.compact(forget=removed - kept)
+        self.log(f"{'Archived' if action == 'archive' else 'Deleted'} {handled} tracks that were removed from the playlist"
+                 f"{f' (moved to {archive_dir})' if action == 'archive' else ''}.\n")
+
+    def new_tracks(self, f, run, diff=None):
+        """Yield a TrackJob for every track of the export in `f` that isn't in `run`'s folder yet, counting the rest.
+
+        With a TierlistDiff, tracks that were already in the last synced export
+        are skipped without further checks, unless they failed back then.
+        """
+        for tier_name, item in iter_tierlist_items(f):
+            run.stats.add('total')
+            fields = track_fields(item)
+            if fields is None:
+                if isinstance(item, dict):
+                    self.log(f"Skipping invalid item in tier {tier_name}: {item.get('id', 'Unknown')}\n")
+                continue
+            track_id, track_name, artist_names = fields
+            if diff is not None and not diff.see(track_id, tier_name) and track_id not in run.failed_ids:
+                run.stats.add('skipped')
+                continue
+
+            # Use track_id as the unique identifier
+            if run.is_downloaded(track_id, self.state_store):
+                run.stats.add('skipped')
+                continue
+            yield TrackJob(track_id, track_name, artist_names, run.download_dir, track_duration(item), run, tier_name,
+                           album_cover_url(item))
+
+    def log_stopped(self):
+        """Log how far a run got before stop()."""
+        # Finished tracks are already in the journal, which _close_run syncs to disk
+        self.log(f"Stopped: {self.stats.downloaded} tracks finished and recorded, {self.stats.cancelled} cancelled. "
+                 f"The next run continues with the rest.\n")
+
+    def log_track_counts(self):
+        """Log how many tracks the export has and how many of them were already downloaded."""
+        self.log(f"Found {self.stats.total} tracks in JSON file.\n")
+        if self.stats.skipped:
+            self.log(f"{self.stats.skipped} tracks were already downloaded.\n")
+
+    def retry_failed(self, download_dir):
+        """Retry only the tracks in the folder's failed-tracks journal, without reading the export. Returns DownloadStats."""
+        self.stats = DownloadStats()
+        try:
+            run = self._open_run(download_dir)
+            entries = run.failed_journal.failed_entries()
+            if self.state_store is not None:
+                # The tracks that failed in the folder's last run go first, including any whose entry in the
+                # failed-tracks journal is gone (e.g. the file was deleted)
+                last_failed = self.state_store.failed_tracks(download_dir, self.state_store.last_run(
+                    download_dir, before=run.run_id))
+                journaled = {entry['track_id']: entry for entry in entries}
+                last_ids = {entry['track_id'] for entry in last_failed}
+                entries = ([journaled.get(entry['track_id'], entry) for entry in last_failed] +
+                           [entry for entry in entries if entry['track_id'] not in last_ids])
+                if last_failed:
+                    self.log(f"{len(last_failed)} tracks failed in the last run.\n")
+            jobs = []
+            for entry in entries:
+                track_id = entry['track_id']
+                if run.is_downloaded(track_id, self.state_store):
+                    # Downloaded by some other run in the meantime
+                    run.failed_journal.mark_resolved(track_id)
+                    self.stats.add('skipped')
+                    continue
+                if not entry.get('track_name'):
+                    continue
+                jobs.append(TrackJob(track_id, entry['track_name'], entry.get('artists') or [], download_dir,
+                                     entry.get('duration'), run, cover_url=entry.get('cover_url')))
+            self.stats.total = len(jobs) + self.stats.skipped
+
+            if not jobs:
+                self._finish_run(run)
+                self.log("No failed tracks to retry.\n")
+                self.notify("info", "All Done", "No failed tracks to retry.")
+                return self.stats
+
+            self.log(f"Retrying {len(jobs)} failed tracks...\n")
+            self.run_jobs(jobs)
+            if self.stop_event.is_set():
+                self.log_stopped()
+                return self.stats
+            self.log("All retries completed or failed.\n")
+            self._finish_run(run)
+            self.notify("info", "Done", f"Retried {len(jobs)} tracks: {self.stats.downloaded} downloaded, "
+                                        f"{self.stats.failed} still failing.")
+
+        except Exception as e:
+            err_msg = str(e)
+            self.log(f"An unexpected error occurred: {err_msg}\n")
+            self.notify("error", "Error", err_msg)
+            self.stats.error = err_msg
+        finally:
+            self._close_run()
+        return self.stats
+
+    def _open_run(self, download_dir):
+        """Open the caches and stores, and the playlist's journals, for a single-playlist run; returns its PlaylistRun."""
+        self.open_shared()
+        self.run = self.open_playlist(download_dir, self.stats)
+        return self.run
+
+    def open_shared(self):
+        """Open what all playlists of a run share: the search cache, track store and state database."""
+        self.run_metrics = PipelineMetrics()
+        if self.search_cache_path:
+            self.search_cache = SearchCache(self.search_cache_path)
+        if self.art_cache_path:
+            try:
+                self.art_cache = ArtCache(self.art_cache_path, self.art_cache_bytes, self.ffmpeg_exe_path)
+            except (OSError, sqlite3.Error) as e:
+                self.log(f"WARNING: album art cache unavailable, embedding video thumbnails instead: {e}\n")
+        if self.track_store_path:
+            self.track_store = TrackStore(self.track_store_path)
+        if self.state_db_path:
+            # Indexed lookups per track instead of loading the whole log into memory
+            self.state_store = StateStore(self.state_db_path)
+            self.log(f"Using state database: {self.state_db_path}\n")
+
+    def open_playlist(self, download_dir, stats):
+        """Open the journals of a playlist folder and load its earlier probe results; returns a PlaylistRun."""
+        run = PlaylistRun(download_dir, stats)
+        # --- Load download journal (migrates an old download_log.json automatically) ---
+        run.journal = DownloadJournal(download_dir)
+        if run.journal.migrated:
+            self.log("Migrated download_log.json to the append-only download journal.\n")
+        run.failed_journal = FailedTracksJournal(download_dir)
+        run.failed_ids = {entry['track_id'] for entry in run.failed_journal.failed_entries()}
+        # Earlier probe results, so unchanged files are never probed twice
+        if self.state_store is not None:
+            self._import_journal(run)
+            run.run_id = self.state_store.begin_run(download_dir)
+            run.probe_index = StoredProbeIndex(self.state_store, download_dir, run.run_id)
+        else:
+            # Use track_id as the unique identifier
+            run.downloaded_tracks = run.journal.track_ids()
+            run.probe_index = ProbeIndex(run.journal)
+        run.earlier_entries = run.probe_index.earlier_entries()
+        return run
+
+    def _import_journal(self, run):
+        """Load the journal entries the state database hasn't seen yet, e.g. from runs without it."""
+        imported = self.state_store.import_journal(
+            run.download_dir, run.journal.entries_after(self.state_store.journal_position(run.download_dir)))
+        # Read to the end, so the journal knows its entry count for needs_compaction()
+        self.state_store.set_journal_position(run.download_dir, run.journal.position())
+        if imported > 0:
+            self.log(f"Imported {imported} download journal entries into the state database.\n")
+
+    def _export_metrics(self):
+        """Write the metrics of the finished runs plus the current one to `metrics_path`, if set."""
+        if not self.metrics_path:
+            return
+        metrics = PipelineMetrics()
+        metrics.merge(self.metrics)
+        if self.run_metrics is not None:
+            metrics.merge(self.run_metrics)
+            if self.stats is not None:
+                metrics.add_stats(self.stats)
+        try:
+            write_metrics(metrics, self.metrics_path)
+        except OSError as e:
+            self.log(f"WARNING: could not write the metrics file: {e}\n")
+
+    def _end_run_metrics(self):
+        """Log where the run's time went and fold its metrics into the totals for the metrics file."""
+        run_metrics = self.run_metrics
+        if run_metrics is None:
+            return
+        if not run_metrics.is_empty():
+            self.log("Time per stage:\n")
+            for line in run_metrics.summary_lines():
+                self.log(f"  {line}\n")
+        self._export_metrics()
+        self.run_metrics = None
+        self.metrics.merge(run_metrics)
+        if self.stats is not None:
+            self.metrics.add_stats(self.stats)
+
+    def finish_playlist(self, run):
+        """After the pipeline: check the files of earlier runs, then flush and compact the playlist's journals."""
+        self._reprobe_stale_files(run, run.earlier_entries)
+        if self.track_store is not None:
+            self._adopt_into_store(run.download_dir, run.earlier_entries)
+        self.log(f"Verified {run.stats.probed + run.stats.probe_cached} files in {os.path.basename(run.download_dir)} "
+                 f"with ffprobe ({run.stats.probe_cached} unchanged since their last probe).\n")
+        self._finish_run(run)
+
+    def _finish_run(self, run):
+        """Flush and compact a playlist's journals after a completed run."""
+        run.journal.flush()
+        # Without the state database, the journal counts its tracks in the set run.downloaded_tracks shares
+        unique_count = self.state_store.count_downloaded(run.download_dir) if self.state_store is not None else None
+        if run.journal.needs_compaction(unique_count):
+            self.log("Compacting download journal...\n")
+            run.journal.compact()
+        run.failed_journal.compact()
+        if self.track_store is not None:
+            links, objects, saved = self.track_store.savings()
+            if links:
+                self.log(f"Track store: {links} playlist files share {objects} stored tracks, "
+                         f"saving {format_bytes(saved)}.\n")
+        still_failing = len(run.failed_journal.failed_entries())
+        if still_failing:
+            self.log(f"{still_failing} tracks failed; they are listed in {run.failed_journal.path} "
+                     f"and can be retried on their own.\n")
+
+    def _close_run(self):
+        if self.run is not None:
+            self.close_playlist(self.run)
+            self.run = None
+        self.close_shared()
+
+    def close_playlist(self, run):
+        """Close a playlist's journals; its finished tracks are on disk after this."""
+        run.journal.close()
+        run.failed_journal.close()
+        if self.state_store is not None and run.run_id is not None:
+            # What this run appended (or compacted) is in the database already
+            self.state_store.set_journal_position(run.download_dir, run.journal.position())
+
+    def close_shared(self):
+        """Close what open_shared() opened, and the backend's connections."""
+        self._end_run_metrics()
+        if self.backend is not None:
+            # Drops the per-worker YoutubeDL instances of this run's pool
+            self.backend.close()
+        if self.state_store is not None:
+            self.state_store.close()
+            self.state_store = None
+        if self.search_cache is not None:
+            self.search_cache.close()
+            self.search_cache = None
+        if self.art_cache is not None:
+            self.art_cache.close()
+            self.art_cache = None
+        if self.track_store is not None:
+            self.track_store.close()
+            self.track_store = None
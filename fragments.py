@@ -0,0 +1,211 @@
+"""Fetch one track's audio over several connections at once, within a connection budget shared by all downloads.
+
+A single stream over a high-latency link only gets a fraction of the
+bandwidth, because each connection is held back by its round trips (and
+YouTube throttles per connection). Splitting the file into byte ranges
+fetched side by side adds the connections' speeds up. The extra connections
+come out of a budget shared with the fetch pool, so they go to the tracks
+that are still running while the pool isn't full (e.g. at the end of a run),
+instead of piling on top of a full pool.
+"""
+import collections
+import http.client
+import os
+import threading
+import time
+import urllib.parse
+
+MIN_PART_SIZE = 512 * 1024  # Smaller ranges cost more in request round trips than they gain
+PARTS_PER_CONNECTION = 4  # More, smaller ranges than connections, so a slow connection doesn't hold up the end
+READ_SIZE = 64 * 1024
+MAX_REDIRECTS = 5
+
+
+class RangesNotSupported(Exception):
+    """The server doesn't answer Range requests (or doesn't say how big the file is); download it in one stream."""
+
+
+class FetchCancelled(Exception):
+    pass
+
+
+class ConnectionBudget:
+    """How many media connections the fetch workers may have open in total.
+
+    Every running download needs one and waits for it; a download that may
+    use several takes the others only if they are free right away and no
+    download is waiting, so extra connections never hold up the pool.
+    """
+
+    def __init__(self, total):
+        self.total = max(1, total)
+        self.in_use = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, wanted, stop_event=None):
+        """Take between 1 and `wanted` connections; returns how many, or 0 if `stop_event` got set while waiting."""
+        with self._cond:
+            self._waiting += 1
+            try:
+                while self.in_use >= self.total:
+                    if stop_event is not None and stop_event.is_set():
+                        return 0
+                    self._cond.wait(0.5)
+            finally:
+                self._waiting -= 1
+            granted = 1 if self._waiting else min(max(1, wanted), self.total - self.in_use)
+            self.in_use += granted
+            return granted
+
+    def release(self, count):
+        if count:
+            with self._cond:
+                self.in_use -= count
+                self._cond.notify_all()
+
+
+class _Connection:
+    """One keep-alive HTTP(S) connection that follows redirects and reconnects when the server closed it."""
+
+    def __init__(self, url, headers, timeout):
+        self.url = url
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self._conn = None
+        self._host = None
+
+    def _connect(self):
+        parts = urllib.parse.urlsplit(self.url)
+        host = (parts.scheme, parts.netloc)
+        if self._conn is None or host != self._host:
+            self.close()
+            cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+            self._conn = cls(parts.netloc, timeout=self.timeout)
+            self._host = host
+        return self._conn, urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+
+    def request(self, method, extra_headers):
+        """Send `method` to the URL (following redirects) and return the response; its body must be read."""
+        for _ in range(MAX_REDIRECTS + 1):
+            for attempt in (0, 1):
+                conn, path = self._connect()
+                reused = conn.sock is not None
+                try:
+                    conn.request(method, path, headers={**self.headers, **extra_headers})
+                    response = conn.getresponse()
+                    break
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    # The server dropped the idle keep-alive connection; a new one gets one more try
+                    self.close()
+                    if attempt or not reused:
+                        raise
+            if response.status in (301, 302, 303, 307, 308) and response.getheader("Location"):
+                response.read()
+                self.url = urllib.parse.urljoin(self.url, response.getheader("Location"))
+                continue
+            return response
+        raise OSError(f"Too many redirects fetching {self.url}")
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def content_length(url, headers=None, timeout=30):
+    """Size of the file at `url` from a HEAD request; raises RangesNotSupported if the server won't tell."""
+    conn = _Connection(url, headers, timeout)
+    try:
+        response = conn.request("HEAD", {})
+        response.read()
+        length = response.getheader("Content-Length")
+        if response.status != 200 or not length or response.getheader("Accept-Ranges", "").lower() != "bytes":
+            raise RangesNotSupported(f"HTTP {response.status}, Accept-Ranges: {response.getheader('Accept-Ranges')}")
+        return int(length)
+    finally:
+        conn.close()
+
+
+def split_ranges(total, connections):
+    """Byte ranges [(first, last), ...] covering `total` bytes, about PARTS_PER_CONNECTION per connection."""
+    part = max(MIN_PART_SIZE, -(-total // (connections * PARTS_PER_CONNECTION)))
+    return [(first, min(first + part, total) - 1) for first in range(0, total, part)]
+
+
+def fetch_ranges(url, path, total, connections, headers=None, progress=None, timeout=30):
+    """Download the `total` bytes at `url` into `path` over up to `connections` concurrent Range requests.
+
+    The ranges are written into a preallocated `path`.part, which is renamed
+    to `path` once complete and removed on any failure (a file with holes
+    can't be resumed like yt-dlp's .part files). Feeds `progress` (a
+    TransferProgress) and stops when it is cancelled. Raises
+    RangesNotSupported if the server ignores the Range header, FetchCancelled,
+    or OSError / http.client.HTTPException for network and HTTP errors.
+    """
+    ranges = split_ranges(total, connections)
+    queue = collections.deque(ranges)
+    lock = threading.Lock()
+    failed = threading.Event()
+    errors = []
+    downloaded = [0]
+    started = time.monotonic()
+    part_path = path + ".part"
+
+    def report(n):
+        with lock:
+            downloaded[0] += n
+            done = downloaded[0]
+        if progress is not None:
+            elapsed = time.monotonic() - started
+            speed = done / elapsed if elapsed > 0 else None
+            progress.update(done, total, speed, (total - done) / speed if speed else None)
+
+    def worker():
+        conn = _Connection(url, headers, timeout)
+        try:
+            with open(part_path, 'r+b') as f:
+                while not failed.is_set():
+                    with lock:
+                        if not queue:
+                            return
+                        first, last = queue.popleft()
+                    response = conn.request("GET", {"Range": f"bytes={first}-{last}"})
+                    if response.status != 206:
+                        response.read()
+                        raise RangesNotSupported(f"HTTP {response.status} to a Range request")
+                    f.seek(first)
+                    remaining = last - first + 1
+                    while remaining > 0:
+                        if progress is not None and progress.cancelled:
+                            raise FetchCancelled("Download cancelled")
+                        if failed.is_set():
+                            return
+                        data = response.read(min(READ_SIZE, remaining))
+                        if not data:
+                            raise OSError(f"Connection closed with {remaining} bytes of bytes={first}-{last} missing")
+                        f.write(data)
+                        remaining -= len(data)
+                        report(len(data))
+        except Exception as e:
+            errors.append(e)
+            failed.set()
+        finally:
+            conn.close()
+
+    with open(part_path, 'wb') as f:
+        f.truncate(total)
+    try:
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(min(connections, len(ranges)) - 1)]
+        for thread in threads:
+            thread.start()
+        worker()  # This thread is one of the connections
+        for thread in threads:
+            thread.join()
+        if errors:
+            # Report why the transfer went wrong rather than another connection's reaction to it
+            raise next((e for e in errors if isinstance(e, (FetchCancelled, RangesNotSupported))), errors[0])
+        os.replace(part_path, path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
@@ -0,0 +1,379 @@
+import tkinter as tk
+from tkinter import filedialog, scrolledtext, messagebox
+import threading
+import os
+
+from engine import DownloadEngine, find_playlist_folders, count_files, new_folder_path, playlist_name_from_path
+from log_buffer import LogBuffer
+from progress import format_bytes
+from scheduler import PlaylistScheduler
+from state_store import DEFAULT_STATE_DB
+from sync import REMOVED_ACTIONS
+from track_store import DEFAULT_TRACK_STORE
+
+# Scheduling policies offered for several exports; "weighted" needs weights, which only the CLI takes
+GUI_POLICIES = ("round-robin", "tier")
+LOG_FLUSH_MS = 100  # How often queued log messages are moved into the log widget
+MAX_LOG_LINES = 5000  # Older lines are dropped from the widget; the log file keeps them
+
+
+class AskPlaylistExistsDialog(tk.Toplevel):
+    def __init__(self, parent, playlist_name, num_files, existing_folders=None):
+        super().__init__(parent)
+        self.transient(parent)
+        self.title("Playlist Exists")
+        self.result = "cancel"  # Default to cancel
+        self.selected_folder = None
+
+        message = f"The folder for '{playlist_name}' already exists and contains {num_files} files."
+        tk.Label(self, text=message, wraplength=350).pack(padx=20, pady=10)
+        tk.Label(self, text="Select an existing folder or create a new one:").pack(pady=5)
+
+        self.folder_var = tk.StringVar()
+        self.folder_var.set(None)  # Ensure no folder is selected by default
+        folder_frame = tk.Frame(self)
+        folder_frame.pack(pady=5)
+
+        if existing_folders:
+            existing_folders = sorted(existing_folders)
+            for folder in existing_folders:
+                tk.Radiobutton(folder_frame, text=folder, variable=self.folder_var, value=folder).pack(anchor='w')
+
+        btn_frame = tk.Frame(self)
+        btn_frame.pack(pady=10)
+
+        tk.Button(btn_frame, text="Use Selected Folder", command=self.on_update).pack(side=tk.LEFT, padx=5, pady=5)
+        tk.Button(btn_frame, text="Create New Folder", command=self.on_create_new).pack(side=tk.LEFT, padx=5, pady=5)
+        tk.Button(btn_frame, text="Cancel", command=self.on_cancel).pack(side=tk.LEFT, padx=5, pady=5)
+
+        self.grab_set()
+        self.protocol("WM_DELETE_WINDOW", self.on_cancel)
+
+        # Center the dialog
+        self.update_idletasks()
+        x = parent.winfo_x() + (parent.winfo_width() // 2) - (self.winfo_width() // 2)
+        y = parent.winfo_y() + (parent.winfo_height() // 2) - (self.winfo_height() // 2)
+        self.geometry(f"+{x}+{y}")
+        self.wait_window(self)
+
+    def on_create_new(self):
+        self.result = "new"
+        self.selected_folder = None
+        self.destroy()
+
+    def on_update(self):
+        self.result = "update"
+        self.selected_folder = self.folder_var.get()
+        self.destroy()
+
+    def on_cancel(self):
+        self.result = "cancel"
+        self.selected_folder = None
+        self.destroy()
+
+class SpotifyJSONDownloader:
+    def __init__(self, master):
+        self.master = master
+        master.title("Spotify JSON Downloader (using yt-dlp)")
+
+        self.filepath = None
+        self.filepaths = []  # All selected exports; several are downloaded together through one pipeline
+        self.download_dir = None
+        self.worker = None  # Thread running the current engine call
+        self.closing = False
+        btn_frame = tk.Frame(master)
+        btn_frame.pack(padx=10, pady=10)
+
+        self.select_btn = tk.Button(btn_frame, text="Select JSON File", command=self.select_file)
+        self.select_btn.pack(side=tk.LEFT, padx=5)
+
+        self.download_btn = tk.Button(btn_frame, text="Download Tracks", command=self.start_download)
+        self.download_btn.pack(side=tk.LEFT, padx=5)
+
+        self.retry_btn = tk.Button(btn_frame, text="Retry Failed", command=self.start_retry_failed)
+        self.retry_btn.pack(side=tk.LEFT, padx=5)
+
+        # Optional SQLite state store shared by all playlist folders
+        self.use_state_db = tk.BooleanVar(value=False)
+        tk.Checkbutton(btn_frame, text="Use shared state database", variable=self.use_state_db).pack(side=tk.LEFT, padx=5)
+
+        # Optional track store: tracks in several playlists are downloaded once and hardlinked
+        self.use_track_store = tk.BooleanVar(value=False)
+        tk.Checkbutton(btn_frame, text="Share tracks between playlists", variable=self.use_track_store).pack(side=tk.LEFT, padx=5)
+
+        # Pool sizes: downloads are network-bound (adaptive up to the limit), encodes are CPU-bound
+        workers_frame = tk.Frame(master)
+        workers_frame.pack(padx=10, pady=(0,10))
+        self.download_workers = tk.IntVar(value=8)
+        self.transcode_workers = tk.IntVar(value=os.cpu_count() or 2)
+        tk.Label(workers_frame, text="Max downloads:").pack(side=tk.LEFT)
+        tk.Spinbox(workers_frame, from_=1, to=32, width=4, textvariable=self.download_workers).pack(side=tk.LEFT, padx=(2,10))
+        tk.Label(workers_frame, text="Encode workers:").pack(side=tk.LEFT)
+        tk.Spinbox(workers_frame, from_=1, to=64, width=4, textvariable=self.transcode_workers).pack(side=tk.LEFT, padx=2)
+        # "native" keeps YouTube's opus/AAC audio instead of re-encoding it to mp3
+        self.keep_native_audio = tk.BooleanVar(value=False)
+        tk.Checkbutton(workers_frame, text="Keep original audio (no mp3 re-encode)",
+                       variable=self.keep_native_audio).pack(side=tk.LEFT, padx=10)
+
+        # Sync mode: only tracks added since the last sync of the folder are downloaded
+        sync_frame = tk.Frame(master)
+        sync_frame.pack(padx=10, pady=(0,10))
+        self.sync_mode = tk.BooleanVar(value=False)
+        tk.Checkbutton(sync_frame, text="Only download changes since the last sync",
+                       variable=self.sync_mode).pack(side=tk.LEFT)
+        tk.Label(sync_frame, text="Removed tracks:").pack(side=tk.LEFT, padx=(10,2))
+        self.removed_action = tk.StringVar(value="keep")
+        tk.OptionMenu(sync_frame, self.removed_action, *REMOVED_ACTIONS).pack(side=tk.LEFT)
+        tk.Label(sync_frame, text="Several exports:").pack(side=tk.LEFT, padx=(10,2))
+        self.schedule_policy = tk.StringVar(value=GUI_POLICIES[0])
+        tk.OptionMenu(sync_frame, self.schedule_policy, *GUI_POLICIES).pack(side=tk.LEFT)
+
+        self.status_var = tk.StringVar(value="Idle")
+        tk.Label(master, textvariable=self.status_var, anchor='w', relief=tk.SUNKEN).pack(side=tk.BOTTOM, fill=tk.X)
+
+        self.log_area = scrolledtext.ScrolledText(master, width=80, height=20, state='disabled')
+        self.log_area.pack(padx=10, pady=(0,10))
+
+        # Workers only enqueue messages; the Tk thread moves them into the widget in batches
+        self.log_buffer = LogBuffer()
+        self.master.after(LOG_FLUSH_MS, self._flush_log)
+
+        self.engine = DownloadEngine(log=self.log, notify=self.notify)
+
+    def notify(self, kind, title, message):
+        """Show an engine message in a dialog; safe to call from worker threads."""
+        if self.closing:
+            return
+        show = {"info": messagebox.showinfo, "warning": messagebox.showwarning, "error": messagebox.showerror}[kind]
+        self.master.after(0, lambda: show(title, message))
+
+    def check_for_incomplete_downloads(self, download_dir):
+        """Ask whether to download the tracks of partial and unlogged files in `download_dir` again.
+
+        Returns (partial files, unlogged audio files), or None if there are none or the user declines.
+        """
+        orphaned_files, orphaned_tracks = self.engine.find_incomplete_downloads(download_dir)
+        if not orphaned_files and not orphaned_tracks:
+            return None
+        msg = "Some incomplete or unlogged downloads were found:\n"
+        if orphaned_files:
+            msg += "\nPartial files (likely interrupted):\n" + '\n'.join(orphaned_files)
+        if orphaned_tracks:
+            msg += "\nAudio files not in log (may be incomplete or added manually):\n" + '\n'.join(orphaned_tracks)
+        msg += "\n\nWould you like to attempt to re-download these tracks?"
+        if not messagebox.askyesno("Incomplete Downloads Detected", msg):
+            return None
+        return orphaned_files, orphaned_tracks
+
+    def select_file(self):
+        paths = filedialog.askopenfilenames(filetypes=[("JSON files", "*.json")])
+        if paths:
+            self.filepaths = list(paths)
+            self.filepath = self.filepaths[0]
+            if len(paths) == 1:
+                message = f"Selected file:\n{paths[0]}"
+            else:
+                message = f"Selected {len(paths)} files, downloaded together:\n" + '\n'.join(paths)
+            self.master.after(0, lambda: messagebox.showinfo("File Selected", message))
+
+    def _apply_settings(self):
+        """Copy the options from the window to the engine; returns False if one is invalid."""
+        self.engine.state_db_path = DEFAULT_STATE_DB if self.use_state_db.get() else None
+        self.engine.track_store_path = DEFAULT_TRACK_STORE if self.use_track_store.get() else None
+        self.engine.output_format = "native" if self.keep_native_audio.get() else "mp3"
+        try:
+            self.engine.max_workers = max(1, self.download_workers.get())
+            self.engine.transcode_workers = max(1, self.transcode_workers.get())
+        except tk.TclError:
+            self.master.after(0, lambda: messagebox.showerror("Error", "The worker counts must be whole numbers."))
+            return False
+        return True
+
+    def start_download(self):
+        if not self.filepath:
+            self.master.after(0, lambda: messagebox.showerror("Error", "Please select a JSON file first."))
+            return
+
+        if not self._apply_settings() or not self.engine.locate_tools():
+            return
+
+        if len(self.filepaths) > 1:
+            self._run_scheduled()
+            return
+
+        download_dir = self.engine.default_download_dir(self.filepath)
+        playlist_folder_name = playlist_name_from_path(self.filepath)
+
+        # Gather all existing folders that match the playlist_folder_name pattern
+        parent_dir = os.path.dirname(download_dir)
+        existing_folders = find_playlist_folders(download_dir)
+
+        # If only one existing folder and it is empty, skip dialog and use it directly
+        if len(existing_folders) == 1:
+            only_folder = os.path.join(parent_dir, existing_folders[0])
+            if count_files(only_folder) == 0:
+                download_dir = only_folder
+                os.makedirs(download_dir, exist_ok=True)
+                self._run_download(download_dir)
+                return
+
+        if os.path.exists(download_dir):
+            num_files = count_files(download_dir)
+
+            dialog = AskPlaylistExistsDialog(self.master, playlist_folder_name, num_files, existing_folders=existing_folders)
+            choice = dialog.result
+            selected_folder = dialog.selected_folder
+
+            if choice == "new":
+                download_dir = new_folder_path(download_dir)
+                os.makedirs(download_dir)
+            elif choice == "update" and selected_folder:
+                download_dir = os.path.join(parent_dir, selected_folder)
+            else: # "cancel" or window closed
+                self.log("Download cancelled by user.\n")
+                self.master.after(0, lambda: self.select_btn.config(state='normal'))
+                self.master.after(0, lambda: self.download_btn.config(state='normal'))
+                return
+        else:
+            os.makedirs(download_dir, exist_ok=True)
+
+        self._run_download(download_dir)
+
+    def start_retry_failed(self):
+        """Retry only the tracks that failed earlier in a playlist folder picked by the user."""
+        initial_dir = self.download_dir or (self.engine.default_download_dir(self.filepath) if self.filepath else None)
+        download_dir = filedialog.askdirectory(title="Select the playlist folder to retry", initialdir=initial_dir)
+        if not download_dir:
+            return
+        if not self._apply_settings() or not self.engine.locate_tools():
+            return
+        self.download_dir = download_dir
+        self._start_engine(self.engine.retry_failed, download_dir)
+
+    def _run_download(self, download_dir):
+        self.download_dir = download_dir
+        # Now that the folder is known, offer to redo the downloads an earlier run left incomplete
+        incomplete = self.check_for_incomplete_downloads(download_dir)
+        sync_mode = self.sync_mode.get()
+        self._start_engine(self._download, self.filepath, download_dir, sync_mode, self.removed_action.get(), incomplete)
+
+    def _download(self, filepath, download_dir, sync_mode, removed_action, incomplete):
+        if incomplete is not None:
+            stats = self.engine.redownload_orphaned_tracks(filepath, download_dir, *incomplete)
+            if stats.error or self.engine.stop_event.is_set():
+                return
+            self.log(f"Redownload of incomplete tracks: {stats.downloaded} downloaded, {stats.failed} failed.\n")
+        if sync_mode:
+            self.engine.sync(filepath, download_dir, removed_action)
+        else:
+            self.engine.download(filepath, download_dir)
+
+    def _run_scheduled(self):
+        """Download the selected exports into their default folders, reusing existing ones like the CLI does."""
+        try:
+            playlists = [(filepath, self.engine.default_download_dir(filepath)) for filepath in self.filepaths]
+        except OSError as e:
+            self.master.after(0, lambda: messagebox.showerror("Error", str(e)))
+            return
+        incomplete = [self.check_for_incomplete_downloads(download_dir) for _, download_dir in playlists]
+        self.download_dir = playlists[0][1]
+        self._start_engine(self._download_all, playlists, incomplete, self.sync_mode.get(),
+                           self.removed_action.get(), self.schedule_policy.get())
+
+    def _download_all(self, playlists, incomplete, sync_mode, removed_action, policy):
+        for (filepath, download_dir), orphans in zip(playlists, incomplete):
+            if orphans is not None and not self.engine.stop_event.is_set():
+                self.engine.redownload_orphaned_tracks(filepath, download_dir, *orphans)
+        if sync_mode:
+            # Syncs diff each export against its own snapshot, so they run one after the other
+            for filepath, download_dir in playlists:
+                if self.engine.stop_event.is_set():
+                    break
+                self.engine.sync(filepath, download_dir, removed_action)
+            return
+        scheduler = PlaylistScheduler(self.engine, policy)
+        for filepath, download_dir in playlists:
+            scheduler.add(filepath, download_dir)
+        scheduler.run()  # Logs each playlist's summary as it finishes
+
+    def _start_engine(self, method, *args):
+        """Run an engine call in a background thread, with the buttons disabled until it returns."""
+        if self.closing:
+            return
+        self.engine.reset_stop()  # A stop (e.g. Ctrl+C) only cancels the run it interrupted
+        self._set_buttons('disabled')
+        self.worker = threading.Thread(target=self._run_engine, args=(method, *args), name="engine")
+        self.worker.start()
+
+    def busy(self):
+        return self.worker is not None and self.worker.is_alive()
+
+    def _set_buttons(self, state):
+        for button in (self.select_btn, self.download_btn, self.retry_btn):
+            self.master.after(0, lambda button=button: button.config(state=state))
+
+    def _run_engine(self, method, *args):
+        try:
+            method(*args)
+        finally:
+            self._set_buttons('normal')
+
+    def log(self, message):
+        """Queue a message for the log widget; safe to call from worker threads."""
+        self.log_buffer.put(message)
+
+    def _flush_log(self):
+        """Move queued messages into the log widget and refresh the status bar, then reschedule."""
+        batch = self.log_buffer.drain()
+        if batch:
+            # Lines that would be trimmed right away aren't worth inserting
+            text = "".join(batch)
+            lines = text.splitlines(keepends=True)
+            if len(lines) > MAX_LOG_LINES:
+                text = "".join(lines[-MAX_LOG_LINES:])
+            self.log_area.config(state='normal')
+            self.log_area.insert(tk.END, text)
+            excess = int(self.log_area.index('end-1c').split('.')[0]) - MAX_LOG_LINES
+            if excess > 0:
+                self.log_area.delete('1.0', f'{excess + 1}.0')
+            self.log_area.see(tk.END)
+            self.log_area.config(state='disabled')
+        self.status_var.set(self._status_text())
+        self.master.after(LOG_FLUSH_MS, self._flush_log)
+
+    def _status_text(self):
+        parts = ["Stopping: recording the finished tracks"] if self.closing else []
+        stats = self.engine.stats
+        if stats is not None:
+            parts.append(f"{stats.downloaded} downloaded, {stats.skipped} skipped, {stats.failed} failed, "
+                         f"{stats.retried} retried" + (f", {stats.cancelled} cancelled" if stats.cancelled else ""))
+        progress = self.engine.progress
+        if progress is not None:
+            parts.append(f"{format_bytes(progress.current_speed())}/s, {len(progress.active())} active downloads")
+        parts.append(f"{self.log_buffer.messages} log messages ({self.log_buffer.rate():.0f}/s)")
+        if self.log_buffer.log_path:
+            parts.append(f"full log: {self.log_buffer.log_path}")
+        return " | ".join(parts)
+
+
+def create_app():
+    """Build the Tk root window and the downloader app."""
+    root = tk.Tk()
+    app = SpotifyJSONDownloader(root)
+
+    def on_closing():
+        # Cancel the run, then keep the window (and its event loop) alive until the engine thread is done,
+        # so the tracks already downloaded get recorded and nothing calls into a destroyed Tk
+        app.closing = True
+        app.engine.stop()
+
+        def close_when_idle():
+            if app.busy():
+                root.after(100, close_when_idle)
+                return
+            app.log_buffer.close()
+            root.destroy()
+        close_when_idle()
+
+    root.protocol("WM_DELETE_WINDOW", on_closing)
+    return root, app
@@ -0,0 +1,239 @@
+import json
+import os
+import threading
+import time
+
+JOURNAL_FILENAME = 'download_log.jsonl'
+LEGACY_LOG_FILENAME = 'download_log.json'
+FAILED_JOURNAL_FILENAME = 'failed_tracks.jsonl'
+
+
+class DownloadJournal:
+    """Append-only JSON Lines log of the tracks downloaded into one playlist folder.
+
+    Every entry is written as a single line, so a crash can at worst leave a torn
+    last line behind, which is skipped when the journal is read back. Writes are
+    flushed immediately and fsync'ed in batches to keep the cost per track low.
+    """
+
+    filename = JOURNAL_FILENAME
+
+    def __init__(self, directory, fsync_every=25, fsync_interval=2.0):
+        self.directory = directory
+        self.path = os.path.join(directory, self.filename)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._file = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._line_count = None  # Entries in the file, once it has been read (None until then)
+        self._track_ids = None  # Set returned by track_ids(), kept up to date by append()
+        self.migrated = self._migrate_legacy_log()
+
+    def _migrate_legacy_log(self):
+        """Convert an old download_log.json into the journal format (once)."""
+        legacy_path = os.path.join(self.directory, LEGACY_LOG_FILENAME)
+        if os.path.exists(self.path) or not os.path.exists(legacy_path):
+            return False
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return False
+        if not isinstance(entries, list):
+            entries = []
+        self._write_atomically(entry for entry in entries if isinstance(entry, dict))
+        # Keep the old file around, but out of the way of older versions of this tool
+        os.replace(legacy_path, legacy_path + '.bak')
+        return True
+
+    def _write_atomically(self, entries):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def __iter__(self):
+        """Yield journal entries one at a time, skipping torn or corrupt lines."""
+        return self.entries_after(None)
+
+    def position(self):
+        """Where the journal ends now, as (file ID, size, entry count), or None if it doesn't exist.
+
+        The entry count is None until the journal has been read; see `entries_after`.
+        """
+        try:
+            stat_result = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return str(stat_result.st_ino), stat_result.st_size, self._line_count
+
+    def entries_after(self, position):
+        """Yield the entries appended since `position()` returned `position`.
+
+        All entries if `position` is None or the journal was rewritten since
+        (compacted or migrated: another file, or a shorter one). Once all
+        are read, the journal knows how many entries it has.
+        """
+        if not os.path.exists(self.path):
+            self._line_count = 0
+            return
+        count = 0
+        with open(self.path, 'rb') as f:
+            if position is not None:
+                file_id, size, line_count = position
+                stat_result = os.fstat(f.fileno())
+                if str(stat_result.st_ino) == file_id and stat_result.st_size >= size and line_count is not None:
+                    f.seek(size)
+                    count = line_count
+            for line in f:
+                line = line.decode('utf-8', errors='replace').strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(entry, dict):
+                    count += 1
+                    yield entry
+        self._line_count = count
+
+    def track_ids(self):
+        """Return the set of track IDs recorded in the journal; entries appended later are added to it."""
+        track_ids = set()
+        for entry in self:
+            if 'track_id' in entry:
+                track_ids.add(entry['track_id'])
+        self._track_ids = track_ids
+        return track_ids
+
+    def _open(self):
+        if self._file is not None:
+            return
+        # Terminate a torn last line left by a crash so new entries start cleanly
+        needs_newline = False
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b'\n'
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if needs_newline:
+            self._file.write('\n')
+
+    def append(self, entry):
+        """Append one entry, fsync'ing once enough entries or time have accumulated."""
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._open()
+            self._file.write(line)
+            self._file.flush()
+            if self._line_count is not None:
+                self._line_count += 1
+            if self._track_ids is not None and 'track_id' in entry:
+                self._track_ids.add(entry['track_id'])
+            self._pending += 1
+            if self._pending >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def flush(self):
+        """Force all appended entries to disk."""
+        with self._lock:
+            if self._file is not None and self._pending:
+                self._sync()
+
+    def needs_compaction(self, unique_count=None):
+        """True when duplicate entries make up a noticeable part of the journal.
+
+        `unique_count` is the number of tracks in it, by default the size of
+        the `track_ids()` set; False while either count is unknown.
+        """
+        if unique_count is None and self._track_ids is not None:
+            unique_count = len(self._track_ids)
+        if self._line_count is None or unique_count is None:
+            return False
+        return self._line_count > max(unique_count * 1.25, unique_count + 50)
+
+    def compact(self, forget=()):
+        """Rewrite the journal keeping only the latest entry per track ID, and none for the IDs in `forget`."""
+        forget = set(forget)
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            latest = {}
+            for entry in self:
+                if entry.get('track_id') in forget:
+                    continue
+                key = entry.get('track_id') or json.dumps(entry, sort_keys=True)
+                latest.pop(key, None)
+                latest[key] = entry
+            self._write_atomically(latest.values())
+            self._line_count = len(latest)
+            if self._track_ids is not None:
+                self._track_ids.difference_update(forget)
+            self._pending = 0
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                if self._pending:
+                    self._sync()
+                self._file.close()
+                self._file = None
+
+
+class FailedTracksJournal(DownloadJournal):
+    """JSON Lines list of the tracks of a playlist folder that failed for good.
+
+    A failure is appended as soon as a track runs out of retries; when the
+    track is downloaded later, a `resolved` entry cancels it. `compact` drops
+    resolved tracks and removes the file once nothing is left, so a "retry
+    failed only" run can replay exactly the tracks that are still missing.
+    """
+
+    filename = FAILED_JOURNAL_FILENAME
+
+    def __init__(self, directory):
+        # Failures are rare, so every entry goes to disk right away
+        super().__init__(directory, fsync_every=1)
+
+    def _migrate_legacy_log(self):
+        return False
+
+    def failed_entries(self):
+        """Return the latest entry of every track that is still failing."""
+        latest = {}
+        for entry in self:
+            track_id = entry.get('track_id')
+            if not track_id:
+                continue
+            latest.pop(track_id, None)
+            latest[track_id] = entry
+        return [entry for entry in latest.values() if not entry.get('resolved')]
+
+    def mark_resolved(self, track_id):
+        self.append({'track_id': track_id, 'resolved': True})
+
+    def compact(self):
+        """Rewrite the journal with one entry per failing track, or delete it if there is none."""
+        entries = self.failed_entries()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if entries:
+                self._write_atomically(entries)
+            elif os.path.exists(self.path):
+                os.remove(self.path)
+            self._line_count = len(entries)
+            self._pending = 0
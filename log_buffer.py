@@ -0,0 +1,69 @@
+"""Batched log delivery for the GUI: worker threads enqueue, the Tk thread drains on a timer."""
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+DEFAULT_LOG_FILE = os.path.expanduser("~/SpotifyDownloader/logs/downloader.log")
+
+
+class LogBuffer:
+    """Thread-safe queue of log messages, drained in batches and copied to a rotating log file.
+
+    `put` is cheap and may be called from any thread; `drain` is called
+    periodically by the consumer and returns everything queued since the
+    last call. Every drained message is appended to the log file (rotated
+    at `max_bytes`, keeping `backup_count` old files), so a widget showing
+    only the newest lines loses nothing. Without `log_path`, or if the file
+    can't be opened, messages are only counted.
+    """
+
+    def __init__(self, log_path=DEFAULT_LOG_FILE, max_bytes=5 * 2**20, backup_count=3):
+        self._queue = queue.SimpleQueue()
+        self.log_path = log_path
+        self.messages = 0
+        self._rate_window = []  # (time, messages) of recent drains, for rate()
+        self._handler = None
+        if log_path:
+            try:
+                os.makedirs(os.path.dirname(log_path), exist_ok=True)
+                self._handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=max_bytes,
+                                                                     backupCount=backup_count, encoding="utf-8")
+            except OSError:
+                self._handler = None
+            else:
+                self._handler.terminator = ""  # Messages carry their own newlines
+                self._handler.setFormatter(logging.Formatter("%(message)s"))
+
+    def put(self, message):
+        self._queue.put(message)
+
+    def drain(self):
+        """Return the queued messages (oldest first) and write them to the log file."""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            return batch
+        self.messages += len(batch)
+        now = time.monotonic()
+        self._rate_window = [(t, n) for t, n in self._rate_window if now - t < 5.0] + [(now, len(batch))]
+        if self._handler is not None:
+            # One record per batch, so a busy run costs one write per drain rather than one per line
+            self._handler.handle(logging.LogRecord("gui", logging.INFO, __file__, 0, "".join(batch), None, None))
+        return batch
+
+    def rate(self):
+        """Messages per second over the last few seconds of drains."""
+        now = time.monotonic()
+        return sum(n for t, n in self._rate_window if now - t < 5.0) / 5.0
+
+    def close(self):
+        self.drain()
+        if self._handler is not None:
+            self._handler.close()
+            self._handler = None
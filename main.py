@@ -1,562 +1,363 @@
-import tkinter as tk
-import re
-from tkinter import filedialog, scrolledtext, messagebox
-import json, subprocess, threading, datetime
-import shutil
+import argparse
 import os
-import sys
+import shutil
 import signal
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-# Global flag to indicate if we should stop
-global_stop = False
-
-def signal_handler(sig, frame):
-    global global_stop
-    print("\nFinishing current download before exiting...")
-    global_stop = True
-
-try:
-    from pathlib import Path
-except ImportError:
-    Path = None
-    # If Path is not available, fall back to os.path functions
-class AskPlaylistExistsDialog(tk.Toplevel):
-    def __init__(self, parent, playlist_name, num_files, existing_folders=None):
-        super().__init__(parent)
-        self.transient(parent)
-        self.title("Playlist Exists")
-        self.result = "cancel"  # Default to cancel
-        self.selected_folder = None
-
-        message = f"The folder for '{playlist_name}' already exists and contains {num_files} files."
-        tk.Label(self, text=message, wraplength=350).pack(padx=20, pady=10)
-        tk.Label(self, text="Select an existing folder or create a new one:").pack(pady=5)
-
-        self.folder_var = tk.StringVar()
-        self.folder_var.set(None)  # Ensure no folder is selected by default
-        folder_frame = tk.Frame(self)
-        folder_frame.pack(pady=5)
-
-        if existing_folders:
-            existing_folders = sorted(existing_folders)
-            for folder in existing_folders:
-                tk.Radiobutton(folder_frame, text=folder, variable=self.folder_var, value=folder).pack(anchor='w')
-
-        btn_frame = tk.Frame(self)
-        btn_frame.pack(pady=10)
-
-        tk.Button(btn_frame, text="Use Selected Folder", command=self.on_update).pack(side=tk.LEFT, padx=5, pady=5)
-        tk.Button(btn_frame, text="Create New Folder", command=self.on_create_new).pack(side=tk.LEFT, padx=5, pady=5)
-        tk.Button(btn_frame, text="Cancel", command=self.on_cancel).pack(side=tk.LEFT, padx=5, pady=5)
-
-        self.grab_set()
-        self.protocol("WM_DELETE_WINDOW", self.on_cancel)
-        
-        # Center the dialog
-        self.update_idletasks()
-        x = parent.winfo_x() + (parent.winfo_width() // 2) - (self.winfo_width() // 2)
-        y = parent.winfo_y() + (parent.winfo_height() // 2) - (self.winfo_height() // 2)
-        self.geometry(f"+{x}+{y}")
-        self.wait_window(self)
-
-    def on_create_new(self):
-        self.result = "new"
-        self.selected_folder = None
-        self.destroy()
-
-    def on_update(self):
-        self.result = "update"
-        self.selected_folder = self.folder_var.get()
-        self.destroy()
-
-    def on_cancel(self):
-        self.result = "cancel"
-        self.selected_folder = None
-        self.destroy()
-
-class SpotifyJSONDownloader:
-    def __init__(self, master):
-        self.master = master
-        master.title("Spotify JSON Downloader (using yt-dlp)")
-
-        self.filepath = None
-        self.download_dir = None
-        btn_frame = tk.Frame(master)
-        btn_frame.pack(padx=10, pady=10)
-
-        self.select_btn = tk.Button(btn_frame, text="Select JSON File", command=self.select_file)
-        self.select_btn.pack(side=tk.LEFT, padx=5)
-
-        self.download_btn = tk.Button(btn_frame, text="Download Tracks", command=self.start_download)
-        self.download_btn.pack(side=tk.LEFT, padx=5)
-
-        self.log_area = scrolledtext.ScrolledText(master, width=80, height=20, state='disabled')
-        self.log_area.pack(padx=10, pady=(0,10))
-
-        self.ffprobe_exe_path = None 
-        self.ffmpeg_exe_path = None # Also store ffmpeg.exe path for good measure, though yt-dlp uses it directly
-        self.log_lock = threading.Lock()
-        self.max_workers = 5  # Number of concurrent downloads
-
-        # Scan for incomplete downloads and missing log entries on startup
-        self.master.after(500, self.check_for_incomplete_downloads)
-
-    def check_for_incomplete_downloads(self):
-        if not self.download_dir:
-            return
-        log_filepath = os.path.join(self.download_dir, 'download_log.json')
-        downloaded_ids = set()
-        if os.path.exists(log_filepath):
-            try:
-                with open(log_filepath, 'r', encoding='utf-8') as f_log:
-                    log_data = json.load(f_log)
-                    downloaded_ids = {item['track_id'] for item in log_data if 'track_id' in item}
-            except Exception:
-                pass
-        # Find .part and .ytdl files
-        orphaned_files = []
-        for fname in os.listdir(self.download_dir):
-            if fname.endswith('.part') or fname.endswith('.ytdl'):
-                orphaned_files.append(fname)
-        # Find audio files not in log
-        audio_exts = ['.mp3', '.m4a', '.wav', '.ogg', '.flac']
-        orphaned_tracks = []
-        for fname in os.listdir(self.download_dir):
-            if any(fname.endswith(ext) for ext in audio_exts):
-                name = os.path.splitext(fname)[0]
-                # crude check: name not in log
-                if not any(name in entry.get('track_name', '') for entry in log_data):
-                    orphaned_tracks.append(fname)
-        if orphaned_files or orphaned_tracks:
-            msg = "Some incomplete or unlogged downloads were found:\n"
-            if orphaned_files:
-                msg += "\nPartial files (likely interrupted):\n" + '\n'.join(orphaned_files)
-            if orphaned_tracks:
-                msg += "\nAudio files not in log (may be incomplete or added manually):\n" + '\n'.join(orphaned_tracks)
-            msg += "\n\nWould you like to attempt to re-download these tracks?"
-            if messagebox.askyesno("Incomplete Downloads Detected", msg):
-                self.redownload_orphaned_tracks(orphaned_files, orphaned_tracks)
-
-    def redownload_orphaned_tracks(self, orphaned_files, orphaned_tracks):
-        # Remove orphaned .part/.ytdl files
-        for fname in orphaned_files:
-            try:
-                os.remove(os.path.join(self.download_dir, fname))
-            except Exception:
-                pass
-        # Attempt to re-download orphaned tracks (by name)
-        for fname in orphaned_tracks:
-            track_name = os.path.splitext(fname)[0]
-            # Try to find in JSON file
-            with open(self.filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            found = False
-            for tier in data.get('state', {}).values():
-                for item in tier:
-                    content = item.get('content', {})
-                    if content.get('name') == track_name:
-                        artist_names = [artist['name'].strip() for artist in content.get('artists', []) if isinstance(artist, dict) and artist.get('name', '').strip()]
-                        self._download_track((track_name, artist_names, self.download_dir, item.get('id'), track_name))
-                        found = True
-                        break
-                if found:
-                    break
-        messagebox.showinfo("Redownload Complete", "Redownload of orphaned tracks is complete.")
-
-    def _sanitize_filename(self, name):
-        """Remove characters that are invalid for file/folder names."""
-        # Windows invalid chars: < > : " / \ | ? *
-        # Also remove other potentially problematic chars.
-        return re.sub(r'[<>:"/\\|?*]', '_', name).strip()
-
-    def select_file(self):
-        path = filedialog.askopenfilename(filetypes=[("JSON files", "*.json")])
-        if path:
-            self.filepath = path
-            self.master.after(0, lambda: messagebox.showinfo("File Selected", f"Selected file:\n{path}"))
-
-    def start_download(self):
-        if not self.filepath:
-            self.master.after(0, lambda: messagebox.showerror("Error", "Please select a JSON file first."))
-            return
-        
-        # --- Determine paths for bundled executables (yt-dlp, ffmpeg, ffprobe) ---
-        if getattr(sys, 'frozen', False): # Running as a PyInstaller bundle
-            # sys._MEIPASS points to the temp extraction folder
-            base_temp_path = sys._MEIPASS
-            self.ffprobe_exe_path = os.path.join(base_temp_path, "ffprobe.exe")
-            self.ffmpeg_exe_path = os.path.join(base_temp_path, "ffmpeg.exe")
-            yt_dlp_executable = "yt-dlp.exe" # Assume yt-dlp is also bundled
-            # If yt-dlp is not bundled, it needs to be in PATH or explicitly added via --add-binary
-            # For now, we'll assume it's either in PATH or bundled as yt-dlp.exe
-            # If it's bundled, its path is also in base_temp_path
-            self.yt_dlp_path = os.path.join(base_temp_path, yt_dlp_executable)
-            if not os.path.exists(self.yt_dlp_path):
-                 # Fallback: if yt-dlp.exe isn't found in _MEIPASS, check system PATH
-                 self.yt_dlp_path = shutil.which("yt-dlp")
-                 if not self.yt_dlp_path:
-                    self.master.after(0, lambda: messagebox.showerror("yt-dlp Missing", "yt-dlp.exe not found. Please ensure it's bundled or in your system PATH."))
-                    return
-
-        else: # Not bundled (running directly from Python)
-            self.yt_dlp_path = shutil.which("yt-dlp")
-            if not self.yt_dlp_path and shutil.which(sys.executable + " -m yt_dlp"):
-                self.yt_dlp_path = sys.executable + " -m yt_dlp" # For pip installed module
-            if not self.yt_dlp_path:
-                self.master.after(0, lambda: messagebox.showerror("yt-dlp Missing", "yt-dlp not found in system PATH. Please install it."))
-                return
-            
-            self.ffprobe_exe_path = shutil.which("ffprobe")
-            self.ffmpeg_exe_path = shutil.which("ffmpeg")
-
-        if not self.ffprobe_exe_path:
-            self.master.after(0, lambda: messagebox.showerror("FFprobe Missing", "ffprobe.exe not found. Please ensure FFmpeg is installed and its 'bin' directory is added to your system's PATH, or correctly bundled."))
-            return
-        if not self.ffmpeg_exe_path:
-            self.master.after(0, lambda: messagebox.showerror("FFmpeg Missing", "ffmpeg.exe not found. Please ensure FFmpeg is installed and its 'bin' directory is added to your system's PATH, or correctly bundled."))
-            return
-
-        self.log(f"Using yt-dlp from: {self.yt_dlp_path}\n")
-        self.log(f"Using ffprobe from: {self.ffprobe_exe_path}\n")
-
-        if not self.filepath:
-            self.master.after(0, lambda: messagebox.showerror("Error", "JSON file path is not set. Please select a JSON file."))
-            return
-
-        json_filename_base = os.path.basename(self.filepath).rsplit('.', 1)[0]
-        
-        music_dir = os.path.expanduser("~/Music")
-        fallback_dir = os.path.expanduser("~/SpotifyDownloader")
-        playlist_folder_name = self._sanitize_filename(json_filename_base)
-
-        try:
-            download_dir = os.path.join(music_dir, playlist_folder_name)
-            os.makedirs(download_dir, exist_ok=True)
-        except OSError:
-            self.log("Could not create directory in Music folder. Falling back to SpotifyDownloader in user directory.")
-            download_dir = os.path.join(fallback_dir, playlist_folder_name)
-            self.master.after(0, lambda: messagebox.showwarning("Directory Fallback", "Could not create directory in Music folder. Falling back to SpotifyDownloader in user directory."))
-            os.makedirs(download_dir, exist_ok=True)
-        
-        # Gather all existing folders that match the playlist_folder_name pattern
-        parent_dir = os.path.dirname(download_dir)
-        base_name = os.path.basename(download_dir)
-        existing_folders = []
-        if os.path.exists(parent_dir):
-            for name in os.listdir(parent_dir):
-                full_path = os.path.join(parent_dir, name)
-                if os.path.isdir(full_path) and (name == base_name or name.startswith(base_name + "_")):
-                    existing_folders.append(name)
-        
-        # If only one existing folder and it is empty, skip dialog and use it directly
-        if len(existing_folders) == 1:
-            only_folder = os.path.join(parent_dir, existing_folders[0])
-            try:
-                num_files = len([name for name in os.listdir(only_folder) if os.path.isfile(os.path.join(only_folder, name))])
-            except OSError:
-                num_files = 0
-            if num_files == 0:
-                download_dir = only_folder
-                os.makedirs(download_dir, exist_ok=True)
-                self.download_dir = download_dir
-                self.master.after(0, lambda: self.select_btn.config(state='disabled'))
-                self.master.after(0, lambda: self.download_btn.config(state='disabled'))
-                threading.Thread(target=self.download).start()
-                return
-        
-        if os.path.exists(download_dir):
-            try:
-                num_files = len([name for name in os.listdir(download_dir) if os.path.isfile(os.path.join(download_dir, name))])
-            except OSError:
-                num_files = 0
-
-            dialog = AskPlaylistExistsDialog(self.master, playlist_folder_name, num_files, existing_folders=existing_folders)
-            choice = dialog.result
-            selected_folder = dialog.selected_folder
-
-            if choice == "new":
-                i = 1
-                original_download_dir = download_dir
-                while os.path.exists(download_dir):
-                    download_dir = f"{original_download_dir}_{i}"
-                    i += 1
-                os.makedirs(download_dir)
-            elif choice == "update" and selected_folder:
-                download_dir = os.path.join(parent_dir, selected_folder)
-            else: # "cancel" or window closed
-                self.log("Download cancelled by user.\n")
-                self.master.after(0, lambda: self.select_btn.config(state='normal'))
-                self.master.after(0, lambda: self.download_btn.config(state='normal'))
-                return
-        else:
-            os.makedirs(download_dir, exist_ok=True)
-        
-        self.download_dir = download_dir
-
-        self.master.after(0, lambda: self.select_btn.config(state='disabled'))
-        self.master.after(0, lambda: self.download_btn.config(state='disabled'))
-        threading.Thread(target=self.download).start()
-
-    def _sanitize_filename(self, filename):
-        """Removes invalid characters for Windows filenames."""
-        # Define characters that are invalid in Windows filenames
-        invalid_chars = r'[<>:"/\|?*\n\r\t]' # Added common newline/tab chars as well
-        # Replace invalid characters with an underscore
-        sanitized_filename = re.sub(invalid_chars, '_', filename)
-        # Windows doesn't allow filenames to end with a dot or space
-        sanitized_filename = sanitized_filename.rstrip(' .')
-        return sanitized_filename
-
-    def _download_track(self, track_info):
-        track_name, artist_names, download_path, track_id, _ = track_info
-        
-        # Create a search query from artist and track name
-        base_query = f"{' '.join(artist_names)} - {track_name}" if artist_names else track_name
-        search_query = f"ytsearch1:{base_query}"
-        self.log(f"Searching for: {search_query}\n")
-        
-        safe_download_path = shlex.quote(download_path) if sys.platform != 'win32' else download_path
-        output_template = os.path.join(safe_download_path, f"{self._sanitize_filename(track_name)} - {self._sanitize_filename(', '.join(artist_names))}.%(ext)s")
-        
-        cmd = [self.yt_dlp_path, 
-               "-x",  # Extract audio
-               "--audio-format", "mp3",
-               "--embed-thumbnail",
-               "--embed-metadata",
-               "--default-search", "ytsearch",  # Enable YouTube search
-               "--format", "bestaudio/best",  # Get best audio quality
-               "--audio-quality", "0",  # Best audio quality
-               "--no-playlist",  # Don't download playlists
-               "-o", output_template,
-               search_query]  # The search query
-
-        startupinfo = None
-        if sys.platform == "win32":
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = subprocess.SW_HIDE
-
-        try:
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8', startupinfo=startupinfo)
-            stdout, stderr = process.communicate()
-
-            if process.returncode == 0:
-                self.log(f"Successfully downloaded: {track_name}\n")
-                
-                # Check if we should stop
-                if global_stop:
-                    self.log("Finishing current download before shutdown...\n")
-                    return
-
-                # --- Log successful download ---
-                log_filepath = os.path.join(download_path, 'download_log.json')
-                new_entry = {
-                    'track_id': track_id,
-                    'track_name': track_name,
-                    'artists': artist_names,
-                    'search_query': search_query,
-                    'downloaded_at': datetime.datetime.now().isoformat()
-                }
-
-                with self.log_lock:
-                    log_data = []
-                    if os.path.exists(log_filepath):
-                        try:
-                            with open(log_filepath, 'r', encoding='utf-8') as f:
-                                log_data = json.load(f)
-                        except (json.JSONDecodeError, FileNotFoundError):
-                            pass # Overwrite if corrupt or missing
-                    
-                    if isinstance(log_data, list):
-                        log_data.append(new_entry)
-                    else: # If log is not a list, start a new one
-                        log_data = [new_entry]
-
-                    with open(log_filepath, 'w', encoding='utf-8') as f:
-                        json.dump(log_data, f, indent=4)
-                
-            else:
-                self.log(f"Error downloading {track_name}. yt-dlp stderr:\n{stderr}\n")
-
-        except Exception as e:
-            self.log(f"Exception while downloading {track_name}: {e}\n")
-
-    def download(self):
-        try:
-            with open(self.filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-            # --- Load download log ---
-            log_filepath = os.path.join(self.download_dir, 'download_log.json')
-            downloaded_tracks = set()
-            if os.path.exists(log_filepath):
-                try:
-                    with open(log_filepath, 'r', encoding='utf-8') as f_log:
-                        log_data = json.load(f_log)
-                        # Use track_id as the unique identifier
-                        downloaded_tracks = {item['track_id'] for item in log_data if 'track_id' in item}
-                    self.log(f"Loaded {len(downloaded_tracks)} entries from download log.\n")
-                except (json.JSONDecodeError, FileNotFoundError):
-                    self.log(f"Warning: Could not parse {os.path.basename(log_filepath)}. Starting fresh for this folder.\n")
-
-            tracks_info_for_download = []
-            
-            if not isinstance(data.get('state'), dict):
-                self.log("Error: 'state' key not found or is not a dictionary in the JSON file.\n")
-                self.master.after(0, lambda: messagebox.showerror("Invalid JSON", "The JSON file doesn't have the expected 'state' structure."))
-                return
-            
-            total_tracks_in_json = 0
-            # Process tracks from the 'state' dictionary
-            for tier_name, tier_items in data['state'].items():
-                if not isinstance(tier_items, list):
-                    continue
-                
-                for item in tier_items:
-                    total_tracks_in_json += 1
-                    if not isinstance(item, dict):
-                        continue
-                    
-                    content = item.get('content', {})
-                    if not isinstance(content, dict):
-                        self.log(f"Skipping item with invalid content: {item}\n")
-                        continue
-                    
-                    track_id = item.get('id')
-                    track_name = content.get('name')
-                    
-                    if not track_id or not track_name:
-                        self.log(f"Skipping item with missing ID or name: {content.get('name', 'Unknown')}\n")
-                        continue
-
-                    # Use track_id as the unique identifier
-                    if track_id in downloaded_tracks:
-                        continue
-                    
-                    track_name = content.get('name')
-                    if not track_name or not isinstance(track_name, str):
-                        continue
-                    
-                    artist_names = [artist['name'].strip() for artist in content.get('artists', []) if isinstance(artist, dict) and artist.get('name', '').strip()]
-                    
-                    tracks_info_for_download.append((track_name, artist_names, self.download_dir, track_id, track_name))
-            
-            self.log(f"Found {total_tracks_in_json} tracks in JSON file.\n")
-            if downloaded_tracks:
-                self.log(f"{len(downloaded_tracks)} tracks were already downloaded.\n")
-
-            if not tracks_info_for_download:
-                self.log("No new tracks to download.\n")
-                self.master.after(0, lambda: messagebox.showinfo("All Done", "No new tracks to download."))
-                return
-            
-            self.log(f"Starting download of {len(tracks_info_for_download)} new tracks...\n")
-
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                futures = [executor.submit(self._download_track, track_info) for track_info in tracks_info_for_download]
-                
-                for future in as_completed(futures):
-                    try:
-                        future.result()
-                    except Exception as e:
-                        self.log(f"Error in download thread: {e}\n")
-
-            self.log("All downloads completed or failed.\n")
-
-            # --- REVISED: Manual FFprobe Probing ---
-            if Path is not None and self.ffprobe_exe_path and os.path.exists(self.ffprobe_exe_path):
-                self.log("Probing downloaded files...\n")
-                
-                ffprobe_startupinfo = None
-                if sys.platform == "win32":
-                    ffprobe_startupinfo = subprocess.STARTUPINFO()
-                    ffprobe_startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                    ffprobe_startupinfo.wShowWindow = subprocess.SW_HIDE
-
-                for fpath in Path(self.download_dir).glob("*.mp3"):
-                    # Construct ffprobe command to output JSON
-                    ffprobe_cmd = [
-                        self.ffprobe_exe_path,
-                        "-v", "quiet",           # Suppress verbose output
-                        "-print_format", "json", # Output in JSON format
-                        "-show_format",          # Show format info
-                        "-show_streams",         # Show stream info
-                        str(fpath)               # Input file path
-                    ]
-                    
-                    try:
-                        # Execute ffprobe directly using subprocess.run
-                        ffprobe_result = subprocess.run(
-                            ffprobe_cmd,
-                            capture_output=True,
-                            text=True,
-                            encoding='utf-8',
-                            errors='replace',
-                            check=False, # Don't raise an exception for non-zero exit codes
-                            stdin=subprocess.DEVNULL,
-                            startupinfo=ffprobe_startupinfo
-                        )
-
-                        # Parse JSON output
-                        if ffprobe_result.returncode == 0 and ffprobe_result.stdout:
-                            try:
-                                info = json.loads(ffprobe_result.stdout)
-                                duration = info.get('format', {}).get('duration')
-                                if duration:
-                                    self.log(f"Probed {fpath.name}: duration={float(duration):.2f}s\n")
-                                else:
-                                    self.log(f"Probed {fpath.name}: duration not found.\n")
-                            except json.JSONDecodeError:
-                                self.log(f"ERROR: Failed to parse ffprobe JSON for {fpath.name}. STDOUT:\n{ffprobe_result.stdout[:500]}...\n")
-                                self.log(f"FFprobe STDERR:\n{ffprobe_result.stderr}\n") # Log ffprobe stderr directly
-                        else:
-                            self.log(f"WARNING: ffprobe failed for {fpath.name} (Return code: {ffprobe_result.returncode}).\n")
-                            self.log(f"FFprobe STDERR:\n{ffprobe_result.stderr}\n") # Log ffprobe stderr directly
-
-                    except FileNotFoundError:
-                        self.log(f"ERROR: ffprobe.exe not found at '{self.ffprobe_exe_path}' during probing.\n")
-                    except Exception as e:
-                        self.log(f"ERROR during ffprobe for {fpath.name}: {e}\n")
-            else:
-                self.log("Skipping file probing: ffprobe.exe path not found or not bundled.\n")
-
-            self.master.after(0, lambda: messagebox.showinfo("Done", "All tracks have been processed by yt-dlp."))
-
-        except json.JSONDecodeError:
-            err_msg = "Error: Invalid JSON file. Please ensure the file is correctly formatted."
-            self.log(f"{err_msg}\n")
-            self.master.after(0, lambda msg=err_msg: messagebox.showerror("JSON Error", msg))
-        except Exception as e:
-            err_msg = str(e)
-            self.log(f"An unexpected error occurred: {err_msg}\n")
-            self.master.after(0, lambda msg=err_msg: messagebox.showerror("Error", msg))
-        finally:
-            self.master.after(0, lambda: self.select_btn.config(state='normal'))
-            self.master.after(0, lambda: self.download_btn.config(state='normal'))
-
-    def log(self, message):
-        self.master.after(0, self._append_log, message)
-
-    def _append_log(self, message):
-        self.log_area.config(state='normal')
-        self.log_area.insert(tk.END, message)
-        self.log_area.see(tk.END)
-        self.log_area.config(state='disabled')
+import sys
+import threading
+
+from distributed import Coordinator, Worker, LEASE_SECONDS
+from engine import DownloadEngine
+from matching import DEFAULT_CANDIDATES, MIN_MATCH_SCORE
+from scheduler import PlaylistScheduler, POLICIES
+from art_cache import DEFAULT_ART_CACHE, DEFAULT_ART_CACHE_BYTES
+from search_cache import DEFAULT_SEARCH_CACHE
+from state_store import DEFAULT_STATE_DB
+from track_store import DEFAULT_TRACK_STORE
+from sync import REMOVED_ACTIONS
+from transcode import OUTPUT_FORMATS
+from watch import ExportWatcher
+
+
+def install_signal_handlers(engine):
+    def signal_handler(sig, frame):
+        print("\nStopping: cancelling queued and running downloads, finishing the tracks already downloaded...")
+        # stop() takes locks the interrupted main thread may be holding, so don't run it in the handler itself
+        threading.Thread(target=engine.stop, name="stop").start()
 
-if __name__ == '__main__':
-    # Set up signal handlers
     signal.signal(signal.SIGINT, signal_handler)  # Handle Ctrl+C
     signal.signal(signal.SIGTERM, signal_handler)  # Handle termination
-    
-    root = tk.Tk()
-    app = SpotifyJSONDownloader(root)
-    
-    def on_closing():
-        global global_stop
-        global_stop = True
-        # Let the current download finish
-        root.after(100, root.destroy)
-    
-    root.protocol("WM_DELETE_WINDOW", on_closing)
-    root.mainloop()
\ No newline at end of file
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Download the tracks of Spotify Tierlist JSON exports with yt-dlp. "
+                    "Starts the GUI unless --json is given.")
+    parser.add_argument("--json", nargs="+", metavar="FILE",
+                        help="tierlist export(s) to download without the GUI")
+    parser.add_argument("--out", metavar="DIR",
+                        help="parent folder for the playlist folders (default: ~/Music)")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="maximum number of concurrent downloads (default: 8)")
+    parser.add_argument("--format", dest="output_format", choices=OUTPUT_FORMATS, default="mp3",
+                        help="mp3: re-encode every track to mp3 (default); native: keep YouTube's opus/AAC audio "
+                             "and only remux it into .opus/.m4a, which is faster and lossless")
+    parser.add_argument("--transcode-workers", type=int,
+                        help="number of concurrent ffmpeg encodes (default: CPU count)")
+    parser.add_argument("--no-adaptive", action="store_true",
+                        help="always run --workers downloads instead of sizing the pool from throughput and errors")
+    parser.add_argument("--fragments", type=int, default=1,
+                        help="connections per download: fetch each track's audio as that many byte ranges (or "
+                             "fragments) side by side, for links where one stream can't fill the bandwidth (default: 1)")
+    parser.add_argument("--connections", type=int,
+                        help="with --fragments, connections for all downloads together; extra connections only go to "
+                             "tracks while the download pool leaves room (default: --workers)")
+    parser.add_argument("--resolve-workers", type=int, default=2,
+                        help="number of concurrent YouTube searches (default: 2)")
+    parser.add_argument("--probe-workers", type=int,
+                        help="number of concurrent ffprobe runs (default: CPU count, at most 8)")
+    parser.add_argument("--schedule", choices=("sequential",) + POLICIES, default="round-robin",
+                        help="with several --json exports, download them together through one worker pool, taking "
+                             "turns (round-robin, default), in proportion to --weights (weighted), or highest tiers "
+                             "first across all exports (tier); sequential downloads one export after the other")
+    parser.add_argument("--weights", type=float, nargs="+", metavar="W",
+                        help="with --schedule weighted, one weight per --json export (default: 1 each)")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="only retry the tracks that failed in earlier runs (listed in each folder's "
+                             "failed_tracks.jsonl) instead of downloading the whole export")
+    parser.add_argument("--sync", action="store_true",
+                        help="only download the tracks added since the last sync of each folder (the folder keeps a "
+                             "snapshot of the export it was last synced with)")
+    parser.add_argument("--watch", metavar="DIR",
+                        help="keep running and --sync every tierlist export in DIR, and again whenever one is added "
+                             "or changed")
+    parser.add_argument("--debounce", type=float, default=2.0,
+                        help="with --watch, seconds an export has to stay unchanged before it's synced (default: 2)")
+    parser.add_argument("--poll", action="store_true",
+                        help="with --watch, compare the folder's files every --poll-interval seconds instead of using "
+                             "inotify (which is used on Linux and misses changes made by other machines on network "
+                             "shares)")
+    parser.add_argument("--poll-interval", type=float, default=5.0,
+                        help="with --watch, seconds between scans when polling (default: 5)")
+    parser.add_argument("--removed", choices=REMOVED_ACTIONS, default="keep",
+                        help="with --sync, what to do with tracks removed from the playlist: keep their files "
+                             "(default), archive them into a subfolder, or prune (delete) them")
+    parser.add_argument("--match-candidates", type=int, default=DEFAULT_CANDIDATES,
+                        help="search results compared with each track's duration, title and artists before "
+                             f"downloading the best one; 1 downloads the first result (default: {DEFAULT_CANDIDATES})")
+    parser.add_argument("--min-match-score", type=float, default=MIN_MATCH_SCORE,
+                        help="report tracks whose best search result scores lower (0-1) as failed instead of "
+                             f"downloading it (default: {MIN_MATCH_SCORE})")
+    parser.add_argument("--max-retries", type=int, default=4,
+                        help="retries per track after temporary errors such as HTTP 429/5xx or timeouts (default: 4)")
+    parser.add_argument("--search-rate", type=float, default=2.0,
+                        help="YouTube searches per second across all workers, 0 for no limit (default: 2)")
+    parser.add_argument("--download-rate", type=float, default=4.0,
+                        help="downloads started per second across all workers, 0 for no limit (default: 4)")
+    parser.add_argument("--stall-timeout", type=float, default=60,
+                        help="kill and retry a download after this many seconds without progress (default: 60); "
+                             "the in-process backend can't kill a download, its connections time out after this "
+                             "long without data instead")
+    parser.add_argument("--discard-partial", action="store_true",
+                        help="delete the partial files of downloads cancelled with Ctrl+C instead of keeping them "
+                             "so the next run resumes them")
+    parser.add_argument("--redownload-incomplete", action="store_true",
+                        help="before downloading an export, download the tracks of partial files and of audio files "
+                             "missing from the folder's download journal again (e.g. after a crash)")
+    parser.add_argument("--no-search-cache", action="store_true",
+                        help="search YouTube again for every track instead of reusing earlier results")
+    parser.add_argument("--cover", choices=["album", "video"], default="album",
+                        help="cover art to embed: the Spotify album cover from the export, kept in a cache shared by "
+                             "all tracks (default), or each video's thumbnail")
+    parser.add_argument("--art-cache-mb", type=int, default=DEFAULT_ART_CACHE_BYTES // 2 ** 20,
+                        help="size limit of the album art cache in ~/SpotifyDownloader/art; the least recently used "
+                             f"covers are evicted (default: {DEFAULT_ART_CACHE_BYTES // 2 ** 20})")
+    parser.add_argument("--state-db", nargs="?", const=DEFAULT_STATE_DB, metavar="PATH",
+                        help=f"use the shared SQLite state database (default path: {DEFAULT_STATE_DB})")
+    parser.add_argument("--track-store", nargs="?", const=DEFAULT_TRACK_STORE, metavar="PATH",
+                        help="keep every track once in a store shared by all playlist folders and link it into them "
+                             f"(default path: {DEFAULT_TRACK_STORE})")
+    parser.add_argument("--metrics-file", metavar="PATH",
+                        help="keep per-stage timings and byte counters in PATH as JSON and as Prometheus text "
+                             "(PATH with .json and .prom extensions), updated during the run; point node_exporter's "
+                             "textfile collector at the .prom file")
+    parser.add_argument("--serve", metavar="ADDRESS",
+                        help="don't download here, but hand the tracks of the --json export out to workers started "
+                             "with --worker; ADDRESS is host:port or unix:/path/to/socket (listen on trusted "
+                             "networks only)")
+    parser.add_argument("--worker", metavar="ADDRESS",
+                        help="download tracks for the coordinator (--serve) at ADDRESS and send the files back")
+    parser.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS,
+                        help="with --serve, give a worker's tracks to another worker when it hasn't renewed them "
+                             f"for this long (default: {LEASE_SECONDS})")
+    parser.add_argument("--yt-dlp", dest="yt_dlp_path", metavar="PATH",
+                        help="yt-dlp executable to use instead of the one on PATH (implies --backend subprocess)")
+    parser.add_argument("--backend", choices=["auto", "in-process", "subprocess"], default="auto",
+                        help="run yt-dlp in this process (reusing connections) or as one subprocess per track "
+                             "(default: in-process when the yt_dlp package is installed)")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.art_cache_mb < 1:
+        parser.error("--art-cache-mb must be at least 1")
+    if args.fragments < 1:
+        parser.error("--fragments must be at least 1")
+    if args.connections is not None and args.connections < 1:
+        parser.error("--connections must be at least 1")
+    if args.transcode_workers is not None and args.transcode_workers < 1:
+        parser.error("--transcode-workers must be at least 1")
+    if args.sync and args.retry_failed:
+        parser.error("--sync and --retry-failed can't be combined")
+    if args.redownload_incomplete and (not args.json or args.serve or args.retry_failed):
+        parser.error("--redownload-incomplete needs --json and can't be combined with --serve or --retry-failed")
+    if args.removed != "keep" and not (args.sync or args.watch):
+        parser.error("--removed only applies to --sync and --watch")
+    if args.watch and (args.json or args.serve or args.worker or args.retry_failed):
+        parser.error("--watch finds its exports itself and can't be combined with --json, --serve, --worker or "
+                     "--retry-failed")
+    if args.debounce < 0 or args.poll_interval <= 0:
+        parser.error("--debounce must not be negative and --poll-interval must be positive")
+    if args.serve and args.worker:
+        parser.error("--serve and --worker can't be combined")
+    if args.serve and (not args.json or len(args.json) != 1 or args.sync or args.retry_failed):
+        parser.error("--serve needs exactly one --json export and can't be combined with --sync or --retry-failed")
+    if args.worker and args.json:
+        parser.error("a --worker gets its tracks from the coordinator, not from --json")
+    if args.lease_seconds <= 0:
+        parser.error("--lease-seconds must be positive")
+    if args.weights is not None and (args.schedule != "weighted" or not args.json or len(args.weights) != len(args.json)
+                                     or min(args.weights) <= 0):
+        parser.error("--weights needs --schedule weighted and one positive weight per --json export")
+    if args.match_candidates < 1:
+        parser.error("--match-candidates must be at least 1")
+    if not 0 <= args.min_match_score <= 1:
+        parser.error("--min-match-score must be between 0 and 1")
+    if args.max_retries < 0:
+        parser.error("--max-retries must not be negative")
+    if args.search_rate < 0 or args.download_rate < 0:
+        parser.error("--search-rate and --download-rate must not be negative")
+    if args.resolve_workers < 1:
+        parser.error("--resolve-workers must be at least 1")
+    if args.probe_workers is not None and args.probe_workers < 1:
+        parser.error("--probe-workers must be at least 1")
+    return args
+
+
+def print_log(message):
+    sys.stdout.write(message if message.endswith("\n") else message + "\n")
+    sys.stdout.flush()
+
+
+def print_notification(kind, title, message):
+    if kind != "info":
+        sys.stderr.write(f"{title}: {message}\n")
+
+
+def create_engine(args):
+    return DownloadEngine(log=print_log, notify=print_notification, max_workers=args.workers,
+                            state_db_path=args.state_db, yt_dlp_path=args.yt_dlp_path, backend=args.backend,
+                            resolve_workers=args.resolve_workers, probe_workers=args.probe_workers,
+                            stall_timeout=args.stall_timeout, transcode_workers=args.transcode_workers,
+                            adaptive=not args.no_adaptive, max_retries=args.max_retries,
+                            fragments=args.fragments, connections=args.connections,
+                            art_cache_path=DEFAULT_ART_CACHE if args.cover == "album" else None,
+                            art_cache_bytes=args.art_cache_mb * 2 ** 20,
+                            search_rate=args.search_rate, media_rate=args.download_rate,
+                            track_store_path=args.track_store, output_format=args.output_format,
+                            keep_partial=not args.discard_partial, metrics_path=args.metrics_file,
+                            match_candidates=args.match_candidates, min_match_score=args.min_match_score,
+                            search_cache_path=None if args.no_search_cache else DEFAULT_SEARCH_CACHE)
+
+
+def print_summary(filepath, stats):
+    linked = f" ({stats.linked} linked from the track store)" if stats.linked else ""
+    extra = f" ({stats.unmatched} without a confident match)" if stats.unmatched else ""
+    extra += f", {stats.cancelled} cancelled" if stats.cancelled else ""
+    extra += f", {stats.removed} removed from the playlist" if stats.removed else ""
+    print_log(f"{os.path.basename(filepath)}: {stats.downloaded} downloaded{linked}, {stats.skipped} already present, "
+              f"{stats.failed} failed{extra}.")
+
+
+def redownload_incomplete(engine, filepath, download_dir):
+    """Download the tracks of partial and unlogged files in `download_dir` again. Returns False if that failed."""
+    orphaned_files, orphaned_tracks = engine.find_incomplete_downloads(download_dir)
+    if not orphaned_files and not orphaned_tracks:
+        return True
+    print_log(f"Found {len(orphaned_files)} partial files and {len(orphaned_tracks)} audio files missing from the "
+              f"download journal in {download_dir}")
+    stats = engine.redownload_orphaned_tracks(filepath, download_dir, orphaned_files, orphaned_tracks)
+    print_log(f"Incomplete downloads: {stats.downloaded} downloaded again, {stats.failed} failed.")
+    return not (stats.failed or stats.error)
+
+
+def run_cli(args):
+    """Download every export in `args.json` without a GUI. Returns the exit code."""
+    engine = create_engine(args)
+    install_signal_handlers(engine)
+    if not engine.locate_tools():
+        return 2
+
+    if len(args.json) > 1 and args.schedule != "sequential" and not (args.sync or args.retry_failed):
+        return run_scheduled(engine, args)
+
+    exit_code = 0
+    for filepath in args.json:
+        if engine.stop_event.is_set():
+            break
+        if not os.path.isfile(filepath):
+            print_notification("error", "Error", f"{filepath} does not exist.")
+            exit_code = 1
+            continue
+        download_dir = engine.default_download_dir(filepath, args.out)
+        if args.redownload_incomplete and not redownload_incomplete(engine, filepath, download_dir):
+            exit_code = 1
+        if engine.stop_event.is_set():
+            break
+        if args.retry_failed:
+            print_log(f"Retrying failed tracks of {filepath} in {download_dir}")
+            stats = engine.retry_failed(download_dir)
+        elif args.sync:
+            print_log(f"Syncing {filepath} into {download_dir}")
+            stats = engine.sync(filepath, download_dir, args.removed)
+        else:
+            print_log(f"Downloading {filepath} into {download_dir}")
+            stats = engine.download(filepath, download_dir)
+        print_summary(filepath, stats)
+        if stats.failed or stats.error:
+            exit_code = 1
+    return exit_code
+
+
+def run_scheduled(engine, args):
+    """Download all exports in `args.json` together through one pipeline. Returns the exit code."""
+    # Each playlist's summary is logged as soon as its last track is done
+    scheduler = PlaylistScheduler(engine, args.schedule)
+    exit_code = 0
+    for filepath, weight in zip(args.json, args.weights or [1] * len(args.json)):
+        if not os.path.isfile(filepath):
+            print_notification("error", "Error", f"{filepath} does not exist.")
+            exit_code = 1
+            continue
+        download_dir = engine.default_download_dir(filepath, args.out)
+        if args.redownload_incomplete and not redownload_incomplete(engine, filepath, download_dir):
+            exit_code = 1
+        scheduler.add(filepath, download_dir, weight)
+    stats = scheduler.run()
+    print_log(f"All playlists: {stats.downloaded} downloaded, {stats.skipped} already present, {stats.failed} failed"
+              f"{f', {stats.cancelled} cancelled' if stats.cancelled else ''}.")
+    if stats.failed or stats.error or any(playlist.stats.error for playlist in scheduler.playlists):
+        exit_code = 1
+    return exit_code
+
+
+def run_coordinator(args):
+    """Serve the tracks of the export in `args.json` to workers. Returns the exit code."""
+    engine = create_engine(args)
+    install_signal_handlers(engine)
+    filepath = args.json[0]
+    if not os.path.isfile(filepath):
+        print_notification("error", "Error", f"{filepath} does not exist.")
+        return 1
+    # The coordinator downloads nothing itself; ffprobe (optional) verifies the files the workers send
+    engine.ffprobe_exe_path = shutil.which("ffprobe")
+    download_dir = engine.default_download_dir(filepath, args.out)
+    print_log(f"Serving {filepath} into {download_dir}")
+    stats = Coordinator(engine, args.serve, args.lease_seconds).run(filepath, download_dir)
+    print_summary(filepath, stats)
+    return 1 if stats.failed or stats.error else 0
+
+
+def run_worker(args):
+    """Download tracks for the coordinator at `args.worker`. Returns the exit code."""
+    engine = create_engine(args)
+    install_signal_handlers(engine)
+    if not engine.locate_tools():
+        return 2
+    stats = Worker(engine, args.worker).run()
+    print_log(f"Worker finished: {stats.downloaded} downloaded, {stats.failed} failed.")
+    return 1 if stats.error else 0
+
+
+def run_watch(args):
+    """Sync the exports in `args.watch` whenever they change, until interrupted. Returns the exit code."""
+    engine = create_engine(args)
+    install_signal_handlers(engine)
+    if not os.path.isdir(args.watch):
+        print_notification("error", "Error", f"{args.watch} is not a folder.")
+        return 1
+    if not engine.locate_tools():
+        return 2
+    watcher = ExportWatcher(engine, args.watch, args.out, args.removed, args.debounce, args.poll_interval,
+                            force_polling=args.poll, on_synced=print_summary)
+    try:
+        watcher.run()
+    except OSError as e:
+        print_notification("error", "Error", f"Watching {args.watch} failed: {e}")
+        return 1
+    return 0
+
+
+def run_gui():
+    # tkinter is only imported here, so headless runs never pay for it
+    from gui import create_app
+
+    root, app = create_app()
+    install_signal_handlers(app.engine)
+    root.mainloop()
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.serve:
+        return run_coordinator(args)
+    if args.worker:
+        return run_worker(args)
+    if args.watch:
+        return run_watch(args)
+    if args.json:
+        return run_cli(args)
+    return run_gui()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
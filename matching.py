@@ -0,0 +1,98 @@
+"""Pick the search result that is actually the track, from the metadata of several candidates.
+
+The first search result is often a live version, a cover, a sped-up edit or
+a 10-hour loop. Searching for a few candidates costs one request either way;
+scoring them against the track's Spotify duration, title and artists before
+anything is downloaded saves the download and encode of a wrong file.
+"""
+import re
+import unicodedata
+
+DEFAULT_CANDIDATES = 5
+# Below this, the best candidate is reported instead of downloaded
+MIN_MATCH_SCORE = 0.6
+
+# Words that mark a different version of a song, unless the Spotify title has them too
+VERSION_WORDS = frozenset({
+    "live", "concert", "cover", "karaoke", "instrumental", "remix", "acoustic", "nightcore", "sped", "slowed",
+    "reverb", "8d", "loop", "hour", "hours", "extended", "mashup", "reaction", "tutorial", "lesson", "piano",
+    "edit", "demo", "rehearsal", "bass", "boosted",
+})
+_DURATION_WEIGHT = 0.5
+_TITLE_WEIGHT = 0.3
+_ARTIST_WEIGHT = 0.2
+_TOKEN = re.compile(r"\w+")
+
+
+def tokens(text):
+    """Lowercased words of `text` without accents, e.g. "Beyoncé - Halo" -> ["beyonce", "halo"]."""
+    text = unicodedata.normalize('NFKD', text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _TOKEN.findall(text.lower())
+
+
+def candidates_query(search_query, count):
+    """The search for `count` results instead of the one in `search_query` ("ytsearch1:...")."""
+    return f"ytsearch{count}:{search_query.split(':', 1)[1]}"
+
+
+def match_settings_key(candidates, min_score):
+    """Names how a search result was picked, so a cached pick is only reused under the same settings."""
+    if candidates <= 1:
+        return "first"
+    return f"best-of-{candidates}@{min_score:g}"
+
+
+def duration_score(candidate_seconds, track_seconds):
+    """1.0 within two seconds of the track's duration, falling to 0 at 15 s (or 10 % for long tracks) off."""
+    off = abs(candidate_seconds - track_seconds)
+    return max(0.0, 1.0 - max(0.0, off - 2.0) / max(15.0, 0.1 * track_seconds))
+
+
+def score_candidate(candidate, track_name, artist_names, duration=None):
+    """How likely a search result ({'title', 'duration', 'channel', ...}) is the track, from 0 to 1.
+
+    Combines how close the duration is, how much of the track title is in
+    the video title, and whether an artist is named in the title or channel.
+    Every version word (live, cover, loop, ...) that isn't in the track title
+    halves the score. Without a duration on either side, only the text counts.
+    """
+    title_words = set(tokens(candidate.get('title')))
+    channel_words = set(tokens(candidate.get('channel') or candidate.get('uploader')))
+    name_words = tokens(track_name)
+    title = sum(word in title_words for word in name_words) / len(name_words) if name_words else 0.0
+    artist = 0.0
+    for artist_name in artist_names:
+        artist_words = tokens(artist_name)
+        if artist_words and all(word in title_words or word in channel_words for word in artist_words):
+            artist = 1.0
+            break
+
+    if duration and candidate.get('duration'):
+        score = (_DURATION_WEIGHT * duration_score(candidate['duration'], duration)
+                 + _TITLE_WEIGHT * title + _ARTIST_WEIGHT * artist)
+    else:
+        score = (_TITLE_WEIGHT * title + _ARTIST_WEIGHT * artist) / (_TITLE_WEIGHT + _ARTIST_WEIGHT)
+    for _ in (VERSION_WORDS & title_words) - set(name_words):
+        score /= 2
+    return score
+
+
+def best_candidate(candidates, track_name, artist_names, duration=None):
+    """Return (candidate, score) of the best-scoring candidate, or (None, 0.0) if there are none.
+
+    Ties go to the earlier search result.
+    """
+    best, best_score = None, 0.0
+    for candidate in candidates:
+        score = score_candidate(candidate, track_name, artist_names, duration)
+        if best is None or score > best_score:
+            best, best_score = candidate, score
+    return best, best_score
+
+
+def format_duration(seconds):
+    if not seconds:
+        return "?:??"
+    seconds = int(round(seconds))
+    return f"{seconds // 60}:{seconds % 60:02d}"
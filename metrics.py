@@ -0,0 +1,166 @@
+"""Per-stage timings and byte counters of the download pipeline, exported as JSON and Prometheus text."""
+import json
+import os
+import threading
+import time
+
+from progress import format_bytes
+
+# Where a track's time goes; "track" is the whole way from entering the pipeline to being recorded
+STAGES = ("search", "cover", "download", "encode", "probe", "journal", "log", "track")
+# Upper bounds (seconds) of the histogram buckets; fixed, so memory doesn't grow with the number of tracks
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# DownloadStats fields exported as track counters
+TRACK_RESULTS = ("downloaded", "skipped", "failed", "unmatched", "retried", "linked", "cancelled")
+PROMETHEUS_PREFIX = "spotify_downloader"
+
+
+class StageTimes:
+    """Histogram of the durations recorded for one stage."""
+
+    __slots__ = ('count', 'seconds', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)  # The last one counts everything above BUCKETS[-1]
+
+    def add(self, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.seconds += other.seconds
+        self.max = max(self.max, other.max)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    def quantile(self, q):
+        """Estimate the `q` quantile by interpolating within its bucket, like Prometheus' histogram_quantile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            if n and seen + n >= rank:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / n)
+            seen += n
+        return self.max
+
+
+class PipelineMetrics:
+    """Thread-safe stage timings and counters for one run, or several runs merged together."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {stage: StageTimes() for stage in STAGES}
+        self.counters = {'bytes_downloaded': 0, 'bytes_written': 0}
+        self.tracks = dict.fromkeys(TRACK_RESULTS, 0)
+
+    def time(self, stage, seconds):
+        with self._lock:
+            self.stages[stage].add(seconds)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def add_stats(self, stats):
+        """Add the track counts of a DownloadStats."""
+        with self._lock:
+            for field in TRACK_RESULTS:
+                self.tracks[field] += getattr(stats, field)
+
+    def merge(self, other):
+        with self._lock, other._lock:
+            for stage, times in other.stages.items():
+                self.stages[stage].merge(times)
+            for name, value in other.counters.items():
+                self.counters[name] += value
+            for field, value in other.tracks.items():
+                self.tracks[field] += value
+
+    def is_empty(self):
+        """True if no track work was timed (log writes alone don't count)."""
+        with self._lock:
+            return not any(times.count for stage, times in self.stages.items() if stage != "log")
+
+    def summary_lines(self):
+        """Human-readable table of the stage timings and byte counters."""
+        lines = [f"{'stage':<9} {'count':>7} {'total s':>9} {'mean s':>8} {'p50 s':>7} {'p95 s':>7} {'max s':>7}"]
+        with self._lock:
+            for stage, times in self.stages.items():
+                if not times.count:
+                    continue
+                lines.append(f"{stage:<9} {times.count:>7} {times.seconds:>9.1f} {times.seconds / times.count:>8.3f} "
+                             f"{times.quantile(0.5):>7.2f} {times.quantile(0.95):>7.2f} {times.max:>7.2f}")
+            lines.append(f"Downloaded {format_bytes(self.counters['bytes_downloaded'])}, "
+                         f"wrote {format_bytes(self.counters['bytes_written'])}.")
+        return lines
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'updated_at': time.time(),
+                'stages': {stage: {'count': times.count, 'seconds': times.seconds, 'max': times.max,
+                                   'p50': times.quantile(0.5), 'p95': times.quantile(0.95), 'p99': times.quantile(0.99),
+                                   'buckets': dict(zip([str(b) for b in BUCKETS] + ["+Inf"], times.buckets))}
+                           for stage, times in self.stages.items()},
+                'counters': dict(self.counters),
+                'tracks': dict(self.tracks),
+            }
+
+    def to_prometheus(self):
+        """The metrics in the Prometheus text exposition format (for node_exporter's textfile collector)."""
+        name = f"{PROMETHEUS_PREFIX}_stage_seconds"
+        lines = [f"# HELP {name} Time spent per track in each pipeline stage.", f"# TYPE {name} histogram"]
+        with self._lock:
+            for stage, times in self.stages.items():
+                cumulative = 0
+                for bound, n in zip([repr(b) for b in BUCKETS] + ["+Inf"], times.buckets):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {times.seconds:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {times.count}')
+            for counter, value in self.counters.items():
+                metric = f"{PROMETHEUS_PREFIX}_{counter}_total"
+                lines += [f"# HELP {metric} {counter.replace('_', ' ').capitalize()}.", f"# TYPE {metric} counter",
+                          f"{metric} {value}"]
+            metric = f"{PROMETHEUS_PREFIX}_tracks_total"
+            lines += [f"# HELP {metric} Tracks by outcome.", f"# TYPE {metric} counter"]
+            lines += [f'{metric}{{result="{field}"}} {value}' for field, value in self.tracks.items()]
+        metric = f"{PROMETHEUS_PREFIX}_last_update_timestamp_seconds"
+        lines += [f"# HELP {metric} When these metrics were written.", f"# TYPE {metric} gauge",
+                  f"{metric} {time.time():.3f}"]
+        return "\n".join(lines) + "\n"
+
+
+def _write_atomically(path, text):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_metrics(metrics, path):
+    """Write `metrics` as `<path without extension>.json` and `.prom`; returns the two paths.
+
+    Both files are replaced in one step, so a scraper never reads half a file.
+    """
+    base = os.path.splitext(path)[0]
+    directory = os.path.dirname(base)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    json_path, prom_path = base + ".json", base + ".prom"
+    _write_atomically(json_path, json.dumps(metrics.to_dict(), indent=2))
+    _write_atomically(prom_path, metrics.to_prometheus())
+    return json_path, prom_path
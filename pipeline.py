@@ -0,0 +1,203 @@
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class Stage:
+    """A pool of worker threads that call `handler(item)` for every item put on a bounded queue.
+
+    `put` blocks while the queue is full, which is what keeps a fast stage from
+    running arbitrarily far ahead of a slow one. Exceptions raised by the
+    handler are passed to `on_error(item, exc)` so one bad item can't kill a worker.
+    The pool can be resized while running (see `resize`).
+    """
+
+    def __init__(self, name, handler, workers, maxsize=0, on_error=None):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.on_error = on_error
+        self.queue = queue.Queue(maxsize)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._alive = 0
+        self._release = threading.Event()
+
+    def start(self):
+        with self._lock:
+            self._spawn(self.workers)
+        return self
+
+    def _spawn(self, count):
+        for _ in range(count):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            self._alive += 1
+
+    def resize(self, workers):
+        """Grow the pool right away, or let surplus workers retire after their current item."""
+        with self._lock:
+            self.workers = workers
+            if workers > self._alive:
+                self._spawn(workers - self._alive)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._alive > self.workers:
+                    self._alive -= 1
+                    return
+            item = self.queue.get()
+            if item is _STOP:
+                with self._lock:
+                    self._alive -= 1
+                return
+            try:
+                self.handler(item)
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(item, e)
+
+    def put(self, item):
+        self.queue.put(item)
+
+    def close(self):
+        """Let the workers exit once everything queued so far has been handled."""
+        with self._lock:
+            alive = self._alive
+        for _ in range(alive):
+            self.queue.put(_STOP)
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def clear(self):
+        """Remove everything still queued and return it; items being handled are not affected."""
+        items = []
+        stops = 0
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stops += 1
+            else:
+                items.append(item)
+        for _ in range(stops):
+            self.queue.put(_STOP)
+        return items
+
+    def put_later(self, item, delay):
+        """Queue `item` again after `delay` seconds without blocking the calling worker."""
+        def wait_and_put():
+            self._release.wait(delay)
+            self.queue.put(item)
+        threading.Thread(target=wait_and_put, name=f"{self.name}-delayed", daemon=True).start()
+
+    def release_delayed(self):
+        """Queue all delayed items now instead of when their delay runs out (e.g. when stopping)."""
+        self._release.set()
+
+
+class PendingJobs:
+    """Counts jobs that entered the pipeline but haven't reached a final state yet.
+
+    With retries a job can pass through a stage more than once, so "all stages
+    drained" can't be told from the queues alone; `wait` blocks until every job
+    was marked `done`.
+    """
+
+    def __init__(self):
+        self._count = 0
+        self._cond = threading.Condition()
+
+    def add(self, n=1):
+        with self._cond:
+            self._count += n
+
+    def done(self):
+        with self._cond:
+            self._count -= 1
+            if self._count <= 0:
+                self._cond.notify_all()
+
+    def wait(self):
+        with self._cond:
+            while self._count > 0:
+                self._cond.wait()
+
+
+class AdaptiveConcurrency:
+    """Hill-climbs the worker count of a stage between `minimum` and `maximum`.
+
+    Every `interval` seconds the throughput of the last window (from the
+    cumulative byte counter `total_bytes`) is compared with the previous one:
+    while adding workers keeps paying off it keeps adding them, when
+    throughput drops it turns around. If more than `max_error_rate` of the
+    attempts in a window failed the pool is halved, since errors under load
+    usually mean the server is pushing back.
+    """
+
+    def __init__(self, stage, minimum, maximum, total_bytes, interval=10.0, max_error_rate=0.2):
+        self.stage = stage
+        self.minimum = minimum
+        self.maximum = maximum
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.max_error_rate = max_error_rate
+        self._lock = threading.Lock()
+        self._successes = 0
+        self._failures = 0
+        self._direction = 1
+        self._last_rate = None
+        self._last_time = time.monotonic()
+        self._last_bytes = total_bytes()
+
+    def record(self, success):
+        with self._lock:
+            if success:
+                self._successes += 1
+            else:
+                self._failures += 1
+
+    def adjust(self):
+        """Resize the stage if a window has passed; returns (old size, new size, bytes/s, error rate) or None."""
+        now = time.monotonic()
+        elapsed = now - self._last_time
+        if elapsed < self.interval:
+            return None
+        total = self.total_bytes()
+        rate = (total - self._last_bytes) / elapsed
+        with self._lock:
+            attempts = self._successes + self._failures
+            error_rate = self._failures / attempts if attempts else 0.0
+            self._successes = self._failures = 0
+        self._last_time, self._last_bytes = now, total
+
+        size = self.stage.workers
+        if attempts >= 3 and error_rate > self.max_error_rate:
+            new_size = size - max(1, size // 2)
+            self._direction = 1
+            self._last_rate = None
+        elif rate == 0 and attempts == 0:
+            return None  # Idle window (e.g. waiting for searches), nothing to learn from
+        elif self._last_rate is None or rate >= self._last_rate * 1.05:
+            new_size = size + self._direction
+            self._last_rate = rate
+        elif rate < self._last_rate * 0.95:
+            self._direction = -self._direction
+            new_size = size + self._direction
+            self._last_rate = rate
+        else:
+            new_size = size
+            self._last_rate = rate
+        new_size = max(self.minimum, min(self.maximum, new_size))
+        if new_size != size:
+            self.stage.resize(new_size)
+        return size, new_size, rate, error_rate
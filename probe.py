@@ -0,0 +1,95 @@
+import json
+import os
+import subprocess
+
+from utils import hidden_startupinfo
+
+
+def run_ffprobe(ffprobe_path, path):
+    """Run ffprobe on one file; returns (parsed JSON or None, error message)."""
+    # Construct ffprobe command to output JSON
+    ffprobe_cmd = [
+        ffprobe_path,
+        "-v", "quiet",           # Suppress verbose output
+        "-print_format", "json", # Output in JSON format
+        "-show_format",          # Show format info
+        "-show_streams",         # Show stream info
+        str(path)                # Input file path
+    ]
+    try:
+        ffprobe_result = subprocess.run(
+            ffprobe_cmd,
+            capture_output=True,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            check=False, # Don't raise an exception for non-zero exit codes
+            stdin=subprocess.DEVNULL,
+            startupinfo=hidden_startupinfo()
+        )
+    except FileNotFoundError:
+        return None, f"ffprobe.exe not found at '{ffprobe_path}' during probing."
+
+    if ffprobe_result.returncode != 0 or not ffprobe_result.stdout:
+        return None, f"ffprobe failed (Return code: {ffprobe_result.returncode}).\nFFprobe STDERR:\n{ffprobe_result.stderr}"
+    try:
+        return json.loads(ffprobe_result.stdout), ""
+    except json.JSONDecodeError:
+        return None, f"Failed to parse ffprobe JSON. STDOUT:\n{ffprobe_result.stdout[:500]}...\nFFprobe STDERR:\n{ffprobe_result.stderr}"
+
+
+def summarize_probe(info, stat_result):
+    """The parts of an ffprobe result worth keeping, plus the (size, mtime) they are valid for."""
+    fmt = info.get('format', {})
+    audio = next((stream for stream in info.get('streams', []) if stream.get('codec_type') == 'audio'), {})
+
+    def number(value, convert):
+        try:
+            return convert(value)
+        except (TypeError, ValueError):
+            return None
+
+    return {
+        'size': stat_result.st_size,
+        'mtime': stat_result.st_mtime,
+        'duration': number(fmt.get('duration'), float),
+        'bitrate': number(audio.get('bit_rate') or fmt.get('bit_rate'), int),
+        'codec': audio.get('codec_name'),
+        'sample_rate': number(audio.get('sample_rate'), int),
+    }
+
+
+class ProbeIndex:
+    """Probe results already stored in a folder's journal, keyed by file name.
+
+    A cached result is only used while the file's size and mtime still match,
+    so replaced or re-encoded files are probed again.
+    """
+
+    def __init__(self, entries=()):
+        self._entries = {}
+        for entry in entries:
+            self.add(entry)
+
+    def add(self, entry):
+        file_path = entry.get('file_path')
+        if file_path:
+            self._entries[os.path.basename(file_path)] = entry
+
+    def entry_for(self, path):
+        return self._entries.get(os.path.basename(path))
+
+    def lookup(self, path, stat_result):
+        """Return the cached probe summary for `path`, or None if it is missing or stale."""
+        entry = self.entry_for(path)
+        probe = entry.get('probe') if entry else None
+        if probe and probe.get('size') == stat_result.st_size and probe.get('mtime') == stat_result.st_mtime:
+            return probe
+        return None
+
+    def earlier_entries(self):
+        """The entries indexed so far, e.g. to check the files of earlier runs once this one is done."""
+        return list(self._entries.values())
+
+    def __iter__(self):
+        return iter(self._entries.values())
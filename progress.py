@@ -0,0 +1,105 @@
+import threading
+import time
+
+
+def format_bytes(num):
+    if num is None:
+        return "?"
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(num) < 1024 or unit == "GiB":
+            return f"{num:.1f} {unit}" if unit != "B" else f"{int(num)} B"
+        num /= 1024
+
+
+class TransferProgress:
+    """Live progress of one running download, fed by the backend and watched for stalls."""
+
+    def __init__(self, label):
+        self.label = label
+        self.downloaded = 0
+        self.total = None
+        self.speed = None
+        self.eta = None
+        self.started = time.monotonic()
+        self.last_change = self.started
+        self.cancelled = False
+        self.stalled = False
+        self._cancel = None
+
+    def update(self, downloaded, total=None, speed=None, eta=None):
+        if downloaded is not None and downloaded != self.downloaded:
+            self.downloaded = downloaded
+            self.last_change = time.monotonic()
+        if total:
+            self.total = total
+        self.speed = speed
+        self.eta = eta
+
+    def set_cancel(self, cancel):
+        """Register how to abort the transfer (e.g. killing the yt-dlp process)."""
+        self._cancel = cancel
+        if self.cancelled:
+            cancel()
+
+    def cancel(self):
+        self.cancelled = True
+        if self._cancel is not None:
+            self._cancel()
+
+    def cancel_stalled(self):
+        self.stalled = True
+        self.cancel()
+
+    def describe(self):
+        text = f"{self.label}: {format_bytes(self.downloaded)}"
+        if self.total:
+            text += f" of {format_bytes(self.total)} ({100 * self.downloaded / self.total:.0f}%)"
+        if self.speed:
+            text += f" at {format_bytes(self.speed)}/s"
+        if self.eta is not None:
+            text += f", ETA {int(self.eta)}s"
+        return text
+
+
+class ProgressTracker:
+    """All transfers of a run, for aggregate throughput and stall detection."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = set()
+        self._completed_bytes = 0
+        self._started = time.monotonic()
+
+    def start(self, label):
+        transfer = TransferProgress(label)
+        with self._lock:
+            self._active.add(transfer)
+        return transfer
+
+    def finish(self, transfer):
+        with self._lock:
+            if transfer in self._active:
+                self._active.discard(transfer)
+                self._completed_bytes += transfer.downloaded
+
+    def active(self):
+        with self._lock:
+            return list(self._active)
+
+    def total_bytes(self):
+        with self._lock:
+            return self._completed_bytes + sum(t.downloaded for t in self._active)
+
+    def current_speed(self):
+        """Sum of the speeds yt-dlp reports for the running transfers, in bytes/s."""
+        with self._lock:
+            return sum(t.speed or 0 for t in self._active)
+
+    def average_speed(self):
+        elapsed = time.monotonic() - self._started
+        return self.total_bytes() / elapsed if elapsed > 0 else 0
+
+    def stalled(self, timeout):
+        """Transfers that made no progress for `timeout` seconds and weren't cancelled yet."""
+        now = time.monotonic()
+        return [t for t in self.active() if not t.cancelled and now - t.last_change >= timeout]
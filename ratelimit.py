@@ -0,0 +1,110 @@
+import re
+import threading
+import time
+
+_THROTTLED_PATTERN = re.compile(r"HTTP Error 429|Too Many Requests|rate.?limit", re.IGNORECASE)
+
+
+def is_throttled(error):
+    """True if yt-dlp's error output says the server is rate limiting us."""
+    return bool(error) and _THROTTLED_PATTERN.search(error) is not None
+
+
+class TokenBucket:
+    """Lets through `rate` requests per second on average, with bursts of up to `burst`.
+
+    When the server pushes back (`throttled`) the rate is halved and nothing
+    goes out for `pause` seconds; every request that gets through afterwards
+    (`succeeded`) raises the rate again by a small step, back up to the
+    configured rate.
+    """
+
+    def __init__(self, rate, burst=1, min_rate=None, pause=5.0):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.min_rate = min_rate or rate / 16
+        self.pause = pause
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, cancel=None):
+        """Wait for a token. Returns False instead if the `cancel` event is set while waiting."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = max(self._blocked_until - now, (1 - self._tokens) / self.rate)
+            # Wake up at least once a second so a stop request is noticed
+            wait = min(wait, 1.0)
+            if cancel is not None:
+                if cancel.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+    def throttled(self):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0.0
+            self._blocked_until = max(self._blocked_until, now + self.pause)
+
+    def succeeded(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class RateLimiter:
+    """Rate limits shared by all workers, with one bucket per kind of request.
+
+    "search" covers YouTube searches, "media" the start of every download.
+    A rate of 0 (or None) leaves that kind unlimited.
+    """
+
+    KINDS = ("search", "media")
+
+    def __init__(self, search_rate=2.0, media_rate=4.0):
+        self.buckets = {}
+        for kind, rate in zip(self.KINDS, (search_rate, media_rate)):
+            if rate:
+                self.buckets[kind] = TokenBucket(rate, burst=max(1, int(rate)))
+        self.throttle_count = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, kind, cancel=None):
+        bucket = self.buckets.get(kind)
+        return bucket.acquire(cancel) if bucket is not None else True
+
+    def report(self, kind, error=None):
+        """Feed back the outcome of a request (`error` None if it succeeded); returns True if it was throttled.
+
+        Only successes raise the rate again; other errors (a video that is
+        gone, no search results...) leave it as it is.
+        """
+        throttled = is_throttled(error)
+        if throttled:
+            with self._lock:
+                self.throttle_count += 1
+        bucket = self.buckets.get(kind)
+        if bucket is not None:
+            if throttled:
+                bucket.throttled()
+            elif error is None:
+                bucket.succeeded()
+        return throttled
+
+    def current_rate(self, kind):
+        bucket = self.buckets.get(kind)
+        return bucket.rate if bucket is not None else None
@@ -0,0 +1,44 @@
+import random
+import re
+
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+
+# Errors that say the track can't be had at all, whatever the other patterns match
+_PERMANENT_PATTERNS = re.compile(
+    r"No search results|Video unavailable|Private video|This video is not available|"
+    r"has been removed|copyright|Sign in to confirm your age|members-only|not available in your country|"
+    r"Unsupported URL|HTTP Error 404",
+    re.IGNORECASE)
+
+# Errors worth another try later in the same run: throttling, server errors and network trouble
+_TRANSIENT_PATTERNS = re.compile(
+    r"HTTP Error (429|5\d\d)|Too Many Requests|timed? ?out|Connection (reset|refused|aborted)|"
+    r"Remote end closed|IncompleteRead|Temporary failure in name resolution|Name or service not known|"
+    r"Network is unreachable|Unable to download (webpage|API page)|Got error:|giving up after|"
+    r"SSL|EOF occurred",
+    re.IGNORECASE)
+
+
+def classify_failure(error):
+    """Return TRANSIENT or PERMANENT for an error message from yt-dlp.
+
+    Anything that isn't recognisably a network or server problem counts as
+    permanent, so unknown errors don't burn time on retries.
+    """
+    error = error or ""
+    if _PERMANENT_PATTERNS.search(error):
+        return PERMANENT
+    if _TRANSIENT_PATTERNS.search(error):
+        return TRANSIENT
+    return PERMANENT
+
+
+def backoff_delay(attempt, base=2.0, cap=60.0):
+    """Seconds to wait before retry number `attempt` (1-based): exponential, with jitter.
+
+    Half of the delay is fixed and half random, so tracks that failed
+    together (e.g. on the same 429) don't all come back at the same moment.
+    """
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
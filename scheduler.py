@@ -0,0 +1,190 @@
+"""Download several tierlist exports at once through one pipeline, interleaving their tracks fairly."""
+import os
+
+from engine import DownloadStats, playlist_name_from_path
+
+POLICIES = ("round-robin", "weighted", "tier")
+
+
+class ScheduledPlaylist:
+    """One export of a scheduled run: its folder, weight, counters and the tracks still to be handed out."""
+
+    def __init__(self, filepath, download_dir, weight=1):
+        self.filepath = filepath
+        self.download_dir = download_dir
+        self.name = playlist_name_from_path(filepath)
+        self.weight = weight
+        self.stats = None
+        self.run = None  # engine.PlaylistRun while the playlist is open
+        self.completed = False
+        self._file = None
+        self._jobs = None
+        self._head = None  # Next job, read ahead so the policies can look at it
+        self._current = 0  # Smooth weighted round-robin state
+        self._tier_ranks = {}  # Tier name -> position in the export
+
+    @property
+    def cancelled(self):
+        return self.run is not None and self.run.cancelled
+
+    def describe(self):
+        stats = self.stats
+        if stats is None:
+            return f"{self.name}: waiting"
+        if stats.error:
+            return f"{self.name}: failed ({stats.error})"
+        state = "cancelled" if self.cancelled else "done" if self.completed else "running"
+        return (f"{self.name}: {state}, {stats.downloaded} downloaded, {stats.skipped} already present, "
+                f"{stats.failed} failed{f', {stats.cancelled} cancelled' if stats.cancelled else ''}")
+
+    def _tier_rank(self, job):
+        return self._tier_ranks.setdefault(job.tier, len(self._tier_ranks))
+
+
+class PlaylistScheduler:
+    """Feeds the tracks of several exports into one engine pipeline, so its pools are shared by all of them.
+
+    Whenever the pipeline has room for another track, `policy` picks the
+    playlist it comes from: "round-robin" takes turns, "weighted" takes turns
+    in proportion to each playlist's weight (smooth weighted round-robin), and
+    "tier" takes the track from the highest tier any playlist still has
+    (taking turns on ties), so the S tiers of all playlists come before their
+    A tiers. Since one playlist's last tracks overlap with the others' instead
+    of draining the pools, no worker sits idle while any playlist has work.
+
+    `on_progress(playlist)` is called after each track reaches a final state and
+    `on_complete(playlist)` once a playlist has none left; both may be called
+    from worker threads. `cancel(playlist)` drops one playlist and leaves
+    the others running.
+    """
+
+    def __init__(self, engine, policy="round-robin", on_progress=None, on_complete=None):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown scheduling policy {policy!r}")
+        self.engine = engine
+        self.policy = policy
+        self.on_progress = on_progress
+        self.on_complete = on_complete
+        self.playlists = []
+        self._turn = 0
+
+    def add(self, filepath, download_dir, weight=1):
+        playlist = ScheduledPlaylist(filepath, download_dir, weight)
+        self.playlists.append(playlist)
+        return playlist
+
+    def cancel(self, playlist):
+        """Stop handing out `playlist`'s tracks and cancel its queued and running downloads."""
+        if playlist.run is not None and not playlist.run.cancelled:
+            self.engine.log(f"Cancelling {playlist.name}...\n")
+            playlist.run.cancel()
+
+    def run(self):
+        """Download every playlist; returns the DownloadStats totals (each playlist has its own `stats`)."""
+        engine = self.engine
+        engine.stats = DownloadStats()
+        try:
+            engine.open_shared()
+            open_playlists = [playlist for playlist in self.playlists if self._open(playlist)]
+            engine.log(f"Downloading {len(open_playlists)} playlists ({self.policy} scheduling)...\n")
+            engine.run_jobs(self._interleave(open_playlists))
+            for playlist in open_playlists:
+                self._finish(playlist)
+            if engine.stop_event.is_set():
+                engine.log_stopped()
+            else:
+                engine.notify("info", "Done", f"{len(open_playlists)} playlists processed: "
+                                              f"{engine.stats.downloaded} downloaded, {engine.stats.failed} failed.")
+        except Exception as e:
+            engine.report_error(e)
+        finally:
+            for playlist in self.playlists:
+                self._close(playlist)
+            engine.close_shared()
+        return engine.stats
+
+    def _open(self, playlist):
+        engine = self.engine
+        playlist.stats = DownloadStats(parent=engine.stats)
+        try:
+            os.makedirs(playlist.download_dir, exist_ok=True)
+            playlist._file = open(playlist.filepath, 'r', encoding='utf-8')
+            playlist.run = engine.open_playlist(playlist.download_dir, playlist.stats)
+        except OSError as e:
+            engine.log(f"Skipping {playlist.filepath}: {e}\n")
+            playlist.stats.error = str(e)
+            self._close(playlist)
+            return False
+        if self.on_progress is not None:
+            playlist.run.on_progress = lambda run: self.on_progress(playlist)
+        playlist.run.on_complete = lambda run: self._completed(playlist)
+        playlist._jobs = engine.new_tracks(playlist._file, playlist.run)
+        self._advance(playlist)
+        return True
+
+    def _advance(self, playlist):
+        """Read the playlist's next new track into `_head`; None once it has no more (or can't be read)."""
+        try:
+            playlist._head = next(playlist._jobs, None)
+        except Exception as e:
+            self.engine.log(f"Error reading {playlist.filepath}: {e}\n")
+            playlist.stats.error = str(e)
+            playlist._head = None
+        if playlist._head is None:
+            playlist.run.feeding_done()
+
+    def _completed(self, playlist):
+        playlist.completed = True
+        self.engine.log(f"Finished {playlist.describe()}.\n")
+        if self.on_complete is not None:
+            self.on_complete(playlist)
+
+    def _interleave(self, playlists):
+        """Yield the tracks of all playlists in the order the policy picks them."""
+        active = [playlist for playlist in playlists if playlist._head is not None]
+        while active:
+            for playlist in [playlist for playlist in active if playlist.cancelled]:
+                # The track read ahead never entered the pipeline
+                playlist.stats.add('cancelled')
+                playlist._jobs.close()
+                playlist._head = None
+                playlist.run.feeding_done()
+                active.remove(playlist)
+            if not active:
+                return
+            playlist = self._pick(active)
+            # The pipeline counts the track as pending before asking for the next one, so reading
+            # past the playlist's end afterwards can't report it complete too early
+            yield playlist._head
+            self._advance(playlist)
+            if playlist._head is None:
+                active.remove(playlist)
+
+    def _pick(self, active):
+        if self.policy == "weighted":
+            # Smooth weighted round-robin: picks are spread out, not bunched per playlist
+            total = 0
+            for playlist in active:
+                playlist._current += playlist.weight
+                total += playlist.weight
+            chosen = max(active, key=lambda playlist: playlist._current)
+            chosen._current -= total
+            return chosen
+        self._turn = (self._turn + 1) % len(active)
+        rotation = active[self._turn:] + active[:self._turn]
+        if self.policy == "tier":
+            return min(rotation, key=lambda playlist: playlist._tier_rank(playlist._head))
+        return rotation[0]
+
+    def _finish(self, playlist):
+        """After the pipeline: probe files of earlier runs, flush and compact the journals, as download() does."""
+        if self.engine.stop_event.is_set() or playlist.cancelled:
+            return
+        self.engine.finish_playlist(playlist.run)
+
+    def _close(self, playlist):
+        if playlist._file is not None:
+            playlist._file.close()
+            playlist._file = None
+        if playlist.run is not None:
+            self.engine.close_playlist(playlist.run)
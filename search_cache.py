@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_SEARCH_CACHE = os.path.expanduser("~/SpotifyDownloader/search_cache.db")
+
+
+class SearchCache:
+    """On-disk map of Spotify track ID -> resolved YouTube video ID.
+
+    Entries expire after `ttl` seconds, and once the cache holds more than
+    `max_entries` the least recently used entries are evicted. The cache is
+    shared by every playlist folder, so overlapping playlists and re-syncs
+    don't repeat the YouTube search. Each entry keeps the settings the video
+    was picked with (see matching.match_settings_key); lookups with other
+    settings miss, so e.g. a first search result isn't reused by a run that
+    scores several.
+    """
+
+    def __init__(self, db_path=DEFAULT_SEARCH_CACHE, ttl=30 * 24 * 3600, max_entries=100000):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS search_results (
+                track_id TEXT PRIMARY KEY,
+                search_query TEXT,
+                video_id TEXT NOT NULL,
+                resolved_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                match_key TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_search_results_last_used ON search_results (last_used);
+        """)
+        # Caches written before entries had a match key; their entries never match and get replaced
+        if "match_key" not in {row[1] for row in self._conn.execute("PRAGMA table_info(search_results)")}:
+            self._conn.execute("ALTER TABLE search_results ADD COLUMN match_key TEXT")
+        self._conn.commit()
+        self._puts_since_evict = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, track_id, match_key):
+        """Return the cached video ID for a track, or None if missing, expired or picked with other settings."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT video_id, resolved_at, match_key FROM search_results WHERE track_id = ?",
+                                     (track_id,)).fetchone()
+            if row is None or now - row[1] > self.ttl or row[2] != match_key:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE search_results SET last_used = ? WHERE track_id = ?", (now, track_id))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, track_id, search_query, video_id, match_key):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO search_results "
+                               "(track_id, search_query, video_id, resolved_at, last_used, match_key) "
+                               "VALUES (?, ?, ?, ?, ?, ?)", (track_id, search_query, video_id, now, now, match_key))
+            self._puts_since_evict += 1
+            # Evicting on every put would mean a COUNT(*) per track, so do it in batches
+            if self._puts_since_evict >= 100:
+                self._evict()
+            self._conn.commit()
+
+    def invalidate(self, track_id):
+        """Forget a track's video, e.g. because the video became unavailable."""
+        with self._lock:
+            self._conn.execute("DELETE FROM search_results WHERE track_id = ?", (track_id,))
+            self._conn.commit()
+
+    def _evict(self):
+        self._puts_since_evict = 0
+        self._conn.execute("DELETE FROM search_results WHERE resolved_at < ?", (time.time() - self.ttl,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM search_results").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM search_results WHERE track_id IN "
+                "(SELECT track_id FROM search_results ORDER BY last_used LIMIT ?)", (count - self.max_entries,))
+
+    def close(self):
+        with self._lock:
+            self._evict()
+            self._conn.commit()
+            self._conn.close()
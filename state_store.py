@@ -0,0 +1,268 @@
+import datetime
+import os
+import sqlite3
+import threading
+
+DEFAULT_STATE_DB = os.path.expanduser("~/SpotifyDownloader/state.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    playlist_dir TEXT NOT NULL,
+    started_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_playlist ON runs (playlist_dir, run_id);
+
+CREATE TABLE IF NOT EXISTS tracks (
+    track_id TEXT NOT NULL,
+    playlist_dir TEXT NOT NULL,
+    track_name TEXT,
+    artists TEXT,
+    search_query TEXT,
+    file_path TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    run_id INTEGER,
+    updated_at TEXT NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    duration REAL,
+    bitrate INTEGER,
+    PRIMARY KEY (track_id, playlist_dir)
+);
+CREATE INDEX IF NOT EXISTS idx_tracks_playlist ON tracks (playlist_dir, status, run_id);
+CREATE INDEX IF NOT EXISTS idx_tracks_file ON tracks (file_path);
+-- Lookups by track alone (the primary key starts with it) and by search query are gone
+DROP INDEX IF EXISTS idx_tracks_track_id;
+DROP INDEX IF EXISTS idx_tracks_query;
+
+CREATE TABLE IF NOT EXISTS journal_positions (
+    playlist_dir TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    line_count INTEGER
+);
+"""
+
+# Columns added after the first release of the schema, created on older databases when opened
+_ADDED_COLUMNS = {
+    "tracks": [("size", "INTEGER"), ("mtime", "REAL"), ("duration", "REAL"), ("bitrate", "INTEGER")],
+    "journal_positions": [("line_count", "INTEGER")],
+}
+
+_TRACK_COLUMNS = ("track_id, playlist_dir, track_name, artists, search_query, file_path, status, error, run_id, "
+                  "updated_at, size, mtime, duration, bitrate")
+_BATCH_SIZE = 500
+
+
+class StateStore:
+    """SQLite-backed record of downloaded and failed tracks across all playlist folders.
+
+    Lookups go through indexes, so nothing has to be loaded into memory up front.
+    One connection is shared by all worker threads and guarded by a lock.
+    """
+
+    def __init__(self, db_path=DEFAULT_STATE_DB):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        for table, columns in _ADDED_COLUMNS.items():
+            existing = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            for column, column_type in columns:
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        self._conn.commit()
+
+    @staticmethod
+    def _key(playlist_dir):
+        return os.path.normcase(os.path.abspath(playlist_dir))
+
+    @staticmethod
+    def _now():
+        return datetime.datetime.now().isoformat()
+
+    def begin_run(self, playlist_dir):
+        """Start a new run for a playlist folder and return its run ID."""
+        with self._lock:
+            cur = self._conn.execute("INSERT INTO runs (playlist_dir, started_at) VALUES (?, ?)",
+                                     (self._key(playlist_dir), self._now()))
+            self._conn.commit()
+            return cur.lastrowid
+
+    def last_run(self, playlist_dir, before=None):
+        """ID of the latest run of a playlist folder (started before run `before`, if given), or None."""
+        query, params = "SELECT MAX(run_id) FROM runs WHERE playlist_dir = ?", (self._key(playlist_dir),)
+        if before is not None:
+            query, params = query + " AND run_id < ?", params + (before,)
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()[0]
+
+    def journal_position(self, playlist_dir):
+        """The `DownloadJournal.position()` of a folder's journal up to which it was imported, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT file_id, size, line_count FROM journal_positions WHERE playlist_dir = ?",
+                                     (self._key(playlist_dir),)).fetchone()
+        return tuple(row) if row is not None else None
+
+    def set_journal_position(self, playlist_dir, position):
+        with self._lock:
+            if position is None:
+                self._conn.execute("DELETE FROM journal_positions WHERE playlist_dir = ?", (self._key(playlist_dir),))
+            else:
+                self._conn.execute("INSERT OR REPLACE INTO journal_positions (playlist_dir, file_id, size, line_count) "
+                                   "VALUES (?, ?, ?, ?)",
+                                   (self._key(playlist_dir),) + tuple(position))
+            self._conn.commit()
+
+    def import_journal(self, playlist_dir, entries):
+        """Bulk-load entries from a folder's download journal; they replace what is known about their tracks.
+
+        Returns the number of entries loaded.
+        """
+        key = self._key(playlist_dir)
+        rows = ((entry['track_id'], key, entry.get('track_name'), ', '.join(entry.get('artists') or []),
+                 entry.get('search_query'), entry.get('file_path'), 'downloaded', None, None,
+                 entry.get('downloaded_at') or self._now()) + self._probe_values(entry.get('probe'))
+                for entry in entries if entry.get('track_id'))
+        with self._lock:
+            cursor = self._conn.executemany(
+                f"INSERT OR REPLACE INTO tracks ({_TRACK_COLUMNS}) VALUES ({', '.join('?' * 14)})", rows)
+            self._conn.commit()
+        return cursor.rowcount
+
+    @staticmethod
+    def _probe_values(probe):
+        probe = probe or {}
+        return probe.get('size'), probe.get('mtime'), probe.get('duration'), probe.get('bitrate')
+
+    def _upsert(self, track_id, playlist_dir, track_name, artist_names, search_query, file_path, status, error, run_id,
+                probe=None):
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO tracks ({_TRACK_COLUMNS}) VALUES ({', '.join('?' * 14)})",
+                (track_id, self._key(playlist_dir), track_name, ', '.join(artist_names or []),
+                 search_query, file_path, status, error, run_id, self._now()) + self._probe_values(probe))
+            self._conn.commit()
+
+    def record_download(self, track_id, playlist_dir, track_name, artist_names, search_query, file_path, run_id=None,
+                        probe=None):
+        """Record a downloaded track, with its ffprobe summary (see probe.summarize_probe) if known."""
+        self._upsert(track_id, playlist_dir, track_name, artist_names, search_query, file_path, 'downloaded', None, run_id,
+                     probe)
+
+    def record_failure(self, track_id, playlist_dir, track_name, artist_names, search_query, error, run_id=None):
+        self._upsert(track_id, playlist_dir, track_name, artist_names, search_query, None, 'failed', error, run_id)
+
+    def record_removal(self, track_id, playlist_dir, run_id=None):
+        """Mark a track as no longer part of the playlist (its file was kept, archived or deleted)."""
+        with self._lock:
+            self._conn.execute("UPDATE tracks SET status = 'removed', run_id = ?, updated_at = ? "
+                               "WHERE track_id = ? AND playlist_dir = ?",
+                               (run_id, self._now(), track_id, self._key(playlist_dir)))
+            self._conn.commit()
+
+    def record_probe(self, track_id, playlist_dir, probe):
+        """Store a new ffprobe summary for a downloaded track's file."""
+        with self._lock:
+            self._conn.execute("UPDATE tracks SET size = ?, mtime = ?, duration = ?, bitrate = ? "
+                               "WHERE track_id = ? AND playlist_dir = ?",
+                               self._probe_values(probe) + (track_id, self._key(playlist_dir)))
+            self._conn.commit()
+
+    def is_downloaded(self, track_id, playlist_dir):
+        """Is the track downloaded into `playlist_dir`?"""
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM tracks WHERE track_id = ? AND playlist_dir = ? AND status = 'downloaded'",
+                                     (track_id, self._key(playlist_dir))).fetchone()
+        return row is not None
+
+    def count_downloaded(self, playlist_dir):
+        """Number of tracks downloaded into `playlist_dir`."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tracks WHERE playlist_dir = ? AND status = 'downloaded'",
+                                      (self._key(playlist_dir),)).fetchone()[0]
+
+    def failed_tracks(self, playlist_dir, run_id):
+        """Return the tracks that failed in run `run_id` of a folder and haven't been downloaded since.
+
+        Shaped like failed-tracks journal entries.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT track_id, track_name, artists, search_query, error FROM tracks "
+                "WHERE playlist_dir = ? AND status = 'failed' AND run_id = ?",
+                (self._key(playlist_dir), run_id)).fetchall()
+        return [{'track_id': track_id, 'track_name': track_name, 'artists': artists.split(', ') if artists else [],
+                 'search_query': search_query, 'error': error}
+                for track_id, track_name, artists, search_query, error in rows]
+
+    def probe_info(self, file_path):
+        """Return (size, mtime, duration, bitrate) recorded for a file, or None."""
+        with self._lock:
+            return self._conn.execute("SELECT size, mtime, duration, bitrate FROM tracks WHERE file_path = ?",
+                                      (file_path,)).fetchone()
+
+    def earlier_downloads(self, playlist_dir, run_id):
+        """Yield the tracks downloaded into a folder before run `run_id`, shaped like download journal entries.
+
+        Read in batches, so a big playlist is never loaded at once.
+        """
+        key = self._key(playlist_dir)
+        last = ''
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT track_id, track_name, artists, search_query, file_path, updated_at, size, mtime, duration, "
+                    "bitrate FROM tracks WHERE track_id > ? AND playlist_dir = ? AND status = 'downloaded' "
+                    "AND (run_id IS NULL OR run_id < ?) ORDER BY track_id LIMIT ?",
+                    (last, key, run_id, _BATCH_SIZE)).fetchall()
+            for track_id, track_name, artists, search_query, file_path, updated_at, size, mtime, duration, bitrate in rows:
+                if not file_path:
+                    continue
+                yield {'track_id': track_id, 'track_name': track_name, 'artists': artists.split(', ') if artists else [],
+                       'search_query': search_query, 'file_path': file_path, 'downloaded_at': updated_at,
+                       'probe': {'size': size, 'mtime': mtime, 'duration': duration, 'bitrate': bitrate}
+                       if size is not None else None}
+            if len(rows) < _BATCH_SIZE:
+                return
+            last = rows[-1][0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class StoredProbeIndex:
+    """A playlist folder's earlier probe results in the state database (the `probe.ProbeIndex` of a run with it).
+
+    Looked up per file instead of loaded up front.
+    """
+
+    def __init__(self, store, playlist_dir, run_id):
+        self.store = store
+        self.playlist_dir = playlist_dir
+        self.run_id = run_id
+
+    def add(self, entry):
+        pass  # Recorded with the track by record_download
+
+    def lookup(self, path, stat_result):
+        """Return the recorded probe summary for `path`, or None if it is missing or stale."""
+        row = self.store.probe_info(path)
+        if row is None or row[0] != stat_result.st_size or row[1] != stat_result.st_mtime:
+            return None
+        size, mtime, duration, bitrate = row
+        return {'size': size, 'mtime': mtime, 'duration': duration, 'bitrate': bitrate}
+
+    def earlier_entries(self):
+        """The tracks downloaded before this run, read from the database whenever they are iterated."""
+        return self
+
+    def __iter__(self):
+        return self.store.earlier_downloads(self.playlist_dir, self.run_id)
@@ -0,0 +1,70 @@
+"""Snapshots of the export a playlist folder was last synced with, so a sync only handles what changed."""
+import datetime
+import json
+import os
+
+SNAPSHOT_FILENAME = 'sync_snapshot.json'
+# What to do with the files of tracks that were removed from the playlist
+REMOVED_ACTIONS = ("keep", "archive", "prune")
+ARCHIVE_DIRNAME = "Removed from playlist"
+
+
+class SyncSnapshot:
+    """The tracks (ID -> tier) of the export a folder was last synced with, and that export's SHA-256."""
+
+    def __init__(self, tracks=None, export_sha256=None, synced_at=None):
+        self.tracks = tracks or {}
+        self.export_sha256 = export_sha256
+        self.synced_at = synced_at
+
+    @classmethod
+    def load(cls, directory):
+        """The folder's snapshot, or an empty one if it was never synced (or the file is unreadable)."""
+        try:
+            with open(os.path.join(directory, SNAPSHOT_FILENAME), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return cls()
+        if not isinstance(data, dict) or not isinstance(data.get('tracks'), dict):
+            return cls()
+        return cls(data['tracks'], data.get('export_sha256'), data.get('synced_at'))
+
+    def save(self, directory):
+        path = os.path.join(directory, SNAPSHOT_FILENAME)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'export_sha256': self.export_sha256, 'synced_at': self.synced_at, 'tracks': self.tracks}, f,
+                      ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+class TierlistDiff:
+    """Compares the tracks of a new export, seen one at a time, with the last snapshot."""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.tiers = {}  # Track ID -> tier in the new export
+        self.added = 0
+        self.moved = 0
+
+    def see(self, track_id, tier):
+        """Record a track of the new export; returns True if it wasn't in the last one."""
+        if track_id in self.tiers:
+            return False  # Listed twice; counted once
+        self.tiers[track_id] = tier
+        previous = self.snapshot.tracks.get(track_id)
+        if previous is None:
+            self.added += 1
+            return True
+        if previous != tier:
+            self.moved += 1
+        return False
+
+    def removed(self):
+        """IDs of the tracks that were in the last export but not in this one (once every track was seen)."""
+        return [track_id for track_id in self.snapshot.tracks if track_id not in self.tiers]
+
+    def new_snapshot(self, export_sha256):
+        return SyncSnapshot(self.tiers, export_sha256, datetime.datetime.now().isoformat())
@@ -0,0 +1,28 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import pytest  # noqa: E402
+
+import engine as engine_module  # noqa: E402
+from engine import DownloadEngine  # noqa: E402
+from fake_backend import FakeBackend, FakeMediaTools  # noqa: E402
+
+
+@pytest.fixture
+def make_engine(monkeypatch):
+    """DownloadEngine factory using the fake backend and media tools, without shared caches."""
+    def make(backend=None, log=None, **kwargs):
+        tools = FakeMediaTools(encode_seconds=0, probe_seconds=0)
+        for name in ("transcode", "remux", "run_ffprobe"):
+            monkeypatch.setattr(engine_module, name, getattr(tools, name))
+        engine = DownloadEngine(log=log or (lambda message: None), **{
+            'max_workers': 2, 'search_cache_path': None, 'art_cache_path': None, 'search_rate': 0, 'media_rate': 0,
+            'retry_base_delay': 0, **kwargs})
+        engine.backend = backend or FakeBackend(latency=0)
+        engine.ffmpeg_exe_path = engine.ffprobe_exe_path = "fake"
+        return engine
+    return make
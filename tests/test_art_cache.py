@@ -0,0 +1,109 @@
+import functools
+import http.server
+import itertools
+import json
+import os
+import threading
+
+from art_cache import JPEG_MAGIC, ArtCache
+from make_tierlist import track_item
+
+
+def write_image(tmp_path, name, size):
+    path = tmp_path / "images" / name
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(JPEG_MAGIC + name.encode().ljust(size - len(JPEG_MAGIC), b"\0"))
+    return path.as_uri()
+
+
+def test_cover_is_fetched_once_per_url_and_once_per_image(tmp_path):
+    cache = ArtCache(str(tmp_path / "art"), ffmpeg_path=None)
+    url = write_image(tmp_path, "a.jpg", 100)
+    path, error = cache.get(url)
+    assert error == ""
+    assert cache.get(url) == (path, "")
+    # The same image under another URL is stored once
+    same = tmp_path / "images" / "copy.jpg"
+    same.write_bytes((tmp_path / "images" / "a.jpg").read_bytes())
+    assert cache.get(same.as_uri()) == (path, "")
+    assert (cache.hits, cache.fetched, cache.converted) == (1, 2, 0)
+    assert len([name for name in os.listdir(tmp_path / "art") if name.endswith(".jpg")]) == 1
+    cache.close()
+
+
+def test_least_recently_used_images_are_evicted(tmp_path, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr("art_cache.time.time", lambda: next(clock))
+    cache = ArtCache(str(tmp_path / "art"), max_bytes=250)
+    a, b, c = (write_image(tmp_path, f"{name}.jpg", 100) for name in "abc")
+    a_path, _ = cache.get(a)
+    b_path, _ = cache.get(b)
+    cache.get(a)  # Now b is the least recently used
+    c_path, _ = cache.get(c)
+    assert os.path.exists(a_path) and os.path.exists(c_path)
+    assert not os.path.exists(b_path)
+    cache.close()
+
+    # Sizes and use order survive a restart
+    cache = ArtCache(str(tmp_path / "art"), max_bytes=250)
+    assert cache.get(a) == (a_path, "")
+    cache.get(b)
+    assert not os.path.exists(c_path)
+    assert cache.fetched == 1
+    cache.close()
+
+
+def test_an_image_deleted_behind_the_cache_is_fetched_again(tmp_path):
+    cache = ArtCache(str(tmp_path / "art"))
+    url = write_image(tmp_path, "a.jpg", 100)
+    path, _ = cache.get(url)
+    os.remove(path)
+    assert cache.get(url) == (path, "")
+    assert (cache.hits, cache.fetched) == (0, 2)
+    cache.close()
+
+
+def test_failed_fetch_is_reported_and_not_cached(tmp_path):
+    cache = ArtCache(str(tmp_path / "art"))
+    missing = (tmp_path / "missing.jpg").as_uri()
+    path, error = cache.get(missing)
+    assert path is None and "Could not fetch" in error
+    # Not JPEG, and no ffmpeg to convert it
+    png = tmp_path / "cover.png"
+    png.write_bytes(b"\x89PNG\r\n\x1a\n")
+    path, error = cache.get(png.as_uri())
+    assert path is None and "ffmpeg is needed" in error
+    assert cache.fetched == 0
+    cache.close()
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def test_engine_fetches_each_album_cover_once(tmp_path, make_engine):
+    for n in range(2):
+        write_image(tmp_path, f"album{n}.jpg", 100)
+    httpd = http.server.ThreadingHTTPServer(
+        ("127.0.0.1", 0), functools.partial(_QuietHandler, directory=str(tmp_path / "images")))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    host, port = httpd.server_address[:2]
+    items = []
+    for i in range(4):
+        item = track_item(i, 1)
+        item["content"]["album"]["images"] = [
+            {"url": f"http://{host}:{port}/album{i % 2}.jpg", "height": 640, "width": 640}]
+        items.append(item)
+    export = tmp_path / "export.json"
+    export.write_text(json.dumps({"state": {"S": items}}))
+    out = tmp_path / "out"
+    out.mkdir()
+    log = []
+    try:
+        engine = make_engine(log=log.append, art_cache_path=str(tmp_path / "art"))
+        assert engine.download(str(export), str(out)).downloaded == 4
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    assert any("Album art cache: 2 hits, 2 covers fetched" in line for line in log)
@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+
+from distributed import Coordinator, Worker
+from make_tierlist import write_tierlist
+
+
+def serve_and_work(tmp_path, coordinator_engine, worker_engine, tracks=6):
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), tracks)
+    out = tmp_path / "out"
+    out.mkdir()
+    socket_path = tmp_path / "coordinator.sock"
+    coordinator = Coordinator(coordinator_engine, f"unix:{socket_path}", lease_seconds=30)
+    result = []
+    thread = threading.Thread(target=lambda: result.append(coordinator.run(str(export), str(out))), daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not socket_path.exists():
+        assert time.monotonic() < deadline, "the coordinator didn't start"
+        time.sleep(0.01)
+    worker = Worker(worker_engine, f"unix:{socket_path}", work_dir=str(tmp_path / "work"))
+    worker_thread = threading.Thread(target=worker.run, daemon=True)
+    worker_thread.start()
+    thread.join(30)
+    assert not thread.is_alive(), "the coordinator did not finish"
+    worker_thread.join(30)
+    return worker, result[0], out
+
+
+def test_shared_track_store_sends_hashes(tmp_path, make_engine):
+    store = str(tmp_path / "store")
+    worker, stats, out = serve_and_work(tmp_path, make_engine(track_store_path=store),
+                                        make_engine(track_store_path=store))
+    assert worker.shared_store
+    assert stats.downloaded == 6
+    assert not [name for name in os.listdir(store) if name.startswith(".probe-")]
+
+
+def test_same_store_path_on_another_machine_is_not_shared(tmp_path, make_engine):
+    worker, stats, out = serve_and_work(tmp_path, make_engine(track_store_path=str(tmp_path / "coordinator-store")),
+                                        make_engine(track_store_path=str(tmp_path / "worker-store")))
+    assert not worker.shared_store
+    assert stats.downloaded == 6
+
+
+def test_missing_stored_file_is_uploaded_instead(tmp_path, make_engine, monkeypatch):
+    # As if the worker had wrongly concluded that it shares the coordinator's store
+    monkeypatch.setattr(Worker, "_shares_store", lambda self, probe: True)
+    worker, stats, out = serve_and_work(tmp_path, make_engine(track_store_path=str(tmp_path / "coordinator-store")),
+                                        make_engine(track_store_path=str(tmp_path / "worker-store")))
+    assert not worker.shared_store
+    assert stats.downloaded == 6
+    assert stats.failed == 0
+
+
+def test_lost_leases_are_dropped(make_engine):
+    worker = Worker(make_engine(), "unix:/nonexistent", work_dir="unused")
+    for track_id, token in (("a", "1"), ("b", "2"), ("c", "3")):
+        worker._slots.acquire()
+        worker._leases[track_id] = token
+    worker._drop_leases({"1", "3", "99"})
+    assert worker._leases == {"b": "2"}
+    for _ in range(worker.max_leases - 1):
+        assert worker._slots.acquire(blocking=False)
+    assert not worker._slots.acquire(blocking=False)
@@ -0,0 +1,158 @@
+import json
+import sqlite3
+import threading
+
+import pytest
+
+from engine import DownloadStats, PlaylistRun, track_file_stem
+from fake_backend import FakeBackend
+from make_tierlist import track_item, write_tierlist
+from progress import TransferProgress
+from tierlist import album_cover_url, track_duration
+
+
+def run_with_timeout(function, *args, timeout=30):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function(*args)), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), f"{function.__name__} did not return"
+    return result[0]
+
+
+@pytest.mark.parametrize("handler", ["_resolve_track", "_download_track", "_transcode_track", "_finish_track"])
+def test_handler_exception_fails_the_track_instead_of_hanging(tmp_path, make_engine, handler):
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 10)
+    (tmp_path / "out").mkdir()
+    engine = make_engine()
+    original = getattr(engine, handler)
+
+    def raising(job):
+        # Like an unguarded cache or database error escaping the stage handler
+        if job.track_name in ("Benchmark Track 3", "Benchmark Track 7"):
+            raise RuntimeError("database is locked")
+        return original(job)
+    setattr(engine, handler, raising)
+
+    stats = run_with_timeout(engine.download, str(export), str(tmp_path / "out"))
+    assert stats.failed == 2
+    assert stats.downloaded == 8
+
+
+class LockedArtCache:
+    def get(self, url):
+        raise sqlite3.OperationalError("database is locked")
+
+    def close(self):
+        pass
+
+
+def test_art_cache_error_drops_the_cover_not_the_track(tmp_path, make_engine):
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 5)
+    (tmp_path / "out").mkdir()
+    engine = make_engine()
+    engine.open_shared = lambda original=engine.open_shared: (original(), setattr(engine, 'art_cache', LockedArtCache()))
+    stats = run_with_timeout(engine.download, str(export), str(tmp_path / "out"))
+    assert stats.downloaded == 5
+    assert stats.failed == 0
+
+
+class LockedStore:
+    hits = misses = 0
+
+    def get(self, *args):
+        raise sqlite3.OperationalError("database is locked")
+
+    put = link_track = has_track = add = get
+
+    def savings(self):
+        return 0, 0, 0
+
+    def close(self):
+        pass
+
+
+def test_locked_search_cache_and_track_store_count_as_misses(tmp_path, make_engine):
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 5)
+    (tmp_path / "out").mkdir()
+    engine = make_engine()
+    engine.open_shared = lambda original=engine.open_shared: (
+        original(), setattr(engine, 'search_cache', LockedStore()), setattr(engine, 'track_store', LockedStore()))
+    stats = run_with_timeout(engine.download, str(export), str(tmp_path / "out"))
+    assert stats.downloaded == 5
+    assert stats.failed == 0
+
+
+def test_files_of_migrated_entries_are_not_orphaned(tmp_path, make_engine):
+    # download_log.json entries written before the journal had a file_path
+    (tmp_path / "download_log.json").write_text(json.dumps([
+        {"track_id": "0" * 22, "track_name": "Benchmark Track 0", "artists": ["Artist 0", "Feature 0"]},
+    ]))
+    (tmp_path / "Benchmark Track 0 - Artist 0, Feature 0.mp3").write_bytes(b"audio")
+    (tmp_path / "Benchmark Track 1 - Artist 1, Feature 1.mp3").write_bytes(b"audio")
+    assert make_engine().find_incomplete_downloads(str(tmp_path)) == (
+        [], ["Benchmark Track 1 - Artist 1, Feature 1.mp3"])
+
+
+def test_file_stems_match_files_named_by_earlier_versions():
+    # Backslashes were never replaced, so existing files named with them must keep matching
+    assert track_file_stem("AC\\DC: Live?", ["A/B"]) == "AC\\DC_ Live_ - A_B"
+
+
+def test_redownloaded_orphans_keep_duration_and_cover(tmp_path, make_engine):
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 3)
+    out = tmp_path / "out"
+    out.mkdir()
+    (out / "Benchmark Track 1 - Artist 1, Feature 1.mp3").write_bytes(b"audio")
+    engine = make_engine()
+    jobs = []
+    run_pipeline = engine.run_jobs
+    engine.run_jobs = lambda pipeline_jobs: (jobs.extend(pipeline_jobs), run_pipeline(pipeline_jobs))
+    partial, orphaned = engine.find_incomplete_downloads(str(out))
+    stats = run_with_timeout(engine.redownload_orphaned_tracks, str(export), str(out), partial, orphaned)
+    assert stats.downloaded == 1
+    [job] = jobs
+    assert job.track_name == "Benchmark Track 1"
+    assert job.duration == track_duration(track_item(1, 3))
+    assert job.cover_url == album_cover_url(track_item(1, 3))
+
+
+class UnabortableBackend(FakeBackend):
+    aborts_stalled = False  # Like the in-process backend
+
+
+def test_stalls_are_left_alone_when_the_backend_cannot_abort(tmp_path, make_engine):
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 1)
+    (tmp_path / "out").mkdir()
+    # No progress during the latency, well past the stall timeout
+    engine = make_engine(backend=UnabortableBackend(latency=1.5), stall_timeout=0.5)
+    stats = run_with_timeout(engine.download, str(export), str(tmp_path / "out"))
+    assert stats.downloaded == 1
+    assert stats.retried == 0
+
+
+def test_runs_after_a_stop_download_again_once_reset(tmp_path, make_engine):
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 3)
+    (tmp_path / "out").mkdir()
+    engine = make_engine()
+    engine.stop()
+    assert run_with_timeout(engine.download, str(export), str(tmp_path / "out")).downloaded == 0
+    engine.reset_stop()
+    assert run_with_timeout(engine.download, str(export), str(tmp_path / "out")).downloaded == 3
+
+
+def test_transfer_added_to_a_cancelled_run_is_killed(tmp_path):
+    run = PlaylistRun(str(tmp_path), DownloadStats())
+    running = TransferProgress("running")
+    run.add_transfer(running)
+    run.cancel()
+    assert running.cancelled
+    late = TransferProgress("late")
+    run.add_transfer(late)
+    assert late.cancelled
@@ -0,0 +1,130 @@
+import http.server
+import os
+import threading
+
+import pytest
+
+from fake_backend import FakeBackend
+from fragments import (MIN_PART_SIZE, ConnectionBudget, FetchCancelled, RangesNotSupported, content_length,
+                       fetch_ranges, split_ranges)
+from local_server import LocalMediaServer
+from make_tierlist import write_tierlist
+from progress import TransferProgress
+
+
+def test_budget_grants_extra_connections_only_while_they_are_free():
+    budget = ConnectionBudget(6)
+    assert budget.acquire(4) == 4
+    assert budget.acquire(4) == 2
+    stop = threading.Event()
+    stop.set()
+    assert budget.acquire(1, stop) == 0  # Full, and stopped while waiting
+    budget.release(4)
+    assert budget.acquire(0) == 1
+    assert budget.in_use == 3
+
+
+def test_budget_waits_for_a_released_connection():
+    budget = ConnectionBudget(2)
+    assert budget.acquire(2) == 2
+    granted = []
+    waiter = threading.Thread(target=lambda: granted.append(budget.acquire(3)))
+    waiter.start()
+    waiter.join(0.2)
+    assert granted == []
+    budget.release(2)
+    waiter.join(5)
+    assert granted == [2]
+
+
+def test_split_ranges_cover_the_file():
+    total = 5 * MIN_PART_SIZE + 1
+    ranges = split_ranges(total, 2)
+    assert ranges[0][0] == 0 and ranges[-1][1] == total - 1
+    assert all(last + 1 == first for (_, last), (first, _) in zip(ranges, ranges[1:]))
+    assert split_ranges(100, 8) == [(0, 99)]
+
+
+def test_fetch_ranges_downloads_the_whole_file_over_several_connections(tmp_path):
+    size = 4 * MIN_PART_SIZE + 12345
+    path = str(tmp_path / "track.m4a")
+    progress = TransferProgress("track")
+    with LocalMediaServer(file_size=size) as server:
+        url = server.url("a")
+        assert content_length(url) == size
+        server.reset_stats()
+        fetch_ranges(url, path, size, 3, progress=progress)
+        assert server.connections == 3
+        assert server.requests == len(split_ranges(size, 3))
+        chunk = server.httpd.chunk
+    with open(path, 'rb') as f:
+        data = f.read()
+    # Every range starts at a multiple of the server's repeated chunk, so the file is that chunk over and over
+    assert data == (chunk * (size // len(chunk) + 1))[:size]
+    assert progress.downloaded == size
+    assert not os.path.exists(path + ".part")
+
+
+def test_cancelled_fetch_leaves_no_partial_file(tmp_path):
+    path = str(tmp_path / "track.m4a")
+    progress = TransferProgress("track")
+    progress.cancelled = True
+    with LocalMediaServer(file_size=2 * MIN_PART_SIZE) as server:
+        with pytest.raises(FetchCancelled):
+            fetch_ranges(server.url("a"), path, 2 * MIN_PART_SIZE, 2, progress=progress)
+    assert os.listdir(tmp_path) == []
+
+
+class _NoRangesHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "10")
+        self.end_headers()
+        self.wfile.write(b"0123456789")
+
+
+def test_server_that_ignores_ranges_is_reported(tmp_path):
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _NoRangesHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        host, port = httpd.server_address[:2]
+        with pytest.raises(RangesNotSupported):
+            fetch_ranges(f"http://{host}:{port}/track", str(tmp_path / "track.m4a"), 10, 2)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    assert os.listdir(tmp_path) == []
+
+
+class BudgetCheckingBackend(FakeBackend):
+    """Records the connections every download got and how many were in use at once."""
+
+    def __init__(self):
+        super().__init__(latency=0.01)
+        self.engine = None
+        self.granted = []
+        self.peak = 0
+
+    def download(self, target, output_template, progress=None, connections=1, thumbnail=True):
+        self.granted.append(connections)
+        self.peak = max(self.peak, self.engine.connection_budget.in_use)
+        return super().download(target, output_template, progress, connections, thumbnail)
+
+
+def test_engine_downloads_stay_within_the_connection_budget(tmp_path, make_engine):
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 12)
+    out = tmp_path / "out"
+    out.mkdir()
+    backend = BudgetCheckingBackend()
+    engine = make_engine(backend, max_workers=3, fragments=4, connections=5)
+    backend.engine = engine
+    assert engine.download(str(export), str(out)).downloaded == 12
+    assert len(backend.granted) == 12
+    assert all(1 <= granted <= 4 for granted in backend.granted)
+    assert backend.peak <= 5
+    assert engine.connection_budget is None
@@ -0,0 +1,27 @@
+import pytest
+
+from make_tierlist import write_tierlist
+
+gui = pytest.importorskip("gui")  # Needs tkinter, but no display: only the engine side is driven
+
+
+def test_several_selected_exports_are_downloaded_through_the_scheduler(tmp_path, make_engine, monkeypatch):
+    app = gui.SpotifyJSONDownloader.__new__(gui.SpotifyJSONDownloader)
+    app.engine = make_engine()
+    app.log = lambda message: None
+    policies = []
+    scheduler_class = gui.PlaylistScheduler
+
+    def scheduler(engine, policy):
+        policies.append(policy)
+        return scheduler_class(engine, policy)
+    monkeypatch.setattr(gui, "PlaylistScheduler", scheduler)
+
+    playlists = []
+    for name, count in (("a", 3), ("b", 5)):
+        write_tierlist(str(tmp_path / f"{name}.json"), count)
+        (tmp_path / name).mkdir()
+        playlists.append((str(tmp_path / f"{name}.json"), str(tmp_path / name)))
+    app._download_all(playlists, [None, None], False, "keep", "tier")
+    assert policies == ["tier"]
+    assert app.engine.stats.downloaded == 8
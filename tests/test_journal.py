@@ -0,0 +1,64 @@
+import json
+import os
+
+from make_tierlist import track_item, write_tierlist
+from journal import DownloadJournal, FailedTracksJournal, JOURNAL_FILENAME, LEGACY_LOG_FILENAME
+
+
+def test_download_log_json_is_migrated_once(tmp_path):
+    entries = [{"track_id": "a", "track_name": "A"}, {"track_id": "b", "track_name": "B"}, "not an entry"]
+    (tmp_path / LEGACY_LOG_FILENAME).write_text(json.dumps(entries))
+    journal = DownloadJournal(str(tmp_path))
+    assert journal.migrated
+    assert journal.track_ids() == {"a", "b"}
+    assert not (tmp_path / LEGACY_LOG_FILENAME).exists()
+    assert (tmp_path / (LEGACY_LOG_FILENAME + ".bak")).exists()
+    assert not DownloadJournal(str(tmp_path)).migrated
+
+
+def test_torn_last_line_is_skipped_and_terminated_before_the_next_entry(tmp_path):
+    (tmp_path / JOURNAL_FILENAME).write_text('{"track_id": "a"}\n{"track_id": "b", "track_na')
+    journal = DownloadJournal(str(tmp_path))
+    assert journal.track_ids() == {"a"}
+    journal.append({"track_id": "c"})
+    journal.close()
+    assert [entry["track_id"] for entry in DownloadJournal(str(tmp_path))] == ["a", "c"]
+
+
+def test_compaction_keeps_the_latest_entry_per_track(tmp_path):
+    journal = DownloadJournal(str(tmp_path))
+    journal.track_ids()
+    for i in range(100):
+        journal.append({"track_id": "a", "n": i})
+    journal.append({"track_id": "b", "n": 0})
+    assert journal.needs_compaction()
+    journal.compact(forget={"b"})
+    assert not journal.needs_compaction()
+    assert list(DownloadJournal(str(tmp_path))) == [{"track_id": "a", "n": 99}]
+    assert not os.path.exists(journal.path + ".tmp")
+
+
+def test_failed_tracks_are_dropped_once_resolved(tmp_path):
+    journal = FailedTracksJournal(str(tmp_path))
+    journal.append({"track_id": "a", "error": "HTTP Error 503"})
+    journal.append({"track_id": "b", "error": "HTTP Error 503"})
+    journal.append({"track_id": "a", "error": "HTTP Error 429"})
+    journal.mark_resolved("b")
+    assert journal.failed_entries() == [{"track_id": "a", "error": "HTTP Error 429"}]
+    journal.compact()
+    assert [entry["track_id"] for entry in FailedTracksJournal(str(tmp_path))] == ["a"]
+    journal.mark_resolved("a")
+    journal.compact()
+    assert not os.path.exists(journal.path)
+
+
+def test_tracks_in_a_migrated_log_are_not_downloaded_again(tmp_path, make_engine):
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 3)
+    out = tmp_path / "out"
+    out.mkdir()
+    (out / LEGACY_LOG_FILENAME).write_text(json.dumps([{"track_id": track_item(0, 3)["id"]}]))
+    stats = make_engine().download(str(export), str(out))
+    assert stats.skipped == 1
+    assert stats.downloaded == 2
+    assert len(DownloadJournal(str(out)).track_ids()) == 3
@@ -0,0 +1,57 @@
+import threading
+
+from log_buffer import LogBuffer
+from make_tierlist import write_tierlist
+
+
+def test_messages_from_many_threads_are_drained_in_one_batch(tmp_path):
+    buffer = LogBuffer(str(tmp_path / "logs" / "downloader.log"))
+
+    def worker(n):
+        for i in range(100):
+            buffer.put(f"worker {n} message {i}\n")
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batch = buffer.drain()
+    assert len(batch) == 400
+    assert [message for message in batch if message.startswith("worker 0 ")] == [
+        f"worker 0 message {i}\n" for i in range(100)]
+    assert buffer.drain() == []
+    assert buffer.messages == 400
+    assert buffer.rate() == 400 / 5.0
+    buffer.close()
+    # The file gets every drained message, in the order they were drained
+    assert (tmp_path / "logs" / "downloader.log").read_text() == "".join(batch)
+
+
+def test_log_file_is_rotated(tmp_path):
+    buffer = LogBuffer(str(tmp_path / "downloader.log"), max_bytes=1000, backup_count=2)
+    for _ in range(5):
+        buffer.put("x" * 600 + "\n")
+        buffer.drain()
+    buffer.close()
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "downloader.log", "downloader.log.1", "downloader.log.2"]
+
+
+def test_without_a_log_file_messages_are_only_counted(tmp_path):
+    buffer = LogBuffer(None)
+    buffer.put("message\n")
+    assert buffer.drain() == ["message\n"]
+    assert buffer.messages == 1
+    buffer.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_engine_messages_arrive_in_order_through_the_buffer(tmp_path, make_engine):
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 3)
+    (tmp_path / "out").mkdir()
+    buffer = LogBuffer(None)
+    make_engine(log=buffer.put).download(str(export), str(tmp_path / "out"))
+    batch = buffer.drain()
+    assert sum(message.startswith("Successfully downloaded") for message in batch) == 3
+    assert batch.index("Starting downloads...\n") < batch.index("All downloads completed or failed.\n")
@@ -0,0 +1,30 @@
+import main
+from make_tierlist import write_tierlist
+
+
+def test_redownload_incomplete_downloads_the_tracks_of_partial_and_unlogged_files(tmp_path, make_engine, monkeypatch):
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 5)
+    folder = tmp_path / "out" / "export"
+    folder.mkdir(parents=True)
+    (folder / "Benchmark Track 0 - Artist 0, Feature 0.source.webm.part").write_bytes(b"partial")
+    (folder / "Benchmark Track 1 - Artist 1, Feature 1.mp3").write_bytes(b"unlogged")
+    (folder / "Not In The Export - Nobody.mp3").write_bytes(b"added by hand")
+    engine = make_engine()
+    engine.locate_tools = lambda: True
+    redownloaded = []
+    redownload = engine.redownload_orphaned_tracks
+
+    def recording(*args):
+        stats = redownload(*args)
+        redownloaded.append(stats.downloaded)
+        return stats
+    engine.redownload_orphaned_tracks = recording
+    monkeypatch.setattr(main, "create_engine", lambda args: engine)
+    monkeypatch.setattr(main, "install_signal_handlers", lambda engine: None)
+
+    args = main.parse_args(["--json", str(export), "--out", str(tmp_path / "out"), "--redownload-incomplete"])
+    assert main.run_cli(args) == 0
+    assert redownloaded == [2]
+    assert engine.stats.downloaded == 3  # The rest of the export
+    assert engine.find_incomplete_downloads(str(folder)) == ([], ["Not In The Export - Nobody.mp3"])
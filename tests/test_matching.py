@@ -0,0 +1,90 @@
+import json
+
+from fake_backend import FakeBackend
+from make_tierlist import track_item, write_tierlist
+from matching import best_candidate, candidates_query, duration_score, score_candidate, tokens
+
+ARTISTS = ["Daft Punk", "Pharrell Williams"]
+
+
+def test_tokens_drop_accents_and_punctuation():
+    assert tokens("Beyoncé - Halo (Live!)") == ["beyonce", "halo", "live"]
+
+
+def test_candidates_query_asks_for_several_results():
+    assert candidates_query("ytsearch1:Get Lucky Daft Punk", 5) == "ytsearch5:Get Lucky Daft Punk"
+
+
+def test_duration_score_falls_off_after_two_seconds():
+    assert duration_score(249, 248) == 1.0
+    assert duration_score(100 + 2 + 7.5, 100) == 0.5
+    assert duration_score(248 + 30, 248) == 0.0
+    # 10 % of a long track counts as much as 15 s of a short one
+    assert duration_score(3600 + 182, 3600) == 0.5
+
+
+def test_exact_match_scores_one():
+    candidate = {'title': "Daft Punk - Get Lucky", 'duration': 248}
+    assert score_candidate(candidate, "Get Lucky", ARTISTS, 248) == 1.0
+
+
+def test_artist_can_be_the_channel():
+    candidate = {'title': "Get Lucky", 'duration': 248, 'channel': "Daft Punk"}
+    assert score_candidate(candidate, "Get Lucky", ARTISTS, 248) == 1.0
+    assert score_candidate({**candidate, 'channel': "Someone"}, "Get Lucky", ARTISTS, 248) == 0.8
+
+
+def test_version_words_halve_the_score_unless_the_track_has_them():
+    live = {'title': "Daft Punk - Get Lucky (Live Cover)", 'duration': 248}
+    assert score_candidate(live, "Get Lucky", ARTISTS, 248) == 0.25
+    assert score_candidate(live, "Get Lucky - Live", ARTISTS, 248) == 0.5
+
+
+def test_without_a_duration_only_the_text_counts():
+    candidate = {'title': "Get Lucky", 'duration': None}
+    assert score_candidate(candidate, "Get Lucky", ARTISTS, 248) == 0.6
+    assert score_candidate({'title': "Daft Punk Get Lucky", 'duration': 248}, "Get Lucky", ARTISTS) == 1.0
+
+
+def test_best_candidate_prefers_the_earlier_result_on_ties():
+    first = {'id': "a", 'title': "Daft Punk - Get Lucky", 'duration': 248}
+    loop = {'id': "b", 'title': "Daft Punk - Get Lucky 10 hours loop", 'duration': 36000}
+    assert best_candidate([loop, first, dict(first, id="c")], "Get Lucky", ARTISTS, 248) == (first, 1.0)
+    assert best_candidate([], "Get Lucky", ARTISTS, 248) == (None, 0.0)
+
+
+class VersionsBackend(FakeBackend):
+    """Search results with a live version first; the studio version only if `studio`."""
+
+    def __init__(self, studio=True):
+        super().__init__(latency=0)
+        self.studio = studio
+
+    def search(self, query):
+        name = query.split(':', 1)[1]
+        results = [{'id': "live0000000", 'title': f"{name} (Live at Wembley)", 'duration': 600}]
+        if self.studio:
+            results.append({'id': "studio00000", 'title': name, 'duration': 150})
+        return results, ""
+
+
+def test_engine_downloads_the_best_scoring_result(tmp_path, make_engine):
+    export = tmp_path / "export.json"
+    export.write_text(json.dumps({"state": {"S": [track_item(0, 1)]}}))
+    out = tmp_path / "out"
+    out.mkdir()
+    log = []
+    stats = make_engine(VersionsBackend(), log=log.append).download(str(export), str(out))
+    assert stats.downloaded == 1
+    assert any("Picked search result 2 of 2" in line for line in log)
+
+
+def test_engine_reports_a_track_without_a_good_result(tmp_path, make_engine):
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 2)
+    out = tmp_path / "out"
+    out.mkdir()
+    log = []
+    stats = make_engine(VersionsBackend(studio=False), log=log.append).download(str(export), str(out))
+    assert (stats.downloaded, stats.unmatched, stats.failed) == (0, 2, 2)
+    assert sum("Low-confidence match" in line for line in log) == 2
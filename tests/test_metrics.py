@@ -0,0 +1,52 @@
+import json
+import re
+
+from make_tierlist import write_tierlist
+from metrics import BUCKETS, PipelineMetrics
+
+_SAMPLE = re.compile(r'^[a-z_]+(\{[a-z]+="[^"]*"(,[a-z]+="[^"]*")*\})? -?[0-9.e+]+$')
+
+
+def test_prometheus_text_has_cumulative_buckets_and_counters():
+    metrics = PipelineMetrics()
+    for seconds in (0.002, 0.002, 0.3, 500.0):
+        metrics.time("download", seconds)
+    metrics.count("bytes_downloaded", 1234)
+    text = metrics.to_prometheus()
+    lines = text.splitlines()
+    assert text.endswith("\n")
+    assert all(line.startswith("# ") or _SAMPLE.match(line) for line in lines)
+    buckets = [int(line.rsplit(" ", 1)[1]) for line in lines
+               if line.startswith('spotify_downloader_stage_seconds_bucket{stage="download"')]
+    assert len(buckets) == len(BUCKETS) + 1
+    assert buckets == sorted(buckets)
+    assert buckets[BUCKETS.index(0.005)] == 2
+    assert buckets[-1] == 4  # +Inf counts everything, including what's above the last bound
+    assert 'spotify_downloader_stage_seconds_count{stage="download"} 4' in lines
+    assert "spotify_downloader_bytes_downloaded_total 1234" in lines
+    assert "# TYPE spotify_downloader_tracks_total counter" in lines
+
+
+def test_quantiles_interpolate_within_buckets():
+    metrics = PipelineMetrics()
+    for _ in range(100):
+        metrics.time("encode", 0.2)
+    times = metrics.stages["encode"]
+    assert 0.1 < times.quantile(0.5) <= 0.2
+    assert times.quantile(0.99) <= times.max == 0.2
+    assert metrics.stages["search"].quantile(0.5) is None
+
+
+def test_run_metrics_are_written_as_json_and_prometheus_text(tmp_path, make_engine):
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 3)
+    (tmp_path / "out").mkdir()
+    engine = make_engine(metrics_path=str(tmp_path / "metrics" / "spotify_downloader.prom"))
+    engine.download(str(export), str(tmp_path / "out"))
+    data = json.loads((tmp_path / "metrics" / "spotify_downloader.json").read_text())
+    assert data["tracks"]["downloaded"] == 3
+    assert data["stages"]["download"]["count"] == 3
+    assert data["counters"]["bytes_written"] > 0
+    prom = (tmp_path / "metrics" / "spotify_downloader.prom").read_text().splitlines()
+    assert 'spotify_downloader_tracks_total{result="downloaded"} 3' in prom
+    assert 'spotify_downloader_stage_seconds_count{stage="probe"} 3' in prom
@@ -0,0 +1,21 @@
+from ratelimit import RateLimiter
+
+
+def test_only_successes_raise_the_rate_after_throttling():
+    limiter = RateLimiter(search_rate=4.0, media_rate=0)
+    assert limiter.report("search", "ERROR: HTTP Error 429: Too Many Requests")
+    throttled_rate = limiter.current_rate("search")
+    assert throttled_rate == 2.0
+
+    assert not limiter.report("search", "ERROR: Video unavailable")
+    assert limiter.current_rate("search") == throttled_rate
+
+    assert not limiter.report("search", None)
+    assert limiter.current_rate("search") > throttled_rate
+
+
+def test_unlimited_kinds_are_not_limited():
+    limiter = RateLimiter(search_rate=0, media_rate=0)
+    assert limiter.acquire("media")
+    assert limiter.current_rate("media") is None
+    assert not limiter.report("media", None)
@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+from fake_backend import FakeBackend
+from journal import FailedTracksJournal
+from make_tierlist import write_tierlist
+from retry import PERMANENT, TRANSIENT, backoff_delay, classify_failure
+
+
+@pytest.mark.parametrize("error, kind", [
+    ("ERROR: unable to download video data: HTTP Error 429: Too Many Requests", TRANSIENT),
+    ("ERROR: unable to download video data: HTTP Error 503: Service Unavailable", TRANSIENT),
+    ("ERROR: [youtube] abc: The read operation timed out", TRANSIENT),
+    ("ERROR: [youtube] abc: Video unavailable", PERMANENT),
+    # Throttled while looking at a removed video: it's still gone afterwards
+    ("HTTP Error 429 ... This video has been removed by the uploader", PERMANENT),
+    ("No search results.", PERMANENT),
+    ("something nobody has seen before", PERMANENT),
+    (None, PERMANENT),
+])
+def test_classify_failure(error, kind):
+    assert classify_failure(error) == kind
+
+
+def test_backoff_grows_exponentially_with_jitter_up_to_the_cap():
+    for attempt, delay in ((1, 2.0), (2, 4.0), (3, 8.0), (10, 60.0)):
+        for _ in range(20):
+            assert delay / 2 <= backoff_delay(attempt, base=2.0, cap=60.0) <= delay
+
+
+class FlakyBackend(FakeBackend):
+    """Answers every track's first `failures` downloads with `error`."""
+
+    def __init__(self, failures, error="ERROR: unable to download video data: HTTP Error 503: Service Unavailable"):
+        super().__init__(latency=0)
+        self.failures = failures
+        self.error = error
+        self.attempts = {}
+        self._lock = threading.Lock()
+
+    def download(self, target, output_template, *args, **kwargs):
+        with self._lock:
+            attempt = self.attempts[target] = self.attempts.get(target, 0) + 1
+        if attempt <= self.failures:
+            return False, self.error
+        return super().download(target, output_template, *args, **kwargs)
+
+
+def test_transient_failures_are_retried_in_the_same_run(tmp_path, make_engine):
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 3)
+    (tmp_path / "out").mkdir()
+    backend = FlakyBackend(failures=2)
+    stats = make_engine(backend, max_retries=2).download(str(export), str(tmp_path / "out"))
+    assert stats.downloaded == 3
+    assert stats.retried == 6
+    assert set(backend.attempts.values()) == {3}
+
+
+def test_failures_are_listed_and_retried_on_their_own(tmp_path, make_engine):
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 4)
+    out = tmp_path / "out"
+    out.mkdir()
+    backend = FlakyBackend(failures=1, error="ERROR: [youtube] abc: Video unavailable")
+    stats = make_engine(backend, max_retries=2).download(str(export), str(out))
+    assert stats.failed == 4
+    assert stats.retried == 0  # Permanent errors aren't retried
+    assert len(FailedTracksJournal(str(out)).failed_entries()) == 4
+
+    # The next run gets another download attempt per track, which succeeds
+    stats = make_engine(backend).retry_failed(str(out))
+    assert stats.total == 4
+    assert stats.downloaded == 4
+    assert FailedTracksJournal(str(out)).failed_entries() == []
@@ -0,0 +1,16 @@
+from make_tierlist import write_tierlist
+from scheduler import PlaylistScheduler
+
+
+def test_playlists_share_one_pipeline(tmp_path, make_engine):
+    scheduler = PlaylistScheduler(make_engine(), policy="round-robin")
+    playlists = []
+    for name, tracks in (("a", 5), ("b", 3)):
+        export = tmp_path / f"{name}.json"
+        write_tierlist(str(export), tracks)
+        (tmp_path / name).mkdir()
+        playlists.append(scheduler.add(str(export), str(tmp_path / name)))
+    stats = scheduler.run()
+    assert stats.downloaded == 8
+    assert [playlist.stats.downloaded for playlist in playlists] == [5, 3]
+    assert all(playlist.completed for playlist in playlists)
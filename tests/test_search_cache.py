@@ -0,0 +1,88 @@
+import sqlite3
+
+from fake_backend import FakeBackend
+from make_tierlist import write_tierlist
+from matching import match_settings_key
+from search_cache import SearchCache
+
+
+class CountingBackend(FakeBackend):
+    def __init__(self, **kwargs):
+        super().__init__(latency=0, **kwargs)
+        self.searches = 0
+
+    def resolve(self, query):
+        self.searches += 1
+        return super().resolve(query)
+
+
+def test_entries_picked_with_other_match_settings_miss(tmp_path):
+    cache = SearchCache(str(tmp_path / "cache.db"))
+    cache.put("track", "ytsearch1:Artist - Track", "first-hit", match_settings_key(1, 0.6))
+    assert cache.get("track", match_settings_key(5, 0.6)) is None
+    assert cache.get("track", match_settings_key(1, 0.9)) == "first-hit"  # The score isn't used for the first result
+    cache.put("track", "ytsearch1:Artist - Track", "best-hit", match_settings_key(5, 0.6))
+    assert cache.get("track", match_settings_key(5, 0.6)) == "best-hit"
+    assert cache.get("track", match_settings_key(5, 0.8)) is None
+    cache.close()
+
+
+def test_caches_without_match_keys_are_upgraded(tmp_path):
+    path = str(tmp_path / "cache.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE search_results (track_id TEXT PRIMARY KEY, search_query TEXT, video_id TEXT NOT NULL, "
+                 "resolved_at REAL NOT NULL, last_used REAL NOT NULL)")
+    conn.execute("INSERT INTO search_results VALUES ('track', 'query', 'old', 0, 0)")
+    conn.commit()
+    conn.close()
+    cache = SearchCache(path, ttl=float("inf"))
+    assert cache.get("track", match_settings_key(5, 0.6)) is None
+    cache.close()
+
+
+def test_first_results_are_searched_again_by_runs_that_score_candidates(tmp_path, make_engine):
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 3)
+    cache_path = str(tmp_path / "cache.db")
+    for folder in "abc":
+        (tmp_path / folder).mkdir()
+    first = CountingBackend()
+    make_engine(first, search_cache_path=cache_path, match_candidates=1).download(str(export), str(tmp_path / "a"))
+    assert first.searches == 3
+
+    scored = CountingBackend()
+    stats = make_engine(scored, search_cache_path=cache_path, match_candidates=5).download(
+        str(export), str(tmp_path / "b"))
+    assert stats.downloaded == 3
+    assert scored.searches == 3
+    again = CountingBackend()
+    make_engine(again, search_cache_path=cache_path, match_candidates=5).download(str(export), str(tmp_path / "c"))
+    assert again.searches == 0
+
+
+class UnavailableBackend(FakeBackend):
+    def download(self, *args, **kwargs):
+        return False, "ERROR: Video unavailable"
+
+
+class LockedInvalidate(SearchCache):
+    def invalidate(self, track_id):
+        raise sqlite3.OperationalError("database is locked")
+
+
+def test_locked_cache_when_dropping_a_stale_video_only_warns(tmp_path, make_engine):
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 2)
+    cache_path = str(tmp_path / "cache.db")
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    make_engine(search_cache_path=cache_path).download(str(export), str(tmp_path / "a"))
+
+    messages = []
+    engine = make_engine(UnavailableBackend(latency=0), search_cache_path=cache_path, max_retries=0)
+    engine.log = messages.append
+    engine.open_shared = lambda original=engine.open_shared: (
+        original(), setattr(engine, 'search_cache', LockedInvalidate(cache_path)))
+    stats = engine.download(str(export), str(tmp_path / "b"))
+    assert stats.failed == 2
+    assert sum("could not drop the cached search result" in message for message in messages) == 2
@@ -0,0 +1,101 @@
+import os
+
+from fake_backend import FakeBackend
+from make_tierlist import write_tierlist
+from journal import DownloadJournal, FailedTracksJournal
+from state_store import StateStore
+
+
+def test_journal_entries_from_runs_without_the_database_are_imported(tmp_path, make_engine):
+    state_db = str(tmp_path / "state.db")
+    out = tmp_path / "out"
+    out.mkdir()
+    small, large, larger = tmp_path / "small.json", tmp_path / "large.json", tmp_path / "larger.json"
+    write_tierlist(str(small), 4)
+    write_tierlist(str(large), 10)
+    write_tierlist(str(larger), 12)
+
+    assert make_engine(state_db_path=state_db).download(str(small), str(out)).downloaded == 4
+    # A run without --state-db appends to the journal only
+    assert make_engine().download(str(large), str(out)).downloaded == 6
+
+    stats = make_engine(state_db_path=state_db).download(str(larger), str(out))
+    assert stats.skipped == 10
+    assert stats.downloaded == 2
+    # Files of earlier runs are checked with the probe results from the database; only the new ones are probed
+    assert stats.probe_cached == 10
+    assert stats.probed == 2
+
+
+def test_journal_position_skips_what_was_imported(tmp_path):
+    journal = DownloadJournal(str(tmp_path))
+    assert list(journal.entries_after(None)) == []
+    journal.append({'track_id': "a"})
+    position = journal.position()
+    journal.append({'track_id': "b"})
+    journal.close()
+    assert [entry['track_id'] for entry in journal.entries_after(position)] == ["b"]
+    journal.compact()
+    # Rewritten since: everything again
+    assert [entry['track_id'] for entry in journal.entries_after(position)] == ["a", "b"]
+
+
+def test_earlier_downloads_are_read_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr("state_store._BATCH_SIZE", 3)
+    store = StateStore(str(tmp_path / "state.db"))
+    playlist = str(tmp_path / "out")
+    for i in range(7):
+        store.record_download(f"track{i}", playlist, f"Track {i}", ["Artist"], "query", f"{playlist}/{i}.mp3")
+    run_id = store.begin_run(playlist)
+    store.record_download("track7", playlist, "Track 7", ["Artist"], "query", f"{playlist}/7.mp3", run_id)
+    assert [entry['track_id'] for entry in store.earlier_downloads(playlist, run_id)] == [f"track{i}" for i in range(7)]
+    store.close()
+
+
+def test_journal_is_compacted_without_reading_its_track_ids(tmp_path, make_engine, monkeypatch):
+    state_db = str(tmp_path / "state.db")
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 4)
+    out = tmp_path / "out"
+    out.mkdir()
+    assert make_engine(state_db_path=state_db).download(str(export), str(out)).downloaded == 4
+    journal = DownloadJournal(str(out))
+    entries = list(journal)
+    for _ in range(30):
+        for entry in entries:
+            journal.append(entry)  # e.g. repeated re-probes of the same files
+    journal.close()
+
+    def track_ids(self):
+        raise AssertionError("the journal's track IDs were loaded with the state database")
+    monkeypatch.setattr(DownloadJournal, "track_ids", track_ids)
+    write_tierlist(str(export), 5)
+    stats = make_engine(state_db_path=state_db).download(str(export), str(out))
+    assert stats.skipped == 4
+    assert stats.downloaded == 1
+    assert sum(1 for _ in DownloadJournal(str(out))) == 5
+
+
+def test_retry_failed_starts_with_the_tracks_that_failed_in_the_last_run(tmp_path, make_engine):
+    state_db = str(tmp_path / "state.db")
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 4)
+    out = tmp_path / "out"
+    out.mkdir()
+    stats = make_engine(FakeBackend(latency=0, miss_rate=1), state_db_path=state_db, max_retries=0).download(
+        str(export), str(out))
+    assert stats.failed == 4
+    os.remove(FailedTracksJournal(str(out)).path)
+
+    store = StateStore(state_db)
+    last_run = store.last_run(str(out))
+    assert len(store.failed_tracks(str(out), last_run)) == 4
+    assert store.last_run(str(out), before=last_run) is None
+    store.close()
+
+    stats = make_engine(state_db_path=state_db).retry_failed(str(out))
+    assert stats.downloaded == 4
+    store = StateStore(state_db)
+    assert store.failed_tracks(str(out), last_run) == []
+    assert store.count_downloaded(str(out)) == 4
+    store.close()
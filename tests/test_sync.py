@@ -0,0 +1,70 @@
+import json
+import os
+
+import pytest
+
+from journal import DownloadJournal
+from make_tierlist import track_item
+from sync import ARCHIVE_DIRNAME, SNAPSHOT_FILENAME, SyncSnapshot, TierlistDiff
+
+
+def write_export(path, tiers):
+    """Export with the benchmark tracks numbered in `tiers` ({tier: [track numbers]})."""
+    state = {tier: [track_item(i, 1) for i in numbers] for tier, numbers in tiers.items()}
+    path.write_text(json.dumps({"state": state}))
+
+
+def file_name(i):
+    return f"Benchmark Track {i} - Artist {i}, Feature {i % 13}.mp3"
+
+
+def test_diff_counts_added_moved_and_removed_tracks():
+    diff = TierlistDiff(SyncSnapshot({"a": "S", "b": "A", "c": "B"}))
+    assert not diff.see("a", "S")
+    assert not diff.see("b", "S")  # Moved
+    assert diff.see("d", "C")
+    assert not diff.see("d", "C")  # Listed twice
+    assert (diff.added, diff.moved) == (1, 1)
+    assert diff.removed() == ["c"]
+    assert diff.new_snapshot("hash").tracks == {"a": "S", "b": "S", "d": "C"}
+
+
+@pytest.mark.parametrize("action", ["archive", "prune"])
+def test_sync_downloads_added_tracks_and_handles_removed_ones(tmp_path, make_engine, action):
+    export = tmp_path / "export.json"
+    out = tmp_path / "out"
+    out.mkdir()
+    write_export(export, {"S": [0, 1], "A": [2, 3, 4]})
+    assert make_engine().sync(str(export), str(out), action).downloaded == 5
+
+    write_export(export, {"S": [0, 2], "A": [1, 5]})
+    stats = make_engine().sync(str(export), str(out), action)
+    assert stats.downloaded == 1
+    assert stats.removed == 2
+    for i in (3, 4):
+        assert not (out / file_name(i)).exists()
+        assert (out / ARCHIVE_DIRNAME / file_name(i)).exists() == (action == "archive")
+    assert len(DownloadJournal(str(out)).track_ids()) == 4
+    assert json.loads((out / SNAPSHOT_FILENAME).read_text())["tracks"] == {
+        track_item(i, 1)["id"]: tier for tier, numbers in {"S": [0, 2], "A": [1, 5]}.items() for i in numbers}
+
+    # Rewritten with the same contents: recognised by its hash
+    write_export(export, {"S": [0, 2], "A": [1, 5]})
+    assert make_engine().sync(str(export), str(out), action).total == 0
+
+    # A removed track that comes back is downloaded again
+    write_export(export, {"S": [0, 2, 3], "A": [1, 5]})
+    assert make_engine().sync(str(export), str(out), action).downloaded == 1
+    assert (out / file_name(3)).exists()
+
+
+def test_kept_tracks_stay_in_the_folder(tmp_path, make_engine):
+    export = tmp_path / "export.json"
+    out = tmp_path / "out"
+    out.mkdir()
+    write_export(export, {"S": [0, 1]})
+    make_engine().sync(str(export), str(out))
+    write_export(export, {"S": [0]})
+    assert make_engine().sync(str(export), str(out)).removed == 1
+    assert (out / file_name(1)).exists()
+    assert not os.path.exists(out / ARCHIVE_DIRNAME)
@@ -0,0 +1,56 @@
+import io
+import json
+
+import pytest
+
+from tierlist import iter_tierlist_items
+
+
+def read_all(text, chunk_size):
+    return list(iter_tierlist_items(io.StringIO(text), chunk_size=chunk_size))
+
+
+EXPORT = json.dumps({
+    "version": 1.5,
+    "scale": -2.5e-3,
+    "flags": [True, None, 1e10],
+    "state": {
+        "S": [{"id": "a", "content": {"name": "One", "duration_ms": 215040.5}}, 1.5e10, -0.25, True],
+        "A": [],
+        "B": [12345, {"id": "b", "content": {"name": "Two", "popularity": 0.75}}],
+    },
+    "count": 4.0,
+})
+EXPECTED = [
+    ("S", {"id": "a", "content": {"name": "One", "duration_ms": 215040.5}}),
+    ("S", 1.5e10),
+    ("S", -0.25),
+    ("S", True),
+    ("B", 12345),
+    ("B", {"id": "b", "content": {"name": "Two", "popularity": 0.75}}),
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64])
+def test_chunk_sizes(chunk_size):
+    assert read_all(EXPORT, chunk_size) == EXPECTED
+
+
+class SplitFile:
+    """Returns `text` in two reads, split at `offset`, whatever size is asked for."""
+
+    def __init__(self, text, offset):
+        self.chunks = [text[:offset], text[offset:]]
+
+    def read(self, size):
+        return self.chunks.pop(0) if self.chunks else ''
+
+
+def test_split_at_every_offset():
+    # e.g. a chunk ending right after the "1" of "1.5" must not end the number there
+    for offset in range(1, len(EXPORT)):
+        assert list(iter_tierlist_items(SplitFile(EXPORT, offset))) == EXPECTED, offset
+
+
+def test_single_character_chunks_keep_exponents():
+    assert read_all('{"state": {"S": [1.5e10]}}', 1) == [("S", 1.5e10)]
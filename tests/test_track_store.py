@@ -0,0 +1,62 @@
+import os
+
+from make_tierlist import write_tierlist
+from track_store import TrackStore
+
+
+def test_added_tracks_are_linked_and_counted_as_savings(tmp_path):
+    store = TrackStore(str(tmp_path / "store"))
+    first = tmp_path / "a" / "Track - Artist.mp3"
+    first.parent.mkdir()
+    first.write_bytes(b"x" * 1000)
+    assert store.add("track", str(first)) == "hardlink"
+    assert store.has_track("track")
+    assert store.savings() == (1, 1, 0)  # One file in one place saves nothing yet
+
+    (tmp_path / "b").mkdir()
+    method, path = store.link_track("track", str(tmp_path / "b" / "Track - Artist.opus"))
+    assert method == "hardlink"
+    assert path == str(tmp_path / "b" / "Track - Artist.mp3")  # The stored file's format
+    assert os.path.samefile(path, first)
+    assert store.savings() == (2, 1, 1000)
+    assert store.link_track("other", str(tmp_path / "b" / "Other.mp3")) is None
+    store.close()
+
+
+def test_same_content_under_another_track_is_stored_once(tmp_path):
+    store = TrackStore(str(tmp_path / "store"))
+    for name in ("one", "two"):
+        (tmp_path / f"{name}.mp3").write_bytes(b"same recording")
+        store.add(name, str(tmp_path / f"{name}.mp3"))
+    assert os.path.samefile(tmp_path / "one.mp3", tmp_path / "two.mp3")
+    assert store.savings() == (2, 1, len(b"same recording"))
+    store.close()
+
+
+def test_objects_removed_by_hand_are_forgotten(tmp_path):
+    store = TrackStore(str(tmp_path / "store"))
+    (tmp_path / "track.mp3").write_bytes(b"audio")
+    store.add("track", str(tmp_path / "track.mp3"))
+    for root, _, files in os.walk(store.objects_dir):
+        for name in files:
+            os.remove(os.path.join(root, name))
+    assert not store.has_track("track")
+    assert store.link_track("track", str(tmp_path / "again.mp3")) is None
+    store.close()
+
+
+def test_tracks_shared_by_playlists_are_downloaded_once(tmp_path, make_engine):
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 4)
+    store = str(tmp_path / "store")
+    for folder in ("a", "b"):
+        (tmp_path / folder).mkdir()
+    first = make_engine(track_store_path=store).download(str(export), str(tmp_path / "a"))
+    assert first.downloaded == 4
+    assert first.linked == 0
+    second = make_engine(track_store_path=store).download(str(export), str(tmp_path / "b"))
+    assert second.downloaded == 4
+    assert second.linked == 4
+    for name in os.listdir(tmp_path / "a"):
+        if name.endswith(".mp3"):
+            assert os.path.samefile(tmp_path / "a" / name, tmp_path / "b" / name)
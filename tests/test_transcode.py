@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+import engine as engine_module
+from art_cache import JPEG_MAGIC
+from make_tierlist import write_tierlist
+from transcode import build_remux_command, build_transcode_command, native_container
+
+
+@pytest.mark.parametrize("codec, container", [
+    ("opus", (".opus", "ogg")), ("aac", (".m4a", "mp4")), ("mp3", (".mp3", "mp3")), ("pcm_s16le", None),
+])
+def test_native_container(codec, container):
+    assert native_container(codec) == container
+
+
+def test_remux_copies_the_audio_with_the_container_options():
+    metadata = {'title': "Track", 'artist': "Artist", 'comment': None}
+    cmd = build_remux_command("ffmpeg", "in.source.m4a", "out.m4a", "mp4", metadata)
+    assert cmd[cmd.index("-c:a") + 1] == "copy"
+    assert cmd[cmd.index("-movflags") + 1] == "+faststart"
+    assert cmd[-3:] == ["-f", "mp4", "out.m4a"]
+    assert "title=Track" in cmd and "artist=Artist" in cmd
+    assert not any(arg.startswith("comment=") for arg in cmd)
+    assert "-id3v2_version" in build_remux_command("ffmpeg", "in", "out.mp3", "mp3", metadata)
+    assert "libmp3lame" in build_transcode_command("ffmpeg", "in", "out.mp3", metadata)
+
+
+def test_jpeg_covers_are_embedded_without_reencoding(tmp_path):
+    jpeg, webp = tmp_path / "cover.jpg", tmp_path / "thumb.webp"
+    jpeg.write_bytes(JPEG_MAGIC + b"rest")
+    webp.write_bytes(b"RIFF\0\0\0\0WEBP")
+    for thumbnail, codec in ((jpeg, "copy"), (webp, "mjpeg")):
+        cmd = build_remux_command("ffmpeg", "in", "out.m4a", "mp4", {}, str(thumbnail))
+        assert cmd[cmd.index("-c:v") + 1] == codec
+        assert cmd[cmd.index("-disposition:v") + 1] == "attached_pic"
+
+
+def test_native_format_keeps_the_fetched_codec(tmp_path, make_engine, monkeypatch):
+    export = tmp_path / "export.json"
+    write_tierlist(str(export), 3)
+    (tmp_path / "out").mkdir()
+    engine = make_engine(output_format="native")
+    remuxed, encoded = [], []
+    remux, transcode = engine_module.remux, engine_module.transcode
+    monkeypatch.setattr(engine_module, "remux", lambda ffmpeg, source, output, muxer, *args: (
+        remuxed.append(muxer), remux(ffmpeg, source, output, muxer, *args))[1])
+    monkeypatch.setattr(engine_module, "transcode", lambda *args: (encoded.append(args), transcode(*args))[1])
+    stats = engine.download(str(export), str(tmp_path / "out"))
+    assert stats.downloaded == 3
+    assert remuxed == ["ogg"] * 3  # The fake backend fetches opus in .webm
+    assert encoded == []
+    assert sorted(os.path.splitext(name)[1] for name in os.listdir(tmp_path / "out")
+                  if not name.endswith(".jsonl")) == [".opus"] * 3
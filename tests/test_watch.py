@@ -0,0 +1,114 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from make_tierlist import write_tierlist
+from watch import ExportWatcher, InotifyWatcher
+
+
+class WatchedFolder:
+    """An ExportWatcher over `tmp_path/exports` on its own thread, with the syncs it ran."""
+
+    def __init__(self, tmp_path, make_engine, **kwargs):
+        self.exports = tmp_path / "exports"
+        self.exports.mkdir()
+        self.out = tmp_path / "out"
+        self.out.mkdir()
+        self.watching = threading.Event()
+        self.engine = make_engine(log=self._log)
+        self.synced = []
+        self.watcher = ExportWatcher(self.engine, str(self.exports), str(self.out), force_polling=True,
+                                     on_synced=lambda filepath, stats: self.synced.append(
+                                         (os.path.basename(filepath), stats.downloaded)), **kwargs)
+        self._thread = threading.Thread(target=self.watcher.run, daemon=True)
+
+    def _log(self, message):
+        if message.startswith("Watching "):
+            self.watching.set()
+
+    def start(self):
+        self._thread.start()
+        assert self.watching.wait(10)
+        return self
+
+    def wait_for(self, syncs, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while len(self.synced) < syncs and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.synced
+
+    def stop(self):
+        self.engine.stop()
+        self._thread.join(10)
+        assert not self._thread.is_alive()
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux-only")
+def test_file_reopened_for_writing_in_the_same_batch_is_still_being_written(tmp_path):
+    watcher = InotifyWatcher(str(tmp_path))
+    try:
+        with open(tmp_path / "done.json", "w") as f:
+            f.write("{}")
+        with open(tmp_path / "writing.json", "w") as f:
+            f.write("{")
+        writer = open(tmp_path / "writing.json", "a")  # Reopened: close-write, then modify
+        writer.write("}")
+        writer.flush()
+        names, writing, rescan = watcher.wait(1.0)
+        writer.close()
+    finally:
+        watcher.close()
+    assert names == {"done.json"}
+    assert writing == {"writing.json"}
+    assert not rescan
+
+
+def test_watcher_syncs_exports_that_are_there_and_those_that_change(tmp_path, make_engine):
+    folder = WatchedFolder(tmp_path, make_engine, debounce=0.05, poll_interval=0.05)
+    write_tierlist(str(folder.exports / "a.json"), 3)
+    (folder.exports / "notes.txt").write_text("not an export")
+    folder.start()
+    try:
+        assert folder.wait_for(1) == [("a.json", 3)]
+        write_tierlist(str(folder.exports / "b.json"), 2)
+        assert folder.wait_for(2) == [("a.json", 3), ("b.json", 2)]
+        write_tierlist(str(folder.exports / "a.json"), 5)
+        assert folder.wait_for(3)[2] == ("a.json", 2)
+    finally:
+        folder.stop()
+    assert sorted(os.listdir(folder.out)) == ["a", "b"]
+
+
+def test_rewrite_with_the_same_contents_is_not_synced(tmp_path, make_engine):
+    folder = WatchedFolder(tmp_path, make_engine, debounce=0.05, poll_interval=0.05)
+    export = folder.exports / "a.json"
+    write_tierlist(str(export), 3)
+    folder.start()
+    try:
+        folder.wait_for(1)
+        write_tierlist(str(export), 3)
+        os.utime(export, ns=(time.time_ns(), time.time_ns() + 10**9))  # Seen as changed, whatever the mtime resolution
+        time.sleep(0.5)
+        assert folder.watcher.syncs == 1
+    finally:
+        folder.stop()
+
+
+def test_export_is_synced_once_it_stops_changing(tmp_path, make_engine):
+    folder = WatchedFolder(tmp_path, make_engine, debounce=0.6, poll_interval=0.05)
+    export = folder.exports / "a.json"
+    write_tierlist(str(export), 1)
+    folder.start()
+    try:
+        assert folder.wait_for(1) == [("a.json", 1)]
+        for tracks in (2, 3, 4, 5):  # Saved in several steps, each well within the quiet period
+            write_tierlist(str(export), tracks)
+            time.sleep(0.15)
+        assert folder.wait_for(2) == [("a.json", 1), ("a.json", 4)]
+        time.sleep(0.8)
+        assert folder.watcher.syncs == 2
+    finally:
+        folder.stop()
@@ -0,0 +1,243 @@
+"""Incremental reader for Spotify tierlist exports.
+
+Exports can be hundreds of MB (every item embeds its album art URLs), so
+instead of `json.load`-ing the whole file the reader walks
+`state -> tier -> item` through a small buffer and decodes one item at a
+time. Memory use doesn't depend on the size of the export, and the first
+track is available as soon as its item has been read.
+"""
+import json
+from json.decoder import scanstring
+
+_WHITESPACE = ' \t\n\r'
+_SCALAR_END = _WHITESPACE + ',]}'
+_DECODER = json.JSONDecoder()
+
+
+class TierlistFormatError(ValueError):
+    """The file is valid JSON so far, but not shaped like a tierlist export."""
+
+
+class _Reader:
+    """Buffered cursor over a text file with just enough JSON parsing to walk an export."""
+
+    def __init__(self, fileobj, chunk_size):
+        self._file = fileobj
+        self._chunk_size = chunk_size
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._consumed = 0  # Characters dropped from the front of the buffer, for error positions
+
+    def _fill(self):
+        """Read another chunk, dropping what was already parsed. Returns False at end of file."""
+        if self._eof:
+            return False
+        chunk = self._file.read(max(self._chunk_size, len(self._buffer) - self._pos))
+        if not chunk:
+            self._eof = True
+            return False
+        self._consumed += self._pos
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _error(self, message):
+        return json.JSONDecodeError(message, self._buffer, self._pos)
+
+    def peek(self):
+        """Skip whitespace and return the next character without consuming it ('' at end of file)."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ''
+
+    def next(self):
+        char = self.peek()
+        if not char:
+            raise self._error("Unexpected end of file")
+        self._pos += 1
+        return char
+
+    def expect(self, char):
+        if self.next() != char:
+            self._pos -= 1
+            raise self._error(f"Expecting '{char}'")
+
+    def read_string(self):
+        self.expect('"')
+        while True:
+            try:
+                value, end = scanstring(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            self._pos = end
+            return value
+
+    def read_value(self):
+        """Decode the next complete JSON value."""
+        if self.peek() not in '"{[':
+            # A number cut at the end of the buffer still decodes ("1" of "1.5"), so read up to its delimiter first
+            length = 0
+            while True:
+                while self._pos + length < len(self._buffer) and self._buffer[self._pos + length] not in _SCALAR_END:
+                    length += 1
+                if self._pos + length < len(self._buffer) or not self._fill():
+                    break
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            self._pos = end
+            return value
+
+    def skip_value(self):
+        """Step over the next JSON value without building it."""
+        char = self.peek()
+        if char == '"':
+            self.read_string()
+            return
+        if char not in '{[':
+            self.read_value()
+            return
+        depth = 0
+        while True:
+            buffer, pos = self._buffer, self._pos
+            while pos < len(buffer):
+                char = buffer[pos]
+                if char == '"':
+                    self._pos = pos
+                    self.read_string()
+                    buffer, pos = self._buffer, self._pos
+                    continue
+                pos += 1
+                if char in '{[':
+                    depth += 1
+                elif char in '}]':
+                    depth -= 1
+                    if depth == 0:
+                        self._pos = pos
+                        return
+            self._pos = pos
+            if not self._fill():
+                raise self._error("Unexpected end of file")
+
+    def separator(self, closing):
+        """Consume ',' (returns True) or the closing bracket (returns False)."""
+        char = self.next()
+        if char == ',':
+            return True
+        if char == closing:
+            return False
+        self._pos -= 1
+        raise self._error(f"Expecting ',' or '{closing}'")
+
+
+def iter_tierlist_items(fileobj, chunk_size=1 << 16):
+    """Yield (tier name, item) for every item in the `state` of an export, in file order.
+
+    Raises json.JSONDecodeError for malformed JSON and TierlistFormatError if
+    the file has no `state` object (which may only be known at the end).
+    """
+    reader = _Reader(fileobj, chunk_size)
+    if reader.peek() != '{':
+        raise TierlistFormatError("The JSON file doesn't have the expected 'state' structure.")
+    reader.expect('{')
+    found_state = False
+    if reader.peek() == '}':
+        reader.expect('}')
+    else:
+        while True:
+            key = reader.read_string()
+            reader.expect(':')
+            if key == 'state' and reader.peek() == '{':
+                found_state = True
+                yield from _iter_tiers(reader)
+            else:
+                reader.skip_value()
+            if not reader.separator('}'):
+                break
+    if not found_state:
+        raise TierlistFormatError("The JSON file doesn't have the expected 'state' structure.")
+
+
+def _iter_tiers(reader):
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.expect('}')
+        return
+    while True:
+        tier_name = reader.read_string()
+        reader.expect(':')
+        if reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    yield tier_name, reader.read_value()
+                    if not reader.separator(']'):
+                        break
+        else:
+            reader.skip_value()
+        if not reader.separator('}'):
+            return
+
+
+def track_fields(item):
+    """Return (track_id, track_name, artist_names) for a valid track item, otherwise None."""
+    if not isinstance(item, dict):
+        return None
+    content = item.get('content', {})
+    if not isinstance(content, dict):
+        return None
+    track_id = item.get('id')
+    track_name = content.get('name')
+    if not track_id or not track_name or not isinstance(track_name, str):
+        return None
+    artists = content.get('artists', [])
+    artist_names = [artist['name'].strip() for artist in artists if isinstance(artist, dict)
+                    and isinstance(artist.get('name'), str) and artist['name'].strip()] if isinstance(artists, list) else []
+    return track_id, track_name, artist_names
+
+
+def track_duration(item):
+    """The track's duration in seconds from its `content.duration_ms`, or None if the export doesn't have it."""
+    content = item.get('content') if isinstance(item, dict) else None
+    duration_ms = content.get('duration_ms') if isinstance(content, dict) else None
+    if isinstance(duration_ms, (int, float)) and not isinstance(duration_ms, bool) and duration_ms > 0:
+        return duration_ms / 1000
+    return None
+
+
+def album_cover_url(item):
+    """URL of the largest album cover in the item's `content.album.images`, or None if it has none."""
+    content = item.get('content') if isinstance(item, dict) else None
+    album = content.get('album') if isinstance(content, dict) else None
+    images = album.get('images') if isinstance(album, dict) else None
+    if not isinstance(images, list):
+        return None
+    best_url, best_width = None, -1
+    for image in images:
+        if isinstance(image, dict) and isinstance(image.get('url'), str) and image['url'].startswith(('https://', 'http://')):
+            width = image.get('width') if isinstance(image.get('width'), int) else 0
+            if width > best_width:
+                best_url, best_width = image['url'], width
+    return best_url
+
+
+def tierlist_tracks(filepath):
+    """Yield (track_id, track_name, artist_names) for every valid track of an export file."""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for _, item in iter_tierlist_items(f):
+            fields = track_fields(item)
+            if fields is not None:
+                yield fields
@@ -0,0 +1,164 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+DEFAULT_TRACK_STORE = os.path.expanduser("~/SpotifyDownloader/store")
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_file(source, dest):
+    """Make `dest` a hardlink to `source`, else a symlink, else a copy. Returns "hardlink", "symlink" or "copy".
+
+    The link is created under a temporary name and renamed over `dest`, so
+    an existing file at `dest` is replaced in one step.
+    """
+    tmp_path = dest + '.linking'
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(source, tmp_path)
+        method = "hardlink"
+    except OSError:
+        # Different volume, FAT/exFAT, or a filesystem without hardlinks
+        try:
+            os.symlink(source, tmp_path)
+            method = "symlink"
+        except (OSError, NotImplementedError):
+            # Windows without the symlink privilege
+            shutil.copy2(source, tmp_path)
+            method = "copy"
+    os.replace(tmp_path, dest)
+    return method
+
+
+class TrackStore:
+    """Content-addressed store of finished tracks, shared by all playlist folders.
+
+    Files live under `objects/<first two hex digits>/<sha256>.<ext>`, so two
+    tracks that encode to the same bytes are stored once. An SQLite index maps
+    Spotify track IDs to stored files and remembers every playlist file linked
+    to them, for the savings report. Playlist folders hold hardlinks (or
+    symlinks, or copies where neither works) to the stored files.
+    """
+
+    def __init__(self, root=DEFAULT_TRACK_STORE):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, "index.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS objects (
+                sha256 TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                added_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS tracks (
+                track_id TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS links (
+                path TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                method TEXT NOT NULL,
+                linked_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_links_sha256 ON links (sha256);
+        """)
+        self._conn.commit()
+
+    def _object_for_track(self, track_id):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT o.sha256, o.path FROM tracks t JOIN objects o ON o.sha256 = t.sha256 WHERE t.track_id = ?",
+                (track_id,)).fetchone()
+
+    def has_track(self, track_id):
+        row = self._object_for_track(track_id)
+        return row is not None and os.path.exists(row[1])
+
+    def _record_link(self, dest, sha256, method):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO links VALUES (?, ?, ?, ?)",
+                               (os.path.abspath(dest), sha256, method, time.time()))
+            self._conn.commit()
+
+    def link_track(self, track_id, dest):
+        """Put the stored file of a track at `dest`; returns (link method, path) or None if the track isn't stored.
+
+        The extension of `dest` is replaced by the stored file's, which may be
+        a different format (see transcode.OUTPUT_FORMATS).
+        """
+        row = self._object_for_track(track_id)
+        if row is None:
+            return None
+        sha256, object_path = row
+        if not os.path.exists(object_path):
+            # Removed from the store by hand; forget it so the track gets downloaded again
+            with self._lock:
+                self._conn.execute("DELETE FROM tracks WHERE sha256 = ?", (sha256,))
+                self._conn.execute("DELETE FROM objects WHERE sha256 = ?", (sha256,))
+                self._conn.commit()
+            return None
+        dest = os.path.splitext(dest)[0] + os.path.splitext(object_path)[1]
+        method = link_file(object_path, dest)
+        self._record_link(dest, sha256, method)
+        return method, dest
+
+    def add(self, track_id, path):
+        """Move a finished file into the store and replace it with a link. Returns the link method.
+
+        If a file with the same content is already stored (e.g. the same
+        recording under another track ID), the new copy is dropped and
+        linked to the stored one instead.
+        """
+        sha256 = file_sha256(path)
+        object_path = os.path.join(self.objects_dir, sha256[:2], sha256 + os.path.splitext(path)[1])
+        with self._lock:
+            row = self._conn.execute("SELECT path FROM objects WHERE sha256 = ?", (sha256,)).fetchone()
+        if row is None or not os.path.exists(row[0]):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            tmp_path = object_path + '.adding'
+            # Copy rather than move, so the playlist file is never missing if linking fails below
+            shutil.copy2(path, tmp_path)
+            os.replace(tmp_path, object_path)
+            with self._lock:
+                self._conn.execute("INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?)",
+                                   (sha256, object_path, os.path.getsize(object_path), time.time()))
+                self._conn.commit()
+        else:
+            object_path = row[0]
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO tracks VALUES (?, ?)", (track_id, sha256))
+            self._conn.commit()
+        method = link_file(object_path, path)
+        self._record_link(path, sha256, method)
+        return method
+
+    def savings(self):
+        """Return (playlist files, stored files, bytes saved by linking instead of keeping separate copies)."""
+        with self._lock:
+            links, linked_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(o.size), 0) FROM links l JOIN objects o ON o.sha256 = l.sha256 "
+                "WHERE l.method != 'copy'").fetchone()
+            objects, stored_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects WHERE sha256 IN "
+                "(SELECT sha256 FROM links WHERE method != 'copy')").fetchone()
+        return links, objects, max(0, linked_bytes - stored_bytes)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
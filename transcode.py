@@ -0,0 +1,174 @@
+import base64
+import os
+import subprocess
+
+from art_cache import JPEG_MAGIC, to_jpeg
+from utils import hidden_startupinfo
+
+OUTPUT_FORMATS = ("mp3", "native")
+
+# Source codec -> (file extension, ffmpeg muxer) for keeping the audio as it is
+NATIVE_CONTAINERS = {
+    'opus': ('.opus', 'ogg'),
+    'vorbis': ('.ogg', 'ogg'),
+    'aac': ('.m4a', 'mp4'),
+    'alac': ('.m4a', 'mp4'),
+    'mp3': ('.mp3', 'mp3'),
+    'flac': ('.flac', 'flac'),
+}
+
+# Every extension a finished track can have
+AUDIO_EXTENSIONS = tuple(sorted({ext for ext, _ in NATIVE_CONTAINERS.values()} | {'.wav'}))
+
+
+def mutagen_available():
+    """True if the optional mutagen package is installed (needed for cover art in .opus/.ogg files)."""
+    try:
+        import mutagen # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def native_container(codec):
+    """Return (extension, muxer) to store audio of `codec` without re-encoding, or None if unsupported."""
+    return NATIVE_CONTAINERS.get(codec)
+
+
+def build_transcode_command(ffmpeg_path, source, output, metadata, thumbnail=None):
+    """ffmpeg command equivalent to yt-dlp's `-x --audio-format mp3 --audio-quality 0 --embed-metadata --embed-thumbnail`."""
+    cmd = [ffmpeg_path, "-y", "-v", "error", "-nostdin", "-i", source]
+    if thumbnail:
+        cmd += ["-i", thumbnail]
+    cmd += ["-map", "0:a:0"]
+    if thumbnail:
+        cmd += _cover_art_args(thumbnail)
+    cmd += ["-c:a", "libmp3lame", "-q:a", "0",  # Best VBR quality, like --audio-quality 0
+            "-id3v2_version", "3"]
+    cmd += _metadata_args(metadata)
+    cmd += ["-f", "mp3", output]
+    return cmd
+
+
+def build_remux_command(ffmpeg_path, source, output, muxer, metadata, thumbnail=None):
+    """ffmpeg command that copies the audio stream into `muxer`'s container and adds tags (and cover art)."""
+    cmd = [ffmpeg_path, "-y", "-v", "error", "-nostdin", "-i", source]
+    if thumbnail:
+        cmd += ["-i", thumbnail]
+    cmd += ["-map", "0:a:0"]
+    if thumbnail:
+        cmd += _cover_art_args(thumbnail)
+    cmd += ["-c:a", "copy"]
+    if muxer == "mp3":
+        cmd += ["-id3v2_version", "3"]
+    elif muxer == "mp4":
+        cmd += ["-movflags", "+faststart"]
+    cmd += _metadata_args(metadata)
+    cmd += ["-f", muxer, output]
+    return cmd
+
+
+def is_jpeg(path):
+    with open(path, 'rb') as f:
+        return f.read(3) == JPEG_MAGIC
+
+
+def _cover_art_args(thumbnail):
+    # Cover art has to be JPEG or PNG; YouTube thumbnails are often WebP. JPEGs (e.g. from the art cache)
+    # are embedded as they are instead of being decoded and encoded again for every track
+    try:
+        codec = "copy" if is_jpeg(thumbnail) else "mjpeg"
+    except OSError:
+        codec = "mjpeg"  # Let ffmpeg report it
+    return ["-map", "1:0",
+            "-c:v", codec,
+            "-disposition:v", "attached_pic",
+            "-metadata:s:v", "title=Album cover",
+            "-metadata:s:v", "comment=Cover (front)"]
+
+
+def _metadata_args(metadata):
+    args = []
+    for key, value in metadata.items():
+        if value:
+            args += ["-metadata", f"{key}={value}"]
+    return args
+
+
+def _run(cmd):
+    return subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace',
+                          stdin=subprocess.DEVNULL, startupinfo=hidden_startupinfo())
+
+
+def _encode(build, output, thumbnail, finish=None):
+    """Run `build(tmp_output, thumbnail)` and move the result to `output`; returns (success, error output).
+
+    The result is written next to `output` first and renamed into place, so
+    an interrupted encode never leaves a truncated file under the final name.
+    `finish(tmp_output)`, if given, can still change the file before it is
+    moved into place; an exception from it is reported but not fatal.
+    """
+    tmp_output = output + ".encoding"
+    result = _run(build(tmp_output, thumbnail))
+    if result.returncode != 0 and thumbnail:
+        # A broken thumbnail shouldn't cost us the track; retry without cover art
+        result = _run(build(tmp_output, None))
+    if result.returncode != 0:
+        try:
+            os.remove(tmp_output)
+        except OSError:
+            pass
+        return False, result.stderr[-4000:]
+    stderr = result.stderr
+    if finish is not None:
+        try:
+            finish(tmp_output)
+        except Exception as e:
+            stderr += f"\n{e}"
+    os.replace(tmp_output, output)
+    return True, stderr
+
+
+def transcode(ffmpeg_path, source, output, metadata, thumbnail=None):
+    """Encode `source` into the mp3 `output` with metadata and cover art; returns (success, error output)."""
+    return _encode(lambda tmp_output, thumb: build_transcode_command(ffmpeg_path, source, tmp_output, metadata, thumb),
+                   output, thumbnail)
+
+
+def remux(ffmpeg_path, source, output, muxer, metadata, thumbnail=None):
+    """Copy the audio of `source` into `output` without re-encoding; returns (success, error output).
+
+    The Ogg muxer can't take a cover picture as a video stream, so for
+    .opus/.ogg files the cover is added with mutagen instead, when installed.
+    """
+    finish = None
+    if muxer == "ogg":
+        if thumbnail and mutagen_available():
+            finish = lambda path: embed_ogg_cover(ffmpeg_path, path, thumbnail) # noqa: E731
+        thumbnail = None
+    return _encode(lambda tmp_output, thumb: build_remux_command(ffmpeg_path, source, tmp_output, muxer, metadata, thumb),
+                   output, thumbnail, finish)
+
+
+def embed_ogg_cover(ffmpeg_path, path, thumbnail):
+    """Add `thumbnail` as the front cover of an Ogg Opus/Vorbis file (METADATA_BLOCK_PICTURE)."""
+    from mutagen import File as MutagenFile
+    from mutagen.flac import Picture
+
+    with open(thumbnail, 'rb') as f:
+        data = f.read()
+    if not data.startswith(JPEG_MAGIC):
+        # Convert to JPEG first, since players don't agree on WebP covers
+        data, error = to_jpeg(ffmpeg_path, data)
+        if data is None:
+            raise RuntimeError("Could not embed the cover art: " + (error or "thumbnail conversion failed"))
+    picture = Picture()
+    picture.type = 3  # Cover (front)
+    picture.mime = "image/jpeg"
+    picture.desc = "Album cover"
+    picture.data = data
+    audio = MutagenFile(path)  # Detected from the content; the name may not end in .opus yet
+    if audio is None:
+        raise RuntimeError("Could not embed the cover art: unrecognised Ogg file")
+    audio["metadata_block_picture"] = [base64.b64encode(picture.write()).decode("ascii")]
+    audio.save()
@@ -0,0 +1,24 @@
+import re
+import subprocess
+import sys
+
+
+def sanitize_filename(filename):
+    """Removes invalid characters for Windows filenames."""
+    # Define characters that are invalid in Windows filenames
+    invalid_chars = r'[<>:"/\|?*\n\r\t]' # Added common newline/tab chars as well
+    # Replace invalid characters with an underscore
+    sanitized_filename = re.sub(invalid_chars, '_', filename)
+    # Windows doesn't allow filenames to end with a dot or space
+    sanitized_filename = sanitized_filename.rstrip(' .')
+    return sanitized_filename
+
+
+def hidden_startupinfo():
+    """STARTUPINFO that keeps console windows from popping up on Windows (None elsewhere)."""
+    if sys.platform != "win32":
+        return None
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    startupinfo.wShowWindow = subprocess.SW_HIDE
+    return startupinfo
@@ -0,0 +1,242 @@
+"""Watch a folder for tierlist exports and sync every new or changed one, for unattended long-running use."""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from track_store import file_sha256
+
+EXPORT_EXTENSION = ".json"
+# With inotify, a file that was written to but not closed yet is only synced after this long without changes
+OPEN_WRITER_TIMEOUT = 60.0
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len; the name follows, padded with NULs
+_READ_SIZE = 64 * 1024
+
+
+def is_export(name):
+    return name.endswith(EXPORT_EXTENSION) and not name.startswith(".")
+
+
+class InotifyWatcher:
+    """Changed file names in a folder, from Linux inotify (through ctypes, no extra package needed)."""
+
+    name = "inotify"
+
+    def __init__(self, directory):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # A writer is done at IN_CLOSE_WRITE or IN_MOVED_TO; IN_MODIFY and IN_CREATE mean it's still writing
+        mask = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+                | IN_DELETE_SELF | IN_MOVE_SELF)
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout):
+        """Return (names of changed files, names of files still open for writing, rescan needed)
+        after at most `timeout` seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set(), set(), False
+        try:
+            data = os.read(self.fd, _READ_SIZE)
+        except BlockingIOError:
+            return set(), set(), False
+        names, writing, rescan = set(), set(), False
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                rescan = True  # The kernel dropped events; compare the whole folder instead
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                raise OSError("the watched folder was removed or moved")
+            elif name:
+                name = os.fsdecode(name)
+                # The name's last event in the batch decides whether its writer is done
+                if mask & (IN_MODIFY | IN_CREATE):
+                    writing.add(name)
+                    names.discard(name)
+                else:
+                    names.add(name)
+                    writing.discard(name)
+        return names, writing, rescan
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Changed file names in a folder, from comparing the size and mtime of its exports every `interval` seconds.
+
+    One scandir per interval, and one remembered (size, mtime) per export.
+    """
+
+    name = "polling"
+
+    def __init__(self, directory, interval=5.0, stop_event=None):
+        self.directory = directory
+        self.interval = interval
+        self.stop_event = stop_event
+        self._seen = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self):
+        seen = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if is_export(entry.name):
+                    try:
+                        stat_result = entry.stat()
+                    except OSError:
+                        continue
+                    seen[entry.name] = (stat_result.st_size, stat_result.st_mtime_ns)
+        return seen
+
+    def wait(self, timeout):
+        timeout = max(0.0, min(timeout, self._next_scan - time.monotonic()))
+        if self.stop_event is not None:
+            self.stop_event.wait(timeout)
+        else:
+            time.sleep(timeout)
+        if time.monotonic() < self._next_scan:
+            return set(), set(), False
+        self._next_scan = time.monotonic() + self.interval
+        seen = self._scan()
+        changed = {name for name, signature in seen.items() if self._seen.get(name) != signature}
+        changed.update(name for name in self._seen if name not in seen)
+        self._seen = seen
+        return changed, set(), False
+
+    def close(self):
+        pass
+
+
+def create_watcher(directory, poll_interval=5.0, stop_event=None, force_polling=False):
+    """Use inotify where available, else poll."""
+    if not force_polling:
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError):
+            pass  # Not Linux, inotify limits reached, or a libc without inotify
+    return PollingWatcher(directory, poll_interval, stop_event)
+
+
+class ExportWatcher:
+    """Syncs every export in `directory` into `<out_dir>/<export name>`, then again whenever it changes.
+
+    A changed file is synced once it has been left alone for `debounce`
+    seconds (with inotify: after its writer closed it), so an export that is
+    still being written (or saved in several steps) is only read once it's
+    complete. Rewrites that don't change the
+    contents are recognised by their SHA-256 and skipped. The syncs run one
+    after the other on the watching thread, each through the engine's
+    pipeline, so a playlist can never be synced twice at the same time;
+    changes that arrive meanwhile are picked up when the running sync is
+    done. Memory stays flat however long it runs: the watcher only keeps a
+    hash and a deadline per export in the folder, and every sync releases
+    its per-run state.
+
+    `on_synced(filepath, stats)` is called after every sync. Runs until the
+    engine is stopped.
+    """
+
+    def __init__(self, engine, directory, out_dir=None, removed_action="keep", debounce=2.0, poll_interval=5.0,
+                 force_polling=False, on_synced=None):
+        self.engine = engine
+        self.directory = directory
+        self.out_dir = out_dir
+        self.removed_action = removed_action
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.force_polling = force_polling
+        self.on_synced = on_synced
+        self._due = {}  # Export name -> time.monotonic() at which it has been quiet for `debounce` seconds
+        self._synced = {}  # Export name -> SHA-256 of the version last synced
+        self.syncs = 0
+
+    def run(self):
+        engine = self.engine
+        watcher = create_watcher(self.directory, self.poll_interval, engine.stop_event, self.force_polling)
+        engine.log(f"Watching {self.directory} for tierlist exports ({watcher.name}).\n")
+        # Polling only sees a file again at the next scan, so it has to have stayed the same for one
+        quiet = self.debounce if watcher.name == "inotify" else max(self.debounce, self.poll_interval)
+        try:
+            self._schedule(self._exports(), time.monotonic())  # Whatever is there already
+            while not engine.stop_event.is_set():
+                now = time.monotonic()
+                timeout = min([due - now for due in self._due.values()] + [1.0])
+                names, writing, rescan = watcher.wait(max(0.0, timeout))
+                if rescan:
+                    names = set(self._exports()) | set(self._synced)
+                now = time.monotonic()
+                self._schedule({name for name in names if is_export(name)}, now + quiet)
+                # Last, so a file still open for writing keeps the longer wait even if a rescan listed it
+                self._schedule({name for name in writing if is_export(name)}, now + max(quiet, OPEN_WRITER_TIMEOUT))
+                now = time.monotonic()
+                for name in sorted(name for name, due in self._due.items() if due <= now):
+                    if engine.stop_event.is_set():
+                        break
+                    del self._due[name]
+                    self._sync(name)
+        finally:
+            watcher.close()
+        engine.log(f"Stopped watching {self.directory} after {self.syncs} syncs.\n")
+
+    def _exports(self):
+        with os.scandir(self.directory) as entries:
+            return [entry.name for entry in entries if is_export(entry.name) and entry.is_file()]
+
+    def _schedule(self, names, due):
+        for name in names:
+            self._due[name] = due  # Another change restarts the quiet period
+
+    def _sync(self, name):
+        engine = self.engine
+        filepath = os.path.join(self.directory, name)
+        try:
+            export_sha256 = file_sha256(filepath)
+        except FileNotFoundError:
+            self._synced.pop(name, None)  # Deleted or renamed; its playlist folder stays as it is
+            return
+        except OSError as e:
+            engine.log(f"Can't read {filepath}: {e}\n")
+            return
+        if self._synced.get(name) == export_sha256:
+            return  # Rewritten with the same contents
+        try:
+            download_dir = engine.default_download_dir(filepath, self.out_dir)
+        except OSError as e:
+            engine.log(f"Can't create the folder for {filepath}: {e}\n")
+            return
+        engine.log(f"Syncing {filepath} into {download_dir}\n")
+        stats = engine.sync(filepath, download_dir, self.removed_action)
+        self.syncs += 1
+        if not stats.error and not engine.stop_event.is_set():
+            # A failed sync (e.g. of an export that was still incomplete) is retried on the next change
+            self._synced[name] = export_sha256
+        if self.on_synced is not None:
+            self.on_synced(filepath, stats)